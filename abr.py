@@ -0,0 +1,450 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Closed-loop adaptive bitrate controller. Watches encoder progress and host load,
+and moves each camera's bitrate and framerate between the bounds in its 'abr'
+settings, applying changes through write_yml's hot-reload path. Pressure is shed
+one camera at a time, biggest contributor first; hysteresis and a per-camera
+cooldown keep streams from restarting constantly.
+
+Usage: python3 abr.py --simulate [--steps 120]   # Run against a simulated host
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from devices import parse_resolution
+from pipelines import format_bitrate, parse_bitrate
+from scheduler import DEFAULT_RESOLUTION, available_cpus, estimate_cost
+
+ABR_INTERVAL = 10.0  # Seconds between controller steps
+ABR_LOG = 'abr.log'  # Decisions, one JSON object per line
+HIGH_LOAD = 0.9  # Load average per CPU above which encoders are throttled
+LOW_LOAD = 0.6  # ...and below which they may step back up
+LOW_SPEED = 0.97  # Encoder speed below realtime means it can't keep up
+HIGH_UPLINK = 0.9  # Fraction of 'uplink' above which bitrates are cut
+LOW_UPLINK = 0.7
+DOWN_AFTER = 2  # Consecutive tight steps before stepping down
+UP_AFTER = 6  # Consecutive relaxed steps before stepping up (slower than down)
+COOLDOWN = 60.0  # Minimum seconds between changes to one camera (each change restarts its encoder)
+DOWN_FACTOR = 0.75
+UP_FACTOR = 1.15
+MIN_CHANGE = 0.1  # Relative changes smaller than this aren't worth a restart
+HOST = '*host'  # Streak key for host-wide pressure
+
+def validate_abr(i: int, cam: dict) -> dict:
+    """
+    Validate a camera's 'abr' settings.
+
+    A camera opts in with "abr": {"min_bitrate": "300k", "max_bitrate": "2M",
+    "min_framerate": 10}; its configured framerate is the upper framerate bound.
+
+    Args:
+        i: Camera index.
+        cam: Camera dictionary as written in JSONC.
+
+    Returns:
+        None without 'abr', else {'min_bitrate', 'max_bitrate' (bits/s),
+        'min_framerate', 'max_framerate'}.
+
+    Raises:
+        ValueError: If bounds are missing or inconsistent.
+    """
+    settings = cam.get('abr')
+    if not settings:
+        return None
+    if not isinstance(settings, dict):
+        raise ValueError(f"abr for cam{i} must be an object with min_bitrate and max_bitrate.")
+    low = parse_bitrate(settings.get('min_bitrate', cam.get('bitrate', '800k')))
+    high = parse_bitrate(settings.get('max_bitrate', cam.get('bitrate', '800k')))
+    max_rate = int(cam.get('framerate', 30))
+    min_rate = settings.get('min_framerate', max_rate)
+    if not low <= high:
+        raise ValueError(f"abr min_bitrate for cam{i} must not exceed max_bitrate.")
+    if not str(min_rate).isdigit() or not 0 < int(min_rate) <= max_rate:
+        raise ValueError(f"abr min_framerate for cam{i} must be a number no higher than the camera's {max_rate}.")
+    return {'min_bitrate': low, 'max_bitrate': high, 'min_framerate': int(min_rate), 'max_framerate': max_rate}
+
+def abr_bounds(cams: list) -> dict:
+    """
+    Validate the 'abr' settings of each camera (see validate_abr()).
+
+    Returns:
+        A dictionary of path name -> bounds for cameras with 'abr'.
+
+    Raises:
+        ValueError: If any camera's bounds are missing or inconsistent.
+    """
+    bounds = {f'cam{i}': validate_abr(i, cam) for i, cam in enumerate(cams)}
+    return {name: b for name, b in bounds.items() if b}
+
+def live_signals(collector, settings: dict) -> callable:
+    """
+    Return a signals() callable reading the metrics collector and the host load average.
+
+    Args:
+        collector: metrics.MetricsCollector with the encoders' progress.
+        settings: Top-level JSONC settings; 'uplink' enables uplink utilization.
+    """
+    uplink = parse_bitrate(settings['uplink']) if settings.get('uplink') else None
+    cpus = len(available_cpus())
+
+    def signals(cams: list) -> dict:
+        streams = collector.snapshot()
+        cams_signals = {name: {'speed': s.get('speed'), 'drops': s.get('drop_frames', 0), 'bitrate': s.get('bitrate')}
+                        for name, s in streams.items()}
+        util = None
+        if uplink:
+            util = sum(s['bitrate'] or 0 for s in cams_signals.values()) / uplink
+        return {'load': os.getloadavg()[0] / cpus, 'uplink_util': util, 'cams': cams_signals}
+    return signals
+
+class AbrController:
+    """
+    Adjusts per-camera bitrate/framerate targets from load signals.
+
+    CPU pressure lowers the framerate, since encode cost scales with it; uplink
+    pressure lowers the bitrate. Host-wide pressure is taken from one camera per step,
+    the biggest contributor first (highest estimated encode cost for load, highest
+    bitrate for the uplink), and the next cut waits for DOWN_AFTER fresh readings, so
+    streams aren't all degraded when cutting one would do. An encoder falling behind
+    (speed below realtime, dropped frames) while the host is not loaded is stepped
+    down on its own. Headroom raises the most reduced camera back toward its
+    configured values, one per step. A change needs DOWN_AFTER (or UP_AFTER)
+    consecutive steps in the same direction and at least COOLDOWN seconds since the
+    camera's last change.
+    """
+
+    def __init__(self, apply, signals=None, clock=time.monotonic, log_path: str = ABR_LOG):
+        """
+        Args:
+            apply: Callable taking the adjusted cams list (e.g. write_yml under a lock).
+            signals: Callable taking the current cams and returning {'load' (per CPU),
+                     'uplink_util' (or None), 'cams': {name: {'speed', 'drops', 'bitrate'}}}.
+            clock: Monotonic time source (simulations pass their own).
+            log_path: File decisions are appended to, or None.
+        """
+        self.apply = apply
+        self.signals = signals
+        self.clock = clock
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.cams, self.bounds, self.targets = [], {}, {}
+        self.streaks, self.last_change, self.last_drops = {}, {}, {}
+        self.decisions = collections.deque(maxlen=200)
+        self.generation = 0  # Bumped by configure(), so a step can tell its targets were replaced
+        self._thread = None
+
+    def configure(self, cams: list, signals=None) -> None:
+        """
+        Adopt a newly applied config; targets restart from the configured values.
+
+        Args:
+            cams: Camera dictionaries as written in JSONC (validated by abr_bounds()).
+            signals: Replacement signals() callable, e.g. for new uplink settings.
+        """
+        with self.lock:
+            self.cams = [dict(cam) for cam in cams]
+            self.bounds = abr_bounds(cams)
+            self.targets = {}
+            for name, b in self.bounds.items():
+                cam = self.cams[int(name[3:])]
+                bitrate = min(max(parse_bitrate(cam.get('bitrate', '800k')), b['min_bitrate']), b['max_bitrate'])
+                self.targets[name] = {'bitrate': bitrate, 'framerate': b['max_framerate']}
+            self.streaks, self.last_change, self.last_drops = {}, {}, {}
+            self.generation += 1
+            if signals:
+                self.signals = signals
+
+    def current_cams(self) -> list:
+        """Return the cams with current targets applied (renditions scale with the camera)."""
+        with self.lock:
+            return self._current_cams()
+
+    def _current_cams(self) -> list:
+        cams = []
+        for i, cam in enumerate(self.cams):
+            target = self.targets.get(f'cam{i}')
+            if not target:
+                cams.append(cam)
+                continue
+            adjusted = dict(cam, bitrate=format_bitrate(target['bitrate']), framerate=target['framerate'])
+            if cam.get('renditions'):
+                ratio = target['bitrate'] / parse_bitrate(cam.get('bitrate', '800k'))
+                adjusted['renditions'] = [
+                    dict(r, bitrate=format_bitrate(int(parse_bitrate(r.get('bitrate', cam.get('bitrate', '800k'))) * ratio)),
+                         **({'framerate': min(int(r['framerate']), target['framerate'])} if r.get('framerate') else {}))
+                    for r in cam['renditions']]
+            cams.append(adjusted)
+        return cams
+
+    def step(self) -> list:
+        """
+        Run one control step: read signals, update targets, apply if anything changed.
+
+        Returns:
+            The decisions made in this step (also kept in self.decisions and the log file).
+        """
+        with self.lock:
+            if not self.bounds:
+                return []
+            cams = self._current_cams()
+            signals = self.signals(cams)
+            previous = {name: dict(t) for name, t in self.targets.items()}
+            made = self._decide(cams, signals, self.clock())
+            if not made:
+                return []
+            cams = self._current_cams()
+            generation = self.generation
+        try:
+            self.apply(cams)
+        except Exception as e:  # e.g. the camera doesn't support the new framerate
+            with self.lock:
+                for decision in made:
+                    # A configure() since then has fresh targets, maybe for other cameras; keep them
+                    if self.generation == generation:
+                        self.targets[decision['cam']] = previous[decision['cam']]
+                    decision['action'] = f"rejected ({e})"
+        for decision in made:
+            self.record(decision)
+        return made
+
+    def _decide(self, cams: list, signals: dict, now: float) -> list:
+        load, util = signals['load'], signals.get('uplink_util')
+        lagging = {}  # name -> reasons a camera can't keep up
+        for name in self.bounds:
+            cam = signals['cams'].get(name, {})
+            drops = cam.get('drops') or 0
+            new_drops = max(0, drops - self.last_drops.get(name, drops))
+            self.last_drops[name] = drops
+            speed = cam.get('speed')
+            reasons = [r for r, on in ((f"speed {speed}x", speed is not None and speed < LOW_SPEED),
+                                       (f"{new_drops} dropped frames", new_drops > 0)) if on]
+            if reasons:
+                lagging[name] = reasons
+        cpu_tight = load > HIGH_LOAD
+        net_tight = util is not None and util > HIGH_UPLINK
+        relaxed = load < LOW_LOAD and not lagging and (util is None or util < LOW_UPLINK)
+        state = 'down' if cpu_tight or net_tight else 'up' if relaxed else 'hold'
+        count = self._streak(HOST, state)
+        costs = {f'cam{i}': _cost(cam) for i, cam in enumerate(cams)}
+        bitrates = {f'cam{i}': signals['cams'].get(f'cam{i}', {}).get('bitrate') or parse_bitrate(cam.get('bitrate', '800k'))
+                    for i, cam in enumerate(cams)}
+        changes = {}  # name -> (new target, reasons); at most one camera per kind of pressure and step
+        if state == 'down' and count >= DOWN_AFTER:
+            if cpu_tight:  # The most expensive encoder gives up frames first
+                for name in sorted(self.bounds, key=lambda n: -costs[n]):
+                    new = self._lower_framerate(name, changes, now)
+                    if new:
+                        changes[name] = (new, [f"load {load:.2f}/CPU"] + lagging.get(name, []))
+                        break
+            if net_tight:  # The biggest stream gives up bitrate first
+                for name in sorted(self.bounds, key=lambda n: -bitrates[n]):
+                    new, reasons = changes.get(name, (None, []))
+                    new = self._lower_bitrate(name, new, now)
+                    if new:
+                        changes[name] = (new, reasons + [f"uplink {util:.0%}"])
+                        break
+            if changes:
+                self.streaks[HOST] = ('hold', 0)  # Re-measure before touching the others
+        elif state == 'up' and count >= UP_AFTER:  # The most reduced camera steps up first
+            reason = f"headroom: load {load:.2f}/CPU" + (f", uplink {util:.0%}" if util is not None else '')
+            for name in sorted(self.bounds, key=self._reduction):
+                new = self._raise(name, now)
+                if new:
+                    changes[name] = (new, [reason])
+                    break
+        for name in self.bounds:
+            # An encoder falling behind while the host has CPU to spare (e.g. its CPU set is
+            # too small) is stepped down on its own; under host load it's just a symptom
+            lag = self._streak(name, 'down' if name in lagging else 'hold')
+            if name in lagging and lag >= DOWN_AFTER and not cpu_tight:
+                new = self._lower_framerate(name, changes, now)
+                if new:
+                    changes[name] = (new, lagging[name])
+        made = []
+        for name, (new, reasons) in changes.items():
+            target = self.targets[name]
+            self.targets[name] = new
+            self.last_change[name] = now
+            self.streaks[name] = ('hold', 0)
+            made.append({'time': time.time(), 'cam': name, 'action': 'down' if state != 'up' else 'up',
+                         'reason': ', '.join(reasons),
+                         'from': {'bitrate': format_bitrate(target['bitrate']), 'framerate': target['framerate']},
+                         'to': {'bitrate': format_bitrate(new['bitrate']), 'framerate': new['framerate']}})
+        return made
+
+    def _streak(self, key: str, state: str) -> int:
+        """Count consecutive steps in state for a camera (or HOST) and return the count."""
+        count = self.streaks[key][1] + 1 if self.streaks.get(key, ('', 0))[0] == state else 1
+        self.streaks[key] = (state, count)
+        return count
+
+    def _ready(self, name: str, now: float) -> bool:
+        """Return True if name's last change is at least COOLDOWN ago."""
+        return now - self.last_change.get(name, float('-inf')) >= COOLDOWN
+
+    def _lower_framerate(self, name: str, changes: dict, now: float) -> dict:
+        """Return name's target with a lower framerate (a lower bitrate at the framerate floor), or None."""
+        if name in changes or not self._ready(name, now):
+            return None
+        target, b = self.targets[name], self.bounds[name]
+        new = dict(target, framerate=max(b['min_framerate'], int(target['framerate'] * DOWN_FACTOR)))
+        return _worth(target, new) or self._lower_bitrate(name, None, now)
+
+    def _lower_bitrate(self, name: str, new: dict, now: float) -> dict:
+        """Return new (or name's target) with a lower bitrate, or None."""
+        if not new and not self._ready(name, now):
+            return None
+        target, b = self.targets[name], self.bounds[name]
+        lowered = dict(new or target, bitrate=max(b['min_bitrate'], int(target['bitrate'] * DOWN_FACTOR)))
+        return _worth(target, lowered) or new
+
+    def _raise(self, name: str, now: float) -> dict:
+        """Return name's target stepped up toward its configured values, or None."""
+        if not self._ready(name, now):
+            return None
+        target, b = self.targets[name], self.bounds[name]
+        return _worth(target, {
+            'framerate': min(b['max_framerate'], max(target['framerate'] + 1, int(target['framerate'] * UP_FACTOR))),
+            'bitrate': min(b['max_bitrate'], int(target['bitrate'] * UP_FACTOR))})
+
+    def _reduction(self, name: str) -> float:
+        """How far name's target is below its configured values (smaller is further)."""
+        target, b = self.targets[name], self.bounds[name]
+        return min(target['framerate'] / b['max_framerate'], target['bitrate'] / b['max_bitrate'])
+
+    def record(self, decision: dict) -> None:
+        """Keep a decision for display and append it to the log file."""
+        self.decisions.append(decision)
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(decision) + '\n')
+            except OSError:
+                pass
+
+    def status(self) -> dict:
+        """Return current targets and recent decisions (newest last) as JSON-serializable data."""
+        with self.lock:
+            return {'targets': {name: {'bitrate': format_bitrate(t['bitrate']), 'framerate': t['framerate']}
+                                for name, t in self.targets.items()},
+                    'decisions': list(self.decisions)}
+
+    def start(self, interval: float = ABR_INTERVAL) -> None:
+        """Run step() every interval seconds on a daemon thread (idempotent)."""
+        if self._thread is None:
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.step()
+                    except Exception as e:
+                        print(f"ABR step failed: {e}")
+            self._thread = threading.Thread(target=loop, name='abr', daemon=True)
+            self._thread.start()
+
+def _cost(cam: dict) -> float:
+    """Estimated encode cost of a camera at its current framerate (see scheduler.estimate_cost())."""
+    width, height = parse_resolution(cam['resolution']) if cam.get('resolution') else DEFAULT_RESOLUTION
+    return estimate_cost(width, height, int(cam.get('framerate', 30)), 'raw')
+
+def _worth(target: dict, new: dict) -> dict:
+    """Return new if it differs enough from target to be worth a restart, else None."""
+    if any(abs(new[k] - target[k]) >= MIN_CHANGE * target[k] for k in ('bitrate', 'framerate')):
+        return new
+    return None  # At the bounds, or not worth a restart yet
+
+def describe_decision(decision: dict) -> str:
+    """Render one decision as a line like 'cam0 down: 2M@30 -> 1.5M@22 (uplink 95%)'."""
+    when = time.strftime('%H:%M:%S', time.localtime(decision['time']))
+    f, t = decision['from'], decision['to']
+    return (f"{when} {decision['cam']} {decision['action']}: {f['bitrate']}@{f['framerate']} -> "
+            f"{t['bitrate']}@{t['framerate']} ({decision['reason']})")
+
+class SimulatedHost:
+    """
+    Load model for exercising the controller without cameras.
+
+    Encode cost follows scheduler.estimate_cost(); when it exceeds the CPU capacity,
+    every encoder slows down proportionally and drops the frames it can't encode.
+    Uplink utilization is the sum of target bitrates over the uplink.
+    """
+
+    def __init__(self, cpu_capacity: float, cpus: int = 4, uplink: str = None, interval: float = ABR_INTERVAL):
+        self.cpu_capacity = cpu_capacity
+        self.cpus = cpus
+        self.uplink = parse_bitrate(uplink) if uplink else None
+        self.interval = interval
+        self.background = 0.0  # Cost units used by other processes
+        self.drops = collections.Counter()
+
+    def signals(self, cams: list) -> dict:
+        costs = {}
+        for i, cam in enumerate(cams):
+            width, height = parse_resolution(cam['resolution']) if cam.get('resolution') else DEFAULT_RESOLUTION
+            costs[f'cam{i}'] = estimate_cost(width, height, int(cam['framerate']), 'raw')
+        demand = sum(costs.values()) + self.background
+        speed = min(1.0, self.cpu_capacity / demand) if demand else 1.0
+        result = {}
+        for i, cam in enumerate(cams):
+            name = f'cam{i}'
+            self.drops[name] += int(int(cam['framerate']) * (1 - speed) * self.interval)
+            result[name] = {'speed': round(speed, 2), 'drops': self.drops[name], 'bitrate': parse_bitrate(cam['bitrate'])}
+        util = sum(s['bitrate'] for s in result.values()) / self.uplink if self.uplink else None
+        return {'load': demand / self.cpu_capacity, 'uplink_util': util, 'cams': result}
+
+def simulate(steps: int = 120) -> AbrController:
+    """
+    Run the controller against SimulatedHost through a scripted scenario and print its decisions.
+
+    Scenario: four 720p cameras on a 10M uplink; the uplink drops to 5M at step 20,
+    a CPU hog takes 60% of the host at step 50, and both recover at step 80.
+    """
+    host = SimulatedHost(cpu_capacity=200.0, uplink='10M')
+    clock = [0.0]
+    cams = [{'device': f'/dev/video{i}', 'framerate': 30, 'bitrate': '2M', 'resolution': '1280x720',
+             'abr': {'min_bitrate': '400k', 'max_bitrate': '2M', 'min_framerate': 10}} for i in range(4)]
+    applied = []
+    controller = AbrController(apply=applied.append, signals=host.signals, clock=lambda: clock[0], log_path=None)
+    controller.configure(cams)
+    for step in range(steps):
+        if step == 20:
+            host.uplink = parse_bitrate('5M')
+        elif step == 50:
+            host.background = 120.0
+        elif step == 80:
+            host.uplink, host.background = parse_bitrate('10M'), 0.0
+        for decision in controller.step():
+            print(f"step {step:>3}: " + describe_decision(dict(decision, time=clock[0])).split(' ', 1)[1])
+        clock[0] += host.interval
+    print(f"{len(applied)} config applies in {steps} steps; final targets: {json.dumps(controller.status()['targets'])}")
+    return controller
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Adaptive bitrate controller.")
+    parser.add_argument('--simulate', action='store_true', help="Run a scripted scenario against a simulated host")
+    parser.add_argument('--steps', type=int, default=120, help="Simulation steps (default 120)")
+    args = parser.parse_args()
+    if args.simulate:
+        simulate(args.steps)
+    else:
+        parser.print_help()
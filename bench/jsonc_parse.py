@@ -0,0 +1,130 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark the streaming JSONC parser against the old regex-strip + json.loads
+path on generated fleet configs.
+
+Usage: python3 bench/jsonc_parse.py [--cams 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsonc
+
+def make_config(cams: int, urls: bool = False) -> str:
+    """
+    Generate a commented JSONC fleet config.
+
+    Args:
+        cams: Number of camera entries.
+        urls: Include an 'rtsp://' source URL per camera (breaks the regex path).
+
+    Returns:
+        The JSONC text.
+    """
+    lines = ['{', '  // Generated fleet config', '  "cams": [']
+    for i in range(cams):
+        extra = f', "source": "rtsp://10.0.{i // 256}.{i % 256}:554/stream"' if urls else ''
+        sep = ',' if i < cams - 1 else ''
+        lines.append(f'    {{ "device": "/dev/video{i}", "framerate": 30, "bitrate": "800k",  /* cam {i} */')
+        lines.append(f'      "auth": {{ "user": "user{i}", "pass": "env:RTSP_PASS_CAM{i}" }}{extra} }}{sep}  // site {i % 7}')
+    lines += ['  ]', '}']
+    return '\n'.join(lines) + '\n'
+
+def regex_load(path: str) -> dict:
+    """The pre-streaming utils.load_jsonc implementation."""
+    with open(path) as f:
+        text = f.read()
+    no_comments = re.sub(r'/\*.*?\*/|//[^\n]*', '', text, flags=re.DOTALL)
+    return json.loads(no_comments)
+
+def stream_load(path: str) -> dict:
+    """jsonc.load on an open file."""
+    with open(path) as f:
+        return jsonc.load(f)
+
+def stream_iter(path: str) -> int:
+    """Consume jsonc.iter_cams one entry at a time, as write_yml does."""
+    with open(path) as f:
+        return sum(1 for _ in jsonc.iter_cams(f))
+
+def measure(func, path: str, repeat: int) -> dict:
+    """
+    Time func(path) and record its peak traced memory.
+
+    Args:
+        func: Loader to call.
+        path: Config file path.
+        repeat: Number of timed runs (best is reported).
+
+    Returns:
+        Dictionary with best_ms, peak_kib and an error string if the loader failed.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func(path)
+        except ValueError as e:
+            return {'best_ms': None, 'peak_kib': None, 'error': type(e).__name__}
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'best_ms': round(best * 1000, 1), 'peak_kib': peak // 1024, 'error': None}
+
+def time_to_first_cam(path: str) -> float:
+    """Milliseconds until iter_cams yields its first entry."""
+    start = time.perf_counter()
+    with open(path) as f:
+        next(jsonc.iter_cams(f))
+        return round((time.perf_counter() - start) * 1000, 2)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark JSONC parsing.")
+    parser.add_argument('--cams', type=int, default=10000, help="Cameras in the generated config (default 10000)")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per loader (default 5)")
+    args = parser.parse_args()
+
+    loaders = [('regex+json.loads', regex_load), ('jsonc.load', stream_load), ('jsonc.iter_cams', stream_iter)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for urls in (False, True):
+            path = os.path.join(tmp, f'config_{urls}.jsonc')
+            with open(path, 'w') as f:
+                f.write(make_config(args.cams, urls))
+            size_kib = os.path.getsize(path) // 1024
+            label = 'with rtsp:// URLs' if urls else 'plain'
+            print(f"\n{args.cams} cams, {label}, {size_kib} KiB")
+            print(f"{'loader':<18} {'best ms':>9} {'peak KiB':>9}  note")
+            for name, func in loaders:
+                r = measure(func, path, args.repeat)
+                note = f"FAILED ({r['error']})" if r['error'] else ''
+                print(f"{name:<18} {str(r['best_ms']):>9} {str(r['peak_kib']):>9}  {note}")
+            print(f"time to first cam via iter_cams: {time_to_first_cam(path)} ms")
+
+if __name__ == "__main__":
+    main()
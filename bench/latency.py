@@ -0,0 +1,214 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measure glass-to-glass latency per latency profile over localhost RTSP.
+
+The script renders the test frames itself: each carries its frame number as a
+bar code (16 black/white cells, then the same bits inverted, across the top
+quarter). It feeds them to an ffmpeg publisher at the test framerate, noting
+when each frame was handed over, and the publisher encodes them with the
+profile's encoder settings and publishes to a private MediaMTX instance using
+the profile's writeQueueSize. A reader pulls the stream back and decodes the bar
+code. Latency is the arrival time minus the recorded hand-over time of that frame
+number, so it doesn't depend on how ffmpeg treats timestamps. A stamp whose
+inverted half doesn't match, or that names a frame never sent, counts as bad,
+and the run fails if more than MAX_BAD of the frames are bad. Capture latency of
+a real webcam is not included; everything from the hand-over to decoded pixels is.
+
+Usage: python3 bench/latency.py [--profiles realtime,balanced,quality,none] [--frames 300]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelines import LATENCY_PROFILES, encode_args
+
+COUNTER_BITS = 16  # Frame number modulo 2**16, followed by the same bits inverted as a check
+BITS = 2 * COUNTER_BITS  # Cells across the top quarter
+MAX_BAD = 0.05  # Fraction of unreadable stamps above which the readings aren't trusted
+
+def mediamtx_config(port: int, profile: str) -> str:
+    """A minimal RTSP-only MediaMTX config on private ports."""
+    queue = f"writeQueueSize: {LATENCY_PROFILES[profile]['write_queue_size']}\n" if profile else ''
+    return (f"logLevel: error\nrtspAddress: :{port}\nrtpAddress: :{port + 2}\nrtcpAddress: :{port + 3}\n"
+            f"rtmp: no\nhls: no\nwebrtc: no\nsrt: no\n{queue}paths:\n  latency:\n    source: publisher\n")
+
+def publisher_command(url: str, profile: str, size: str, rate: int, bitrate: str) -> list:
+    """ffmpeg publishing raw yuv420p frames from stdin with the profile's encoder settings."""
+    return (['ffmpeg', '-hide_banner', '-loglevel', 'error']
+            + (LATENCY_PROFILES[profile]['input'] if profile else [])
+            + ['-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-video_size', size, '-framerate', str(rate), '-i', '-']
+            + encode_args('yuv420p', bitrate, 1, profile, rate)
+            + ['-f', 'rtsp', url])
+
+def reader_command(url: str) -> list:
+    """ffmpeg pulling the stream with minimal buffering, emitting one 32-pixel gray row per frame."""
+    return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-fflags', 'nobuffer', '-flags', 'low_delay',
+            '-rtsp_transport', 'tcp', '-i', url,
+            '-vf', f'crop=iw:ih/4:0:0,scale={BITS}:1:flags=area', '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+
+class FrameSource:
+    """Renders stamped yuv420p frames; below the bar code a gradient scrolls so the encoder has motion to code."""
+
+    def __init__(self, width: int, height: int):
+        self.width, self.height = width, height
+        self.edges = [i * width // BITS for i in range(BITS + 1)]
+        self.body_size = width * (height - height // 4)
+        self.body = bytes(range(256)) * (self.body_size // 256 + 2)
+        self.chroma = bytes([128]) * (width * height // 2)
+
+    def frame(self, number: int) -> bytes:
+        """Return frame number as raw yuv420p, stamped with number modulo 2**COUNTER_BITS."""
+        counter = number % (1 << COUNTER_BITS)
+        bits = [counter >> bit & 1 for bit in range(COUNTER_BITS)]
+        row = b''.join(bytes([255 if on else 0]) * (self.edges[i + 1] - self.edges[i])
+                       for i, on in enumerate(bits + [1 - b for b in bits]))
+        shift = number % 256
+        return row * (self.height // 4) + self.body[shift:shift + self.body_size] + self.chroma
+
+def decode_stamp(row: bytes) -> int:
+    """Read the frame number back from a downscaled bar code row, or None if its check half doesn't match."""
+    bits = [value > 127 for value in row]
+    if any(bits[i] == bits[i + COUNTER_BITS] for i in range(COUNTER_BITS)):
+        return None
+    return sum(1 << bit for bit in range(COUNTER_BITS) if bits[bit])
+
+def feed(publisher, source: FrameSource, rate: int, sent: dict, stop: threading.Event) -> None:
+    """Write frames to the publisher at rate, recording in sent when each stamp was handed over."""
+    start = time.monotonic()
+    number = 0
+    while not stop.is_set():
+        delay = start + number / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        data = source.frame(number)
+        sent[number % (1 << COUNTER_BITS)] = time.monotonic()
+        try:
+            publisher.stdin.write(data)
+            publisher.stdin.flush()
+        except (BrokenPipeError, ValueError):  # Publisher exited or stdin was closed
+            return
+        number += 1
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    """Wait until something listens on localhost:port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"MediaMTX did not listen on port {port}")
+
+def measure(profile: str, args) -> dict:
+    """Run MediaMTX, publisher and reader for one profile and return latency samples in ms."""
+    url = f"rtsp://127.0.0.1:{args.port}/latency"
+    width, height = (int(n) for n in args.size.split('x'))
+    procs, sent, stop = [], {}, threading.Event()
+    samples, bad = [], 0
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, 'mediamtx.yml')
+        with open(config, 'w') as f:
+            f.write(mediamtx_config(args.port, profile))
+        try:
+            procs.append(subprocess.Popen([args.mediamtx, config]))
+            wait_for_port(args.port)
+            publisher = subprocess.Popen(publisher_command(url, profile, args.size, args.rate, args.bitrate),
+                                         stdin=subprocess.PIPE)
+            procs.append(publisher)
+            threading.Thread(target=feed, args=(publisher, FrameSource(width, height), args.rate, sent, stop),
+                             daemon=True).start()
+            time.sleep(1.0)  # Let the publisher announce the path
+            reader = subprocess.Popen(reader_command(url), stdout=subprocess.PIPE)
+            procs.append(reader)
+            warmup_until = time.monotonic() + args.warmup
+            while len(samples) < args.frames:
+                row = reader.stdout.read(BITS)
+                arrived = time.monotonic()
+                if len(row) < BITS:
+                    raise RuntimeError("reader exited early")
+                if arrived < warmup_until:
+                    continue
+                number = decode_stamp(row)
+                if number is None or number not in sent:
+                    bad += 1
+                else:
+                    samples.append(round((arrived - sent[number]) * 1000, 1))
+        finally:
+            stop.set()
+            if len(procs) > 1:
+                procs[1].stdin.close()
+            for proc in reversed(procs):
+                proc.terminate()
+            for proc in procs:
+                try:
+                    proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+    return {'samples': samples, 'bad': bad}
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure glass-to-glass latency per latency profile.")
+    parser.add_argument('--profiles', default=','.join(list(LATENCY_PROFILES) + ['none']),
+                        help="Comma-separated profiles; 'none' is the encoder without a profile")
+    parser.add_argument('--frames', type=int, default=300, help="Frames measured per profile (default 300)")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of frames ignored at start (default 2)")
+    parser.add_argument('--size', default='640x480', help="Test source size (default 640x480)")
+    parser.add_argument('--rate', type=int, default=30, help="Test source framerate (default 30)")
+    parser.add_argument('--bitrate', default='1M', help="Encoder bitrate (default 1M)")
+    parser.add_argument('--port', type=int, default=8654, help="RTSP port of the private MediaMTX (default 8654)")
+    parser.add_argument('--mediamtx', default='./mediamtx', help="MediaMTX binary (default ./mediamtx)")
+    args = parser.parse_args()
+
+    print(f"{args.size}@{args.rate}, {args.bitrate}, {args.frames} frames per profile")
+    unreliable = []
+    print(f"{'profile':<10} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'max ms':>7} {'mean ms':>8} {'bad':>4}")
+    for name in args.profiles.split(','):
+        profile = None if name == 'none' else name
+        if profile and profile not in LATENCY_PROFILES:
+            sys.exit(f"Unknown profile '{name}'; choose from {', '.join(LATENCY_PROFILES)} or none.")
+        result = measure(profile, args)
+        s = result['samples']
+        if not s:
+            print(f"{name:<10} {'-':>7} {'-':>7} {'-':>7} {'-':>7} {'-':>8} {result['bad']:>4}")
+            unreliable.append(name)
+            continue
+        print(f"{name:<10} {percentile(s, 50):>7} {percentile(s, 90):>7} {percentile(s, 99):>7} {max(s):>7} "
+              f"{statistics.mean(s):>8.1f} {result['bad']:>4}")
+        if result['bad'] > MAX_BAD * (len(s) + result['bad']):
+            unreliable.append(name)
+    if unreliable:
+        sys.exit(f"Too many unreadable stamps for {', '.join(unreliable)}; the bar code isn't surviving encoding, "
+                 "so those readings can't be trusted. Try a larger --size or --bitrate.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Load test for the configuration web server: N concurrent clients hammer GET /
+and report p50/p99 latency, comparing the old single-threaded TCPServer with
+the threaded keep-alive server.
+
+Usage: python3 bench/load_config_server.py [--clients 50] [--requests 20] [--probe-ms 20]
+"""
+
+import argparse
+import http.client
+import http.server
+import os
+import socketserver
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+class SerialHandler(config.ConfigHandler):
+    """The handler as it ran under socketserver.TCPServer: HTTP/1.0, one connection at a time."""
+    protocol_version = 'HTTP/1.0'
+
+def percentile(samples: list, pct: float) -> float:
+    """
+    Return the pct-th percentile of samples using nearest-rank.
+
+    Args:
+        samples: Latency samples (unsorted).
+        pct: Percentile in the range 0-100.
+
+    Returns:
+        The sample at that rank, or 0.0 for an empty list.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+def run_load(mode: str, clients: int, requests: int, path: str = '/') -> dict:
+    """
+    Start a server in the given mode and drive it with concurrent GET clients.
+
+    Args:
+        mode: 'serial' for the old TCPServer, 'threaded' for ConfigServer.
+        clients: Number of concurrent client threads.
+        requests: Requests issued by each client.
+        path: Path requested (default the status page).
+
+    Returns:
+        Dictionary with p50/p99/max latency in milliseconds, throughput and error count.
+    """
+    if mode == 'serial':
+        socketserver.TCPServer.allow_reuse_address = True
+        server = socketserver.TCPServer(('127.0.0.1', 0), SerialHandler)
+    else:
+        server = config.ConfigServer(('127.0.0.1', 0), config.ConfigHandler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client() -> None:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+                local.append((time.perf_counter() - start) * 1000)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    server.shutdown()
+    server.server_close()
+    return {
+        'mode': mode,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(max(latencies, default=0.0), 2),
+        'req_per_s': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test GET / on the config server.")
+    parser.add_argument('--clients', type=int, default=50, help="Concurrent clients (default 50)")
+    parser.add_argument('--requests', type=int, default=20, help="Requests per client (default 20)")
+    parser.add_argument('--probe-ms', type=float, default=20.0,
+                        help="Simulated cost of the security probes per GET, in ms (default 20, ~ 'sudo ufw status')")
+    parser.add_argument('--modes', default='serial,threaded', help="Comma-separated modes to run")
+    args = parser.parse_args()
+
+    if args.probe_ms > 0:
+        # Replace the host-dependent probes with a fixed sleep so runs are comparable across machines.
+        delay = args.probe_ms / 1000
+        def fake_checks(*_args, **_kwargs) -> dict:
+            time.sleep(delay)
+            return {'root': True, 'video_group': True, 'ufw_port': True, 'auth_enabled': True}
+        config.security_checks = fake_checks
+
+    print(f"{'mode':<10} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}")
+    for mode in args.modes.split(','):
+        r = run_load(mode.strip(), args.clients, args.requests)
+        print(f"{r['mode']:<10} {r['requests']:>6} {r['errors']:>5} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {r['req_per_s']:>8}")
+
+if __name__ == "__main__":
+    main()
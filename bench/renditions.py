@@ -0,0 +1,118 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark CPU of one capture split into renditions (the filter_complex graph
+write_yml generates) against one ffmpeg process per rendition, each reading the
+source itself. The source is a lavfi testsrc, optionally pre-encoded to MJPEG
+so every reader also pays the decode an MJPEG webcam costs.
+
+Usage: python3 bench/renditions.py [--seconds 10] [--repeat 3] [--mjpeg]
+"""
+
+import argparse
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipelines import rendition_graph
+
+RENDITIONS = [
+    {'name': 'high', 'resolution': None, 'framerate': 30, 'bitrate': '2M'},
+    {'name': 'low', 'resolution': '640x360', 'framerate': 15, 'bitrate': '400k'},
+]
+ENCODE = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-preset', 'ultrafast', '-threads', '1']
+
+def source_args(size: str, rate: int, seconds: int, clip: str = None) -> list:
+    """Input options for the test source: a lavfi testsrc, or a pre-encoded MJPEG clip."""
+    if clip:
+        return ['-i', clip]
+    return ['-f', 'lavfi', '-i', f'testsrc=size={size}:rate={rate}', '-t', str(seconds)]
+
+def split_commands(source: list) -> list:
+    """One ffmpeg: decode once, split, encode each rendition."""
+    graph, labels = rendition_graph(RENDITIONS, 30)
+    cmd = ['ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error'] + source + ['-filter_complex', graph]
+    for rendition, label in zip(RENDITIONS, labels):
+        cmd += ['-map', label] + ENCODE + ['-b:v', rendition['bitrate'], '-f', 'null', '-']
+    return [cmd]
+
+def separate_commands(source: list) -> list:
+    """One ffmpeg per rendition, each reading and decoding the source on its own."""
+    commands = []
+    for rendition in RENDITIONS:
+        filters = []
+        if rendition['resolution']:
+            filters.append('scale=' + rendition['resolution'].replace('x', ':'))
+        if rendition['framerate'] != 30:
+            filters.append(f"fps={rendition['framerate']}")
+        cmd = ['ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error'] + source
+        if filters:
+            cmd += ['-vf', ','.join(filters)]
+        commands.append(cmd + ENCODE + ['-b:v', rendition['bitrate'], '-f', 'null', '-'])
+    return commands
+
+def measure(commands: list) -> dict:
+    """Run commands concurrently (as live encoders would) and return CPU seconds and wall time."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    procs = [subprocess.Popen(cmd) for cmd in commands]
+    codes = [proc.wait() for proc in procs]
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if any(codes):
+        raise RuntimeError(f"ffmpeg exited with {codes}")
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {'cpu_s': cpu, 'wall_s': wall}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark split renditions vs separate encoder processes.")
+    parser.add_argument('--seconds', type=int, default=10, help="Length of the test clip (default 10)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per mode; the median is reported (default 3)")
+    parser.add_argument('--size', default='1280x720', help="Capture size (default 1280x720)")
+    parser.add_argument('--mjpeg', action='store_true', help="Pre-encode the source to MJPEG so readers decode it")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = None
+        if args.mjpeg:
+            clip = os.path.join(tmp, 'source.mkv')
+            subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error'] + source_args(args.size, 30, args.seconds)
+                           + ['-c:v', 'mjpeg', '-q:v', '5', clip], check=True)
+        source = source_args(args.size, 30, args.seconds, clip)
+        frames = 30 * args.seconds
+        print(f"{args.size}@30 {'MJPEG clip' if clip else 'lavfi testsrc'}, {args.seconds}s, renditions: "
+              + ', '.join(f"{r['name']} {r['resolution'] or args.size}@{r['framerate']} {r['bitrate']}" for r in RENDITIONS))
+        print(f"{'mode':<10} {'procs':>5} {'CPU s':>8} {'wall s':>8} {'CPU ms/frame':>13}")
+        results = {}
+        for mode, build in (('separate', separate_commands), ('split', split_commands)):
+            commands = build(source)
+            runs = [measure(commands) for _ in range(args.repeat)]
+            cpu = statistics.median(r['cpu_s'] for r in runs)
+            wall = statistics.median(r['wall_s'] for r in runs)
+            results[mode] = cpu
+            print(f"{mode:<10} {len(commands):>5} {cpu:>8.2f} {wall:>8.2f} {cpu / frames * 1000:>13.2f}")
+        saved = 1 - results['split'] / results['separate']
+        print(f"split uses {saved:.0%} less CPU than separate processes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark suite: JSONC parsing and YAML generation from 1 to 10k cameras, security
+check latency, config server throughput/latency, and encode CPU and fps per
+pipeline. Needs no cameras: configs point at a placeholder device file and the
+encode suite feeds each pipeline's generated ffmpeg command from lavfi testsrc
+or a pre-encoded clip in place of /dev/video*.
+
+Results are saved as JSON; with a baseline, each metric is compared against it
+and the run exits non-zero if any regressed by more than the tolerance.
+
+Usage: python3 bench/run.py [--suites jsonc,yaml,checks,server,encode] [--quick]
+                            [--output bench/latest.json] [--baseline bench/baseline.json]
+                            [--save-baseline] [--tolerance 0.15]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from jsonc_parse import make_config
+from load_config_server import run_load
+
+SUITES = ('jsonc', 'yaml', 'checks', 'server', 'encode')
+SIZES = (1, 10, 100, 1000, 10000)
+QUICK_SIZES = (1, 100, 1000)
+
+def metric(results: dict, name: str, value: float, unit: str, better: str = 'lower') -> None:
+    """Record one result; better is 'lower' or 'higher'."""
+    results[name] = {'value': round(value, 3), 'unit': unit, 'better': better}
+    print(f"  {name:<44} {value:>12.3f} {unit}")
+
+def best_ms(func, repeat: int) -> float:
+    """Best wall time of repeat calls, in ms."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Run inside a temporary directory, since write_yml writes relative to the cwd."""
+    old = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(old)
+
+def bench_jsonc(results: dict, sizes: tuple, repeat: int) -> None:
+    import jsonc
+    for n in sizes:
+        text = make_config(n)
+        metric(results, f'jsonc.load.{n}cams', best_ms(lambda: jsonc.loads(text), repeat), 'ms')
+
+def bench_yaml(results: dict, sizes: tuple, repeat: int) -> None:
+    from utils import write_yml
+    with scratch_dir() as tmp:
+        device = os.path.join(tmp, 'video')  # Any existing path passes validation; only /dev/video* is probed
+        open(device, 'w').close()
+        for n in sizes:
+            cams = [{'device': device, 'framerate': 30, 'bitrate': '800k',
+                     'auth': {'user': f'user{i}', 'pass': f'pass{i}'}} for i in range(n)]
+            if os.path.exists('mediamtx.yml'):
+                os.unlink('mediamtx.yml')
+            start = time.perf_counter()
+            write_yml(cams)
+            metric(results, f'write_yml.first.{n}cams', (time.perf_counter() - start) * 1000, 'ms')
+            metric(results, f'write_yml.unchanged.{n}cams', best_ms(lambda: write_yml(cams), repeat), 'ms')
+            flip = [dict(cams[0], bitrate='900k')] + cams[1:]
+            metric(results, f'write_yml.one_changed.{n}cams',
+                   best_ms(lambda: (write_yml(flip), write_yml(cams)), repeat) / 2, 'ms')
+
+def bench_checks(results: dict, repeat: int) -> None:
+    from utils import security_checks
+    metric(results, 'security_checks.cold', best_ms(lambda: security_checks(force=True), repeat), 'ms')
+    security_checks()
+    metric(results, 'security_checks.cached', best_ms(security_checks, repeat * 100), 'ms')
+
+def bench_server(results: dict, clients: int, requests: int, probe_ms: float) -> None:
+    import config
+    delay = probe_ms / 1000
+    def fake_checks(*_args, **_kwargs) -> dict:  # Host-independent probe cost, as in load_config_server.py
+        time.sleep(delay)
+        return {'root': True, 'video_group': True, 'ufw_port': True, 'auth_enabled': True}
+    config.security_checks = fake_checks
+    for path in ('/', '/metrics', '/api/v1/cams'):
+        r = run_load('threaded', clients, requests, path)
+        label = path.strip('/').replace('/', '_') or 'status'
+        metric(results, f'server.{label}.p50', r['p50_ms'], 'ms')
+        metric(results, f'server.{label}.p99', r['p99_ms'], 'ms')
+        metric(results, f'server.{label}.throughput', r['req_per_s'], 'req/s', 'higher')
+        if r['errors']:
+            metric(results, f'server.{label}.errors', r['errors'], 'count')
+
+def encode_cases() -> list:
+    """
+    (label, choice, source format) per pipeline. The source format is what the
+    camera would deliver: H.264 for copy, MJPEG for mjpeg, raw frames otherwise
+    (YUYV for x264, the driver-default case, where ffmpeg converts).
+    """
+    return [
+        ('copy', {'pipeline': 'copy', 'input_format': 'h264', 'pix_fmt': None}, 'h264'),
+        ('mjpeg', {'pipeline': 'mjpeg', 'input_format': 'mjpeg', 'pix_fmt': 'yuv420p'}, 'mjpeg'),
+        ('raw_yuv420p', {'pipeline': 'raw', 'input_format': 'yuv420p', 'pix_fmt': 'yuv420p'}, 'yuv420p'),
+        ('raw_yuyv422', {'pipeline': 'raw', 'input_format': 'yuyv422', 'pix_fmt': 'yuv420p'}, 'yuyv422'),
+        ('x264', {'pipeline': 'x264', 'input_format': None, 'pix_fmt': 'yuv420p'}, 'yuyv422'),
+    ]
+
+def source_args(fmt: str, size: str, rate: int, seconds: int, tmp: str) -> list:
+    """Input options standing in for the camera: a pre-encoded clip, or testsrc for raw frames."""
+    lavfi = ['-f', 'lavfi', '-i', f'testsrc=size={size}:rate={rate},format={fmt if fmt not in ("h264", "mjpeg") else "yuv420p"}',
+             '-t', str(seconds)]
+    if fmt not in ('h264', 'mjpeg'):
+        return lavfi
+    clip = os.path.join(tmp, f'source_{fmt}.mkv')
+    if not os.path.exists(clip):
+        codec = ['-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(rate)] if fmt == 'h264' else ['-c:v', 'mjpeg', '-q:v', '5']
+        subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y'] + lavfi + codec + [clip], check=True)
+    return ['-i', clip]
+
+def generated_command(choice: dict, size: str, rate: int) -> list:
+    """The encoder options write_yml generates for this pipeline, after its '-i <device>'."""
+    from pipelines import build_ffmpeg_command
+    cam = {'device': '/dev/video0', 'framerate': rate, 'bitrate': '2M', 'resolution': size}
+    argv = shlex.split(build_ffmpeg_command('cam0', cam, choice, {'threads': 1}))
+    tail = argv[argv.index('-i') + 2:]
+    return tail[:tail.index('-f')] + ['-f', 'null', '-']  # Publish nowhere instead of to MediaMTX
+
+def bench_encode(results: dict, size: str, rate: int, seconds: int) -> None:
+    if not shutil.which('ffmpeg'):
+        print("  encode: ffmpeg not found; skipped")
+        return
+    frames = rate * seconds
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [('source_only', None, 'yuv420p')] + encode_cases()
+        for label, choice, fmt in cases:
+            source = source_args(fmt, size, rate, seconds, tmp)
+            options = generated_command(choice, size, rate) if choice else ['-c:v', 'rawvideo', '-f', 'null', '-']
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            start = time.perf_counter()
+            subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin'] + source + options, check=True)
+            wall = time.perf_counter() - start
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+            metric(results, f'encode.{label}.cpu_per_frame', cpu / frames * 1000, 'ms')
+            metric(results, f'encode.{label}.fps', frames / wall, 'fps', 'higher')
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print current vs baseline per metric and return the names that regressed.
+
+    A metric regresses when it moved in its worse direction by more than tolerance
+    (a fraction of the baseline value).
+    """
+    regressions = []
+    print(f"\n{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"{name:<44} {'-':>12} {cur['value']:>12.3f} {'new':>8}")
+            continue
+        change = (cur['value'] - base['value']) / base['value'] if base['value'] else 0.0
+        worse = change > tolerance if cur['better'] == 'lower' else change < -tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{name:<44} {base['value']:>12.3f} {cur['value']:>12.3f} {change:>+7.0%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare against a baseline.")
+    parser.add_argument('--suites', default=','.join(SUITES), help=f"Comma-separated suites (default {','.join(SUITES)})")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes and fewer repeats")
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'latest.json'), help="Where to save results")
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'), help="Baseline to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="Also save the results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed slowdown before flagging (default 0.15)")
+    parser.add_argument('--clients', type=int, default=20, help="Concurrent clients for the server suite (default 20)")
+    parser.add_argument('--probe-ms', type=float, default=20.0, help="Simulated security probe cost per status page (default 20)")
+    parser.add_argument('--size', default='1280x720', help="Encode suite frame size (default 1280x720)")
+    parser.add_argument('--seconds', type=int, default=5, help="Encode suite clip length (default 5)")
+    args = parser.parse_args()
+
+    suites = args.suites.split(',')
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        sys.exit(f"Unknown suite(s): {', '.join(sorted(unknown))}; choose from {', '.join(SUITES)}.")
+    sizes = QUICK_SIZES if args.quick else SIZES
+    repeat = 3 if args.quick else 5
+    results = {}
+    for suite in suites:
+        print(f"{suite}:")
+        if suite == 'jsonc':
+            bench_jsonc(results, sizes, repeat)
+        elif suite == 'yaml':
+            bench_yaml(results, sizes, repeat)
+        elif suite == 'checks':
+            bench_checks(results, repeat)
+        elif suite == 'server':
+            bench_server(results, args.clients, 10 if args.quick else 25, args.probe_ms)
+        else:
+            bench_encode(results, args.size, 30, 2 if args.quick else args.seconds)
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'commit': commit or None, 'host': platform.node(),
+                       'machine': platform.machine(), 'cpus': os.cpu_count(), 'python': platform.python_version(),
+                       'quick': args.quick, 'suites': suites},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {len(results)} metrics to {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.baseline} (commit {baseline['meta'].get('commit')}, {baseline['meta'].get('time')})")
+        regressions = compare(report, baseline, args.tolerance)
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}" + (": " + ", ".join(regressions) if regressions else ''))
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Saved as baseline {args.baseline}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Benchmark startup time of security_checker.py as a fleet provisioning run sees it:
+fresh interpreter to exit, against a bare interpreter as the floor. The dry-run
+case goes through load, security checks, capacity check and validation without
+changing anything.
+
+Usage: python3 bench/startup.py [--runs 20] [--config config.jsonc] [--importtime]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def cases(config: str) -> list:
+    """(label, argv) pairs, each run in a fresh interpreter from the repo root."""
+    result = [
+        ('python -c pass', [sys.executable, '-c', 'pass']),
+        ('import security_checker', [sys.executable, '-c', 'import security_checker']),
+        ('apply --help', [sys.executable, 'security_checker.py', 'apply', '--help']),
+        ('import utils', [sys.executable, '-c', 'import utils']),
+    ]
+    if os.path.exists(os.path.join(ROOT, config)):
+        result.append(('apply --dry-run --json', [sys.executable, 'security_checker.py', 'apply', '--config', config,
+                                                  '--dry-run', '--json']))
+    return result
+
+def measure(argv: list, runs: int) -> list:
+    """Wall-clock milliseconds of runs executions of argv."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def importtime(module: str, top: int = 12) -> list:
+    """The modules with the largest cumulative import time under python -X importtime."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                         capture_output=True, text=True).stderr
+    rows = []
+    for line in out.splitlines()[1:]:
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|').split('|'))
+        rows.append((int(cumulative_us), int(self_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark security_checker.py startup time.")
+    parser.add_argument('--runs', type=int, default=20, help="Runs per case (default 20)")
+    parser.add_argument('--config', default='config.jsonc', help="Config for the dry-run case (default config.jsonc)")
+    parser.add_argument('--importtime', action='store_true', help="Also list the slowest imports of security_checker's apply path")
+    args = parser.parse_args()
+
+    print(f"{'case':<26} {'median ms':>10} {'p90 ms':>8} {'min ms':>8}")
+    for label, argv in cases(args.config):
+        samples = sorted(measure(argv, args.runs))
+        p90 = samples[min(len(samples) - 1, int(round(0.9 * len(samples))) - 1)]
+        print(f"{label:<26} {statistics.median(samples):>10.1f} {p90:>8.1f} {samples[0]:>8.1f}")
+    if args.importtime:
+        print(f"\n{'module (import utils)':<40} {'cumulative ms':>14} {'self ms':>8}")
+        for cumulative, own, name in importtime('utils'):
+            print(f"{name:<40} {cumulative / 1000:>14.1f} {own / 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
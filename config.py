@@ -19,23 +19,495 @@ Web-based configuration server for MediaMTX, providing a browser interface
 to configure single or multi-camera setups via JSONC or form inputs.
 """
 
-from utils import run_command, security_checks, calculate_rating, load_jsonc, write_yml
+from abr import AbrController, describe_decision, live_signals
+from metrics import COLLECTOR
+from planner import calibrate_in_background, current_capacity, describe_plan, plan
+from recording import INDEX_PATH, open_index, parse_time, query as query_segments, usage
+from scheduler import describe_allocation
+from snapshots import SNAPSHOTS, SNAPSHOT_INTERVAL
+from supervisor import describe_status, ensure_running, process_running, status as supervisor_status, stop as stop_supervisor
+from tracing import TRACER, Profile
+from utils import (run_command, security_checks, check_timings, calculate_rating, load_jsonc, write_yml, describe_apply,
+                   validate_config, atomic_write, CHECK_CACHE_STATS)
+import base64
+import functools
+import hashlib
 import http.server
-import socketserver
-import urllib.parse
-import subprocess
+import json
 import os
-import signal
+import re
+import urllib.parse
+import threading
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 PORT = 8000
 HOST = '127.0.0.1'  # Localhost for security; change to '0.0.0.0' for network access
-MEDIAMTX_PROC = None  # Global to track running MediaMTX process
+DEBUG = '--debug' in sys.argv  # Allows ?profile=cprofile|pyinstrument on any request
+STARTED_SUPERVISOR = False  # True if this server started the supervisor (and so stops it on exit)
+APPLY_LOCK = threading.Lock()  # Serializes writes to mediamtx.yml across concurrent POSTs
+LAST_APPLY = None  # Summary of the most recent write_yml(), shown on the status page
+CURRENT_CAMS = []  # Cameras of the applied config, as written (before adaptive bitrate adjustments)
+CURRENT_SETTINGS = {}  # Top-level JSONC settings of the applied config (shards, uplink, recording)
+APPLIED_PATH = '.demod_applied.json'  # The applied config, so the API survives restarts
+API_PATH = re.compile(r'^/api(?:/v1)?/cams(?:/(\d+))?$')  # /api/cams is an alias of the current version
+MAX_API_BODY = 1 << 20  # Bytes accepted in a PUT/PATCH body
+REDACTED = '<redacted>'  # Plain-text passwords in API responses; send it back to keep the stored one
+RESTART_EXECUTOR = ThreadPoolExecutor(max_workers=1)  # Runs MediaMTX starts one at a time, off the request path
+SNAPSHOT_STYLE = (".snapshots { display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 10px; } "
+                  ".snapshots img, .snapshots .pending { width: 100%; aspect-ratio: 16 / 9; object-fit: contain; background: #eee; } "
+                  "figure { margin: 0; }")
+_SNAPSHOT_PATH = re.compile(r'^/snapshot/(cam\d+)\.jpg$')
+_TRACE_PATH = re.compile(r'^/debug/trace(?:/(\d+)(/profile)?)?$')
+
+def mediamtx_running() -> bool:
+    """Return True if the supervisor reports MediaMTX as running."""
+    return process_running('mediamtx')
+
+def start_mediamtx() -> None:
+    """
+    Start the supervisor (and with it MediaMTX) unless it is already running.
+
+    A running MediaMTX hot-reloads mediamtx.yml and restarts only changed paths, so it
+    is never restarted here. Runs on RESTART_EXECUTOR so starts never overlap and never
+    hold up an HTTP response.
+    """
+    global STARTED_SUPERVISOR
+    already = supervisor_status()['running']
+    pid = ensure_running()
+    if pid is None:
+        print("Error starting MediaMTX supervisor; see .supervisor/supervisor.log. Run setup.sh to install.")
+    elif not already:
+        STARTED_SUPERVISOR = True
+        print(f"MediaMTX supervisor started (PID {pid}).")
+
+class ApiError(Exception):
+    """An API request failure, sent as {'error': message} or {'errors': [...]} with an HTTP status."""
+
+    def __init__(self, status: int, body, headers: dict = None):
+        super().__init__(body)
+        self.status = status
+        self.body = body if isinstance(body, dict) else {'error': body}
+        self.headers = headers or {}
+
+def config_etag(cams: list, settings: dict) -> str:
+    """Return the ETag of a config (a hash, so it is stable across restarts)."""
+    canonical = json.dumps({'cams': cams, 'settings': settings}, sort_keys=True)
+    return '"' + hashlib.sha256(canonical.encode()).hexdigest()[:16] + '"'
+
+def _apply(cams: list, settings: dict, specs: list = None) -> dict:
+    """
+    Write a config through the minimal-restart path and make it current. Caller holds APPLY_LOCK.
+
+    Args:
+        cams: Camera dictionaries as written in JSONC.
+        settings: Top-level JSONC settings.
+        specs: validate_cam() results for cams, if already validated.
+
+    Returns:
+        The write_yml() summary.
+
+    Raises:
+        ValueError: If the config is invalid (nothing is written).
+    """
+    global LAST_APPLY, CURRENT_CAMS, CURRENT_SETTINGS
+    summary = write_yml(cams, shards=settings.get('shards', 1), recording=settings.get('recording'), specs=specs)
+    LAST_APPLY = summary
+    CURRENT_CAMS, CURRENT_SETTINGS = cams, settings
+    COLLECTOR.watch_yml()
+    SNAPSHOTS.watch_yml()
+    ABR.configure(cams, live_signals(COLLECTOR, settings))
+    atomic_write(APPLIED_PATH, json.dumps(dict(settings, cams=cams), indent=2))
+    return summary
+
+def load_applied() -> None:
+    """Restore the applied config saved by the last run, without rewriting mediamtx.yml."""
+    global CURRENT_CAMS, CURRENT_SETTINGS
+    try:
+        with open(APPLIED_PATH) as f:
+            config = json.load(f)
+        CURRENT_CAMS = config.pop('cams', [])
+        CURRENT_SETTINGS = config
+        ABR.configure(CURRENT_CAMS, live_signals(COLLECTOR, CURRENT_SETTINGS))
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring {APPLIED_PATH}: {e}")
+
+def redact(cam: dict) -> dict:
+    """Hide a camera's plain-text password (env:VAR references are shown)."""
+    password = cam.get('auth', {}).get('pass', '') if isinstance(cam.get('auth'), dict) else ''
+    if password and not password.startswith('env:'):
+        return dict(cam, auth=dict(cam['auth'], **{'pass': REDACTED}))
+    return cam
+
+def unredact(cams: list, current: list) -> list:
+    """Put back passwords a client echoed as REDACTED, from the camera at the same index."""
+    result = []
+    for i, cam in enumerate(cams):
+        auth = cam.get('auth') if isinstance(cam, dict) else None
+        if isinstance(auth, dict) and auth.get('pass') == REDACTED:
+            old = current[i].get('auth', {}).get('pass') if i < len(current) else None
+            if not old:
+                raise ApiError(422, {'errors': [{'cam': i, 'error': f"cam{i} has no stored password to keep."}]})
+            cam = dict(cam, auth=dict(auth, **{'pass': old}))
+        result.append(cam)
+    return result
+
+def merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7386): objects merge recursively, null deletes a key."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+def apply_abr(cams: list) -> None:
+    """
+    Write the adaptive bitrate controller's adjusted cams through the hot-reload path.
+
+    Validation (and its device probes) runs before APPLY_LOCK is taken, so API and
+    form writes don't wait behind it.
+
+    Raises:
+        ValueError: If the adjusted cams are invalid, or a POST replaced the config
+                    since the step (nothing is written).
+    """
+    global LAST_APPLY
+    specs = []
+    errors = validate_config(cams, CURRENT_SETTINGS, specs)
+    if errors:
+        raise ValueError(' '.join(e['error'] for e in errors))
+    with APPLY_LOCK:
+        if ABR.current_cams() != cams:
+            raise ValueError("the config was replaced during the step")
+        summary = write_yml(cams, shards=CURRENT_SETTINGS.get('shards', 1),
+                            recording=CURRENT_SETTINGS.get('recording'), specs=specs)
+        LAST_APPLY = summary
+        COLLECTOR.watch_yml()
+        SNAPSHOTS.watch_yml()
+
+ABR = AbrController(apply=apply_abr)
+
+def render_checks(checks: dict) -> str:
+    """
+    Render security check results, with the duration of each probe, as an HTML list.
+
+    Args:
+        checks: Dictionary of security check results (None means unknown).
+
+    Returns:
+        An HTML <ul> string.
+    """
+    timings = check_timings()
+    items = []
+    for name, value in checks.items():
+        status = 'Unknown (probe timed out)' if value is None else ('Yes' if value else 'No')
+        timing = timings.get(name)
+        suffix = f" <small>({timing['ms']:.1f} ms)</small>" if timing else ''
+        items.append(f"<li>{name.capitalize()}: {status}{suffix}</li>")
+    return "<ul>" + "".join(items) + "</ul>"
+
+def render_processes() -> str:
+    """Render supervised process states, restart counts and uptimes as an HTML list."""
+    return "<ul>" + "".join(f"<li>{line}</li>" for line in describe_status(supervisor_status())) + "</ul>"
+
+def render_abr() -> str:
+    """Render adaptive bitrate targets and the most recent decisions as HTML."""
+    status = ABR.status()
+    if not status['targets']:
+        return "<p>No cameras have 'abr' bounds.</p>"
+    targets = ", ".join(f"{name}: {t['bitrate']}@{t['framerate']}" for name, t in status['targets'].items())
+    decisions = "".join(f"<li>{describe_decision(d)}</li>" for d in reversed(status['decisions'][-10:]))
+    return f"<p>Targets: {targets} (<a href=\"/abr\"><u>JSON</u></a>)</p><ul>{decisions or '<li>No changes yet.</li>'}</ul>"
+
+def render_snapshots() -> tuple:
+    """
+    Render every camera's cached snapshot as an inline-image grid (one request for all).
+
+    Returns:
+        An (HTML, ETag) tuple; the ETag changes whenever any snapshot does.
+    """
+    cells, tags = [], []
+    for name in SNAPSHOTS.names():
+        entry = SNAPSHOTS.get(name)
+        if entry is None:
+            cells.append(f"<figure><div class=\"pending\">Waiting for first frame</div><figcaption>{name}</figcaption></figure>")
+            tags.append(name)
+            continue
+        jpeg, etag, taken = entry
+        when = time.strftime('%H:%M:%S', time.localtime(taken))
+        cells.append(f"<figure><a href=\"/snapshot/{name}.jpg\"><img src=\"data:image/jpeg;base64,"
+                     f"{base64.b64encode(jpeg).decode()}\" alt=\"{name}\"></a><figcaption>{name} ({when})</figcaption></figure>")
+        tags.append(etag)
+    if not cells:
+        return "<p>No cameras configured yet.</p>", '"empty"'
+    html = f"<div class=\"snapshots\">{''.join(cells)}</div>"
+    return html, '"' + hashlib.sha1('|'.join(tags).encode()).hexdigest()[:16] + '"'
+
+def render_snapshot_links() -> str:
+    """
+    Render the camera grid for the status page as plain image links.
+
+    Unlike render_snapshots(), nothing is inlined and no sidecar is woken here: the
+    browser fetches (lazily, and revalidating by ETag) only the snapshots it shows.
+    """
+    names = SNAPSHOTS.names()
+    if not names:
+        return "<p>No cameras configured yet.</p>"
+    cells = "".join(f"<figure><a href=\"/snapshot/{name}.jpg\"><img src=\"/snapshot/{name}.jpg\" loading=\"lazy\" "
+                    f"alt=\"{name} (no frame yet)\"></a><figcaption>{name}</figcaption></figure>" for name in names)
+    return f"<div class=\"snapshots\">{cells}</div>"
+
+def render_allocation() -> str:
+    """Render the encoder CPU allocation from the last apply as an HTML list."""
+    if not LAST_APPLY or not LAST_APPLY.get('allocation'):
+        return "<p>No encoders scheduled yet.</p>"
+    return "<ul>" + "".join(f"<li>{line}</li>" for line in describe_allocation(LAST_APPLY['allocation'])) + "</ul>"
+
+def traced(method):
+    """
+    Record a span for each request a handler method serves. In debug mode a
+    ?profile=cprofile or ?profile=pyinstrument query also profiles the request; the
+    report is kept with the span, whose ID is sent as X-Trace-Id.
+    """
+    @functools.wraps(method)
+    def wrapper(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.startswith('/debug/'):
+            method(self)  # Reading the trace shouldn't push spans out of it
+            return
+        engine = urllib.parse.parse_qs(url.query).get('profile', [None])[0] if DEBUG else None
+        self.status_code = None
+        with TRACER.span('request', f"{self.command} {url.path}") as span:
+            self.trace_id = span['id']
+            try:
+                if not engine:
+                    method(self)
+                    return
+                try:
+                    profile = Profile(engine).start()
+                except ValueError as e:
+                    self.send_body(400, f"Error: {e}", 'text/plain')
+                    return
+                try:
+                    method(self)
+                finally:
+                    span['profile'] = profile.stop()
+            finally:
+                span['status'] = self.status_code
+                self.trace_id = None
+    return wrapper
+
+class ConfigServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP server so one slow request cannot block other clients."""
+    request_queue_size = 128  # Room for a burst of dashboard refreshes
 
 class ConfigHandler(http.server.SimpleHTTPRequestHandler):
     """HTTP handler for serving and processing the configuration form."""
+    protocol_version = 'HTTP/1.1'  # Keep-alive; every response must carry Content-Length
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't hold the body for the client's delayed ACK
+    timeout = 30  # Drop idle keep-alive connections so they don't pin a thread forever
+    status_code = None  # Status of the response being sent, for the request's span
+    trace_id = None  # ID of the request's span while it is being served
+
+    def send_response(self, code: int, message: str = None) -> None:
+        self.status_code = code
+        super().send_response(code, message)
+
+    def end_headers(self) -> None:
+        if self.trace_id:
+            self.send_header('X-Trace-Id', str(self.trace_id))
+        super().end_headers()
+
+    def send_body(self, status: int, body, content_type: str = 'text/html', headers: dict = None) -> None:
+        """
+        Send a complete response with an explicit Content-Length.
+
+        Args:
+            status: HTTP status code.
+            body: Response body text (or bytes).
+            content_type: Value for the Content-type header.
+            headers: Additional headers, e.g. ETag.
+        """
+        data = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_modified(self, etag: str) -> bool:
+        """Send 304 and return True if the request's If-None-Match already has etag."""
+        tags = [t.strip().removeprefix('W/') for t in self.headers.get('If-None-Match', '').split(',')]
+        if etag not in tags and '*' not in tags:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
+    def send_snapshot(self, name: str) -> None:
+        """Serve a camera's cached JPEG; 404 for unknown cameras, 503 before the first frame."""
+        try:
+            entry = SNAPSHOTS.get(name)
+        except KeyError:
+            self.send_body(404, f"Error: no camera {name}", 'text/plain')
+            return
+        if entry is None:
+            self.send_body(503, "Error: no frame yet; retry shortly", 'text/plain', {'Retry-After': str(SNAPSHOT_INTERVAL)})
+            return
+        jpeg, etag, _ = entry
+        if not self.not_modified(etag):
+            self.send_body(200, jpeg, 'image/jpeg', {'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    def send_json(self, status: int, body, headers: dict = None) -> None:
+        self.send_body(status, json.dumps(body, indent=2) + '\n', 'application/json', headers)
+
+    def read_body(self) -> bytes:
+        """Read a request body of at most MAX_API_BODY bytes."""
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_API_BODY:
+            self.close_connection = True  # The unread body would be parsed as the next request
+            raise ApiError(413, f"Body larger than {MAX_API_BODY} bytes.")
+        return self.rfile.read(length)
+
+    def api_get(self, index: str) -> None:
+        """GET /api/v1/cams (the whole config, as in config.jsonc) or /api/v1/cams/{i} (one camera)."""
+        cams, settings = CURRENT_CAMS, CURRENT_SETTINGS
+        etag = config_etag(cams, settings)
+        if index is None:
+            body = dict(settings, cams=[redact(cam) for cam in cams])
+        elif int(index) < len(cams):
+            body = redact(cams[int(index)])
+        else:
+            raise ApiError(404, f"No cam{index}; there are {len(cams)} camera(s).")
+        if not self.not_modified(etag):
+            self.send_json(200, body, {'ETag': etag})
+
+    def api_write(self, method: str, raw: bytes) -> None:
+        """
+        PUT /api/v1/cams replaces the config (body as in config.jsonc; top-level settings left
+        out are kept), PUT /api/v1/cams/{i} replaces one camera, PATCH /api/v1/cams/{i} merges
+        a JSON merge patch into one camera.
+
+        The request must carry If-Match with the config's current ETag (or '*'). Every camera
+        is validated and all errors are returned together; a valid config is applied through
+        write_yml(), which restarts only the paths whose settings changed.
+        """
+        index = API_PATH.match(urllib.parse.urlsplit(self.path).path).group(1)
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        if method == 'PATCH' and index is None:
+            raise ApiError(405, "PATCH a single camera at /api/v1/cams/{i}.", {'Allow': 'GET, PUT'})
+        if_match = self.headers.get('If-Match')
+        if not if_match:
+            raise ApiError(428, "If-Match is required; GET /api/v1/cams for the current ETag.")
+        try:
+            body = json.loads(raw or b'null')
+        except ValueError as e:
+            raise ApiError(400, f"Invalid JSON: {e}")
+        if not isinstance(body, dict) or (index is None and not isinstance(body.get('cams'), list)):
+            raise ApiError(400, "Body must be an object" + (" with a 'cams' list." if index is None else "."))
+        # Validate and plan against a snapshot, outside APPLY_LOCK: probes and planning must not
+        # hold up ABR or other writers. The ETag is checked again under the lock before writing.
+        current_cams, current_settings = CURRENT_CAMS, CURRENT_SETTINGS
+        etag = config_etag(current_cams, current_settings)
+        if etag not in [t.strip() for t in if_match.split(',')] and if_match.strip() != '*':
+            raise ApiError(412, "The config changed since it was read; GET it again and retry.", {'ETag': etag})
+        settings = dict(current_settings)
+        if index is None:
+            cams = body['cams']
+            settings.update({k: v for k, v in body.items() if k != 'cams'})
+        else:
+            i = int(index)
+            if i >= len(current_cams):
+                raise ApiError(404, f"No cam{i}; PUT the whole list to add cameras.")
+            cams = list(current_cams)
+            cams[i] = merge_patch(cams[i], body) if method == 'PATCH' else body
+        cams = unredact(cams, current_cams)
+        specs = []
+        errors = validate_config(cams, settings, specs)
+        if errors:
+            raise ApiError(422, {'errors': errors})
+        report = plan(cams, settings, current_capacity(), specs)
+        if not report['ok'] and 'ignore_capacity' not in query:
+            raise ApiError(422, {'errors': [{'cam': None, 'error': describe_plan(report)}]})
+        with APPLY_LOCK:
+            if config_etag(CURRENT_CAMS, CURRENT_SETTINGS) != etag:
+                raise ApiError(412, "The config changed while this update was validated; GET it again and retry.",
+                               {'ETag': config_etag(CURRENT_CAMS, CURRENT_SETTINGS)})
+            summary = _apply(cams, settings, specs)
+            etag = config_etag(cams, settings)
+        self.send_json(200, {
+            'applied': describe_apply(summary),
+            'summary': {key: summary[key] for key in ('written', 'added', 'removed', 'changed', 'unchanged', 'restarted', 'routes')},
+        }, {'ETag': etag})
+
+    def handle_api(self, method: str) -> None:
+        """Dispatch an /api request, turning ApiError into a JSON error response."""
+        try:
+            raw = self.read_body() if method != 'GET' else b''
+            m = API_PATH.match(urllib.parse.urlsplit(self.path).path)
+            if not m:
+                raise ApiError(404, "Unknown API path; use /api/v1/cams or /api/v1/cams/{i}.")
+            if method == 'GET':
+                self.api_get(m.group(1))
+            elif method in ('PUT', 'PATCH'):
+                self.api_write(method, raw)
+            else:
+                raise ApiError(405, f"{method} is not supported here.", {'Allow': 'GET, PUT, PATCH'})
+        except ApiError as e:
+            self.send_json(e.status, e.body, e.headers)
+
+    @traced
+    def do_PUT(self):
+        self.handle_api('PUT')
+
+    @traced
+    def do_PATCH(self):
+        self.handle_api('PATCH')
+
+    @traced
     def do_GET(self):
-        checks = security_checks()
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.startswith('/api/'):
+            self.handle_api('GET')
+            return
+        if url.path == '/metrics':
+            # Served from the collector's snapshot; never waits on encoders or /proc
+            body = COLLECTOR.render({'demod_mediamtx_up': int(mediamtx_running())})
+            self.send_body(200, body, 'text/plain; version=0.0.4')
+            return
+        if url.path == '/abr':
+            self.send_body(200, json.dumps(ABR.status(), indent=2), 'application/json')
+            return
+        m = _TRACE_PATH.match(url.path)
+        if m:
+            self.send_trace(m, urllib.parse.parse_qs(url.query))
+            return
+        m = _SNAPSHOT_PATH.match(url.path)
+        if m:
+            self.send_snapshot(m.group(1))
+            return
+        if url.path == '/snapshots':
+            grid, etag = render_snapshots()
+            if not self.not_modified(etag):
+                page = (f"<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>Snapshots</title>"
+                        f"<meta http-equiv=\"refresh\" content=\"{SNAPSHOT_INTERVAL}\"><style>{SNAPSHOT_STYLE}</style>"
+                        f"</head><body>{grid}</body></html>")
+                self.send_body(200, page, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+            return
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/recordings':
+            self.send_recordings(query)
+            return
+        checks = security_checks(force='refresh' in query)
         user_answers = []  # Default for initial load
         rating = calculate_rating(checks, user_answers)
         rating_message = f"Security Rating: {rating}/100"
@@ -45,7 +517,7 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
             rating_message += " (Moderate - consider additional measures)"
         else:
             rating_message += " (High - well secured)"
-        security_status = "<ul>" + "".join(f"<li>{k.capitalize()}: {'Yes' if v else 'No'}</li>" for k, v in checks.items()) + "</ul>"
+        security_status = render_checks(checks)
         html = f"""
 <!DOCTYPE html>
 <html lang="en">
@@ -61,6 +533,7 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
     input, textarea {{ width: 100%; padding: 5px; margin-bottom: 10px; }}
     input[type="checkbox"] {{ width: auto; }}
     ul {{ list-style-type: disc; margin-left: 20px; }}
+    {SNAPSHOT_STYLE}
   </style>
 </head>
 <body>
@@ -70,11 +543,21 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
   <h2>Security Status</h2>
   <p>{rating_message}</p>
   {security_status}
+  <p>Check cache: {CHECK_CACHE_STATS['hits']} hits / {CHECK_CACHE_STATS['misses']} misses (<a href="/?refresh=1"><u>re-run checks now</u></a>)</p>
+  <h2>Cameras</h2>
+  {render_snapshot_links()}
+  <p><a href="/snapshots"><u>Open the self-refreshing snapshot grid</u></a></p>
+  <h2>Processes</h2>
+  {render_processes()}
+  <h2>Encoder CPU Allocation</h2>
+  {render_allocation()}
+  <h2>Adaptive Bitrate</h2>
+  {render_abr()}
   <p>Configure cameras below. Use JSONC for multi-camera setups or form fields for a single camera. Answer security questions to improve the rating.</p>
   <form method="POST">
     <h3>Multi-Camera Configuration</h3>
     <label>JSONC Config (optional for multi-camera):</label>
-    <textarea name="jsonc" rows="10" cols="50" placeholder='{{ "cams": [{ "device": "/dev/video0", "framerate": 30, "bitrate": "800k", "auth": {{ "user": "user1", "pass": "env:RTSP_PASS" }} }] }}'></textarea>
+    <textarea name="jsonc" rows="10" cols="50" placeholder='{{ "cams": [{{ "device": "/dev/video0", "framerate": 30, "bitrate": "800k", "auth": {{ "user": "user1", "pass": "env:RTSP_PASS" }} }}] }}'></textarea>
     <h3>Manual Single Camera (if no JSONC)</h3>
     <label>Webcam Device (e.g., /dev/video0):</label>
     <input type="text" name="device" value="/dev/video0">
@@ -88,6 +571,8 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
     <input type="number" name="framerate" value="30" min="1">
     <label>Bitrate (e.g., 800k):</label>
     <input type="text" name="bitrate" value="800k">
+    <label>Adaptive bitrate floor (e.g., 300k; blank keeps the bitrate fixed):</label>
+    <input type="text" name="abr_min_bitrate">
     <h3>Security Questions (check for yes)</h3>
     <label>Is the device on a secure network (e.g., behind VPN/firewall)?</label>
     <input type="checkbox" name="secure_network"> Yes
@@ -95,29 +580,84 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
     <input type="checkbox" name="changed_passwords"> Yes
     <label>Is remote access restricted (e.g., SSH keys only)?</label>
     <input type="checkbox" name="restricted_access"> Yes
-    <label>Start/Restart Server:</label>
+    <label>Apply even if the capacity check fails:</label>
+    <input type="checkbox" name="ignore_capacity">
+    <label>Start Server (a running server reloads changed cameras by itself):</label>
     <input type="checkbox" name="start_server" checked>
     <input type="submit" value="Apply Configuration" style="margin-top: 10px;">
   </form>
 </body>
 </html>
 """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        self.send_body(200, html)
 
+    def send_trace(self, m, query: dict) -> None:
+        """
+        Answer /debug/trace?kind=command&limit=200 with recent spans (in the order they finished) and a
+        per-name summary, /debug/trace/{id} with one span and /debug/trace/{id}/profile
+        with a profiled request's report.
+        """
+        if m.group(1):
+            span = TRACER.get(int(m.group(1)))
+            if span is None:
+                self.send_body(404, "Error: no such span; it may have left the buffer", 'text/plain')
+            elif not m.group(2):
+                self.send_json(200, span)
+            elif 'profile' in span:
+                self.send_body(200, span['profile'], 'text/plain')
+            else:
+                self.send_body(404, "Error: span was not profiled; start config.py with --debug and add ?profile=cprofile",
+                               'text/plain')
+            return
+        try:
+            limit = int(query.get('limit', ['200'])[0])
+        except ValueError:
+            self.send_body(400, "Error: limit must be a number", 'text/plain')
+            return
+        spans = [dict(s, profile=True) if 'profile' in s else s for s in TRACER.spans(query.get('kind', [None])[0], limit)]
+        self.send_json(200, {'summary': TRACER.summary(), 'spans': spans})
+
+    def send_recordings(self, query: dict) -> None:
+        """
+        Answer /recordings?path=cam0&start=...&end=...&limit=... from the segment index.
+
+        start and end are epoch seconds or ISO 8601 times; the response lists the
+        segments overlapping that range plus per-path disk usage.
+        """
+        try:
+            path = query.get('path', [None])[0]
+            start = parse_time(query['start'][0]) if 'start' in query else None
+            end = parse_time(query['end'][0]) if 'end' in query else None
+            limit = int(query.get('limit', ['1000'])[0])
+        except ValueError as e:
+            self.send_body(400, f"Error: {e}", 'text/plain')
+            return
+        body = {'usage': {}, 'segments': []}
+        if os.path.exists(INDEX_PATH):
+            conn = open_index()
+            try:
+                body = {'usage': usage(conn), 'segments': query_segments(conn, path, start, end, limit)}
+            finally:
+                conn.close()
+        self.send_body(200, json.dumps(body, indent=2), 'application/json')
+
+    @traced
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
+        if urllib.parse.urlsplit(self.path).path.startswith('/api/'):
+            self.handle_api('POST')
+            return
+        content_length = int(self.headers.get('Content-Length', 0))
         post_data = self.rfile.read(content_length).decode()
         params = urllib.parse.parse_qs(post_data)
 
         try:
             cams = []
+            settings = {}
             jsonc_text = params.get('jsonc', [''])[0].strip()
             if jsonc_text:
                 config = load_jsonc(jsonc_text, is_file=False)
                 cams = config.get('cams', [])
+                settings = {k: v for k, v in config.items() if k != 'cams'}
             if not cams:
                 # Single from form
                 device = params.get('device', ['/dev/video0'])[0].strip()
@@ -139,23 +679,43 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
                     if not auth['pass']:
                         raise ValueError("Password required if auth enabled.")
                 cams = [{'device': device, 'framerate': framerate, 'bitrate': bitrate, 'auth': auth}]
+                abr_min = params.get('abr_min_bitrate', [''])[0].strip()
+                if abr_min:
+                    cams[0]['abr'] = {'min_bitrate': abr_min, 'max_bitrate': bitrate}
+
+            # Validate (and probe devices) before taking APPLY_LOCK, so other writers don't wait on it
+            specs = []
+            errors = validate_config(cams, settings, specs)
+            if errors:
+                raise ValueError(' '.join(e['error'] for e in errors))
+
+            # Admission control: refuse sets the host can't run unless overridden
+            report = plan(cams, settings, current_capacity(), specs)
+            if not report['ok'] and 'ignore_capacity' not in params:
+                raise ValueError(describe_plan(report))
 
-            write_yml(cams)
+            with APPLY_LOCK:
+                summary = _apply(cams, settings, specs)
 
             response = f"Configuration saved for {len(cams)} cam(s).<br>"
-            ip = run_command("hostname -I | awk '{{print $1}}'")
-            stream_urls = [f"rtsp://{cam.get('auth', {{}}).get('user', '')}:<password>@{ip}:8554/cam{i}" if cam.get('auth', {}).get('user') else f"rtsp://{ip}:8554/cam{i}" for i, cam in enumerate(cams)]
+            response += "Capacity: " + describe_plan(report).replace('\n', '<br>') + "<br>"
+            if mediamtx_running():
+                response += f"Hot reload: {describe_apply(summary)}<br>"
+            ip = run_command("hostname -I | awk '{print $1}'")
+            stream_urls = []
+            for i, cam in enumerate(cams):
+                user = cam.get('auth', {}).get('user')
+                credentials = f"{user}:<password>@" if user else ''
+                # Renditions are published as cam{i}/{name}, each routed to its camera's shard
+                for path, port in summary['routes'].items():
+                    if path == f'cam{i}' or path.startswith(f'cam{i}/'):
+                        stream_urls.append(f"rtsp://{credentials}{ip}:{port}/{path}")
             response += "Streams at: " + ", ".join(stream_urls) + "<br>"
+            response += f"<h2>Encoder CPU Allocation</h2>{render_allocation()}"
 
-            if 'start_server' in params:
-                global MEDIAMTX_PROC
-                if MEDIAMTX_PROC and MEDIAMTX_PROC.poll() is None:
-                    os.kill(MEDIAMTX_PROC.pid, signal.SIGTERM)
-                    MEDIAMTX_PROC.wait()
-                    response += "Old server stopped.<br>"
-                
-                MEDIAMTX_PROC = subprocess.Popen(['./mediamtx'])
-                response += "Server started.<br>"
+            if 'start_server' in params and not mediamtx_running():
+                RESTART_EXECUTOR.submit(start_mediamtx)
+                response += "Server start queued.<br>"
 
             # Updated status
             checks = security_checks()
@@ -172,30 +732,33 @@ class ConfigHandler(http.server.SimpleHTTPRequestHandler):
                 rating_message += " (Moderate - consider additional measures)"
             else:
                 rating_message += " (High - good job)"
-            security_status = "<ul>" + "".join(f"<li>{k.capitalize()}: {'Yes' if v else 'No'}</li>" for k, v in checks.items()) + "</ul>"
+            security_status = render_checks(checks)
             response += f"<h2>Updated Security Status</h2><p>{rating_message}</p>{security_status}"
 
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            self.wfile.write(response.encode())
+            self.send_body(200, response)
         except Exception as e:
-            self.send_response(400)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(f"Error: {str(e)}".encode())
+            self.send_body(400, f"Error: {str(e)}", 'text/plain')
 
 if __name__ == "__main__":
     try:
-        with socketserver.TCPServer((HOST, PORT), ConfigHandler) as httpd:
+        with ConfigServer((HOST, PORT), ConfigHandler) as httpd:
             print(f"Serving configuration webserver at http://{HOST}:{PORT}")
             print("Developed by DeMoD LLC")
+            if DEBUG:
+                print("Debug mode: add ?profile=cprofile or ?profile=pyinstrument to profile a request; see /debug/trace")
+            load_applied()
+            calibrate_in_background()  # Requests plan with current_capacity() and never wait for it
+            COLLECTOR.watch_yml()
+            COLLECTOR.start()
+            SNAPSHOTS.watch_yml()
+            ABR.start()
             httpd.serve_forever()
     except KeyboardInterrupt:
         print("Shutting down server...")
-        if MEDIAMTX_PROC and MEDIAMTX_PROC.poll() is None:
-            MEDIAMTX_PROC.terminate()
-            MEDIAMTX_PROC.wait()
+        RESTART_EXECUTOR.shutdown(wait=True)
+        SNAPSHOTS.stop()
+        if STARTED_SUPERVISOR:
+            stop_supervisor()
         sys.exit(0)
     except Exception as e:
         print(f"Error starting server: {e}")
@@ -0,0 +1,317 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Native V4L2 device inventory. Enumerates /dev/video* and queries each node's
+capabilities, pixel formats, frame sizes and frame intervals with ioctl(),
+without shelling out to v4l2-ctl. Results are cached per device node and bus.
+"""
+
+import errno
+import fcntl
+import glob
+import json
+import os
+import re
+import struct
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def _ioc(direction: int, nr: int, size: int) -> int:
+    """Encode a V4L2 ioctl request number ('V' type) like the kernel's _IOC macro."""
+    return (direction << 30) | (size << 16) | (ord('V') << 8) | nr
+
+_IOC_READ, _IOC_READWRITE = 2, 3
+
+# struct v4l2_capability: driver[16] card[32] bus_info[32] version capabilities device_caps reserved[3]
+_CAPABILITY = struct.Struct('=16s32s32sIII3I')
+# struct v4l2_fmtdesc: index type flags description[32] pixelformat mbus_code reserved[3]
+_FMTDESC = struct.Struct('=III32sII3I')
+# struct v4l2_frmsizeenum: index pixel_format type union{discrete, stepwise}[6] reserved[2]
+_FRMSIZE = struct.Struct('=III6I2I')
+# struct v4l2_frmivalenum: index pixel_format width height type union{discrete, stepwise}[6] reserved[2]
+_FRMIVAL = struct.Struct('=IIIII6I2I')
+
+VIDIOC_QUERYCAP = _ioc(_IOC_READ, 0, _CAPABILITY.size)
+VIDIOC_ENUM_FMT = _ioc(_IOC_READWRITE, 2, _FMTDESC.size)
+VIDIOC_ENUM_FRAMESIZES = _ioc(_IOC_READWRITE, 74, _FRMSIZE.size)
+VIDIOC_ENUM_FRAMEINTERVALS = _ioc(_IOC_READWRITE, 75, _FRMIVAL.size)
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_FMT_FLAG_COMPRESSED = 0x0001
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+_CACHE = {}  # (node, bus_info) -> capability dict
+_CACHE_LOCK = threading.Lock()
+
+def _cstr(raw: bytes) -> str:
+    """Decode a NUL-padded C string field."""
+    return raw.split(b'\0', 1)[0].decode(errors='replace')
+
+def fourcc(code: int) -> str:
+    """Convert a V4L2 pixelformat code to its four-character name (e.g. 'MJPG')."""
+    return struct.pack('<I', code).decode('ascii', errors='replace').rstrip()
+
+def _enumerate(fd: int, ioctl, request: int, layout: struct.Struct, fields: tuple) -> list:
+    """
+    Call an ENUM_* ioctl with index 0, 1, 2, ... until the driver returns EINVAL.
+
+    Args:
+        fd: Open device descriptor.
+        ioctl: ioctl implementation (fcntl.ioctl or a mock).
+        request: ioctl request number.
+        layout: Struct describing the argument.
+        fields: Leading fields of the struct after 'index' to fill in.
+
+    Returns:
+        A list of unpacked tuples, one per index.
+    """
+    results = []
+    index = 0
+    while True:
+        buf = bytearray(layout.size)
+        struct.pack_into(f'={1 + len(fields)}I', buf, 0, index, *fields)  # Every leading field is a u32
+        try:
+            ioctl(fd, request, buf)
+        except OSError as e:
+            if e.errno == errno.EINVAL:
+                return results
+            raise
+        results.append(layout.unpack(bytes(buf)))
+        index += 1
+
+def _frame_rates(fd: int, ioctl, pixelformat: int, width: int, height: int) -> dict:
+    """
+    Query the frame intervals a format supports at one size.
+
+    Returns:
+        A dictionary with 'fps' (sorted discrete rates, empty for ranges), 'min_fps' and 'max_fps'.
+    """
+    rates = []
+    low = high = None
+    for entry in _enumerate(fd, ioctl, VIDIOC_ENUM_FRAMEINTERVALS, _FRMIVAL, (pixelformat, width, height)):
+        kind, union = entry[4], entry[5:11]
+        if kind == V4L2_FRMIVAL_TYPE_DISCRETE:
+            num, den = union[0], union[1]
+            if num:
+                rates.append(round(den / num, 3))
+        else:  # Continuous or stepwise: min interval = max fps
+            min_num, min_den, max_num, max_den = union[0:4]
+            if min_num and max_num:
+                high = round(min_den / min_num, 3)
+                low = round(max_den / max_num, 3)
+    rates = sorted(set(rates), reverse=True)
+    if rates:
+        low, high = rates[-1], rates[0]
+    return {'fps': rates, 'min_fps': low, 'max_fps': high}
+
+def probe_device(node: str, ioctl=None, opener=None) -> dict:
+    """
+    Query one V4L2 node's capabilities and capture modes, using the cache when possible.
+
+    The cache is keyed by node and bus_info, so a different camera plugged into the
+    same /dev/videoN is re-probed while repeat calls only cost one VIDIOC_QUERYCAP.
+
+    Args:
+        node: Device path, e.g. '/dev/video0'.
+        ioctl: ioctl implementation taking (fd, request, mutable_buffer); defaults to fcntl.ioctl.
+        opener: Function taking a path and returning a file descriptor; defaults to a
+                non-blocking os.open. Mocks may return any token their ioctl accepts.
+
+    Returns:
+        A capability dictionary: node, driver, card, bus_info, capture (bool) and formats
+        (fourcc -> {'description', 'compressed', 'sizes'}). Each size has width/height
+        (or min/max/step bounds for stepwise devices) plus fps, min_fps and max_fps.
+        On failure, a dictionary with node and error.
+    """
+    ioctl = ioctl or fcntl.ioctl
+    closer = os.close if opener is None else (lambda fd: None)
+    opener = opener or (lambda path: os.open(path, os.O_RDWR | os.O_NONBLOCK))
+    try:
+        fd = opener(node)
+    except OSError as e:
+        return {'node': node, 'error': e.strerror or str(e)}
+    try:
+        buf = bytearray(_CAPABILITY.size)
+        ioctl(fd, VIDIOC_QUERYCAP, buf)
+        driver, card, bus_info, _version, caps, device_caps = _CAPABILITY.unpack(bytes(buf))[:6]
+        if caps & V4L2_CAP_DEVICE_CAPS:
+            caps = device_caps
+        key = (node, _cstr(bus_info))
+        with _CACHE_LOCK:
+            if key in _CACHE:
+                return _CACHE[key]
+        info = {
+            'node': node,
+            'driver': _cstr(driver),
+            'card': _cstr(card),
+            'bus_info': _cstr(bus_info),
+            'capture': bool(caps & V4L2_CAP_VIDEO_CAPTURE),
+            'formats': {},
+        }
+        if info['capture']:
+            for fmt in _enumerate(fd, ioctl, VIDIOC_ENUM_FMT, _FMTDESC, (V4L2_BUF_TYPE_VIDEO_CAPTURE,)):
+                flags, description, pixelformat = fmt[2], fmt[3], fmt[4]
+                sizes = []
+                for size in _enumerate(fd, ioctl, VIDIOC_ENUM_FRAMESIZES, _FRMSIZE, (pixelformat,)):
+                    kind, union = size[2], size[3:9]
+                    if kind == V4L2_FRMSIZE_TYPE_DISCRETE:
+                        width, height = union[0], union[1]
+                        sizes.append({'width': width, 'height': height,
+                                      **_frame_rates(fd, ioctl, pixelformat, width, height)})
+                    else:
+                        min_w, max_w, step_w, min_h, max_h, step_h = union
+                        sizes.append({'min_width': min_w, 'max_width': max_w, 'step_width': step_w or 1,
+                                      'min_height': min_h, 'max_height': max_h, 'step_height': step_h or 1,
+                                      **_frame_rates(fd, ioctl, pixelformat, max_w, max_h)})
+                info['formats'][fourcc(pixelformat)] = {
+                    'description': _cstr(description),
+                    'compressed': bool(flags & V4L2_FMT_FLAG_COMPRESSED),
+                    'sizes': sizes,
+                }
+        with _CACHE_LOCK:
+            _CACHE[key] = info
+        return info
+    except OSError as e:
+        return {'node': node, 'error': e.strerror or str(e)}
+    finally:
+        closer(fd)
+
+def list_nodes() -> list:
+    """Return /dev/video* nodes in numeric order."""
+    return sorted(glob.glob('/dev/video*'), key=lambda p: int(re.sub(r'\D', '', p) or 0))
+
+def inventory(nodes: list = None, refresh: bool = False, ioctl=None, opener=None) -> dict:
+    """
+    Probe every video node in parallel and return the capability table.
+
+    Args:
+        nodes: Device paths to probe; defaults to all /dev/video* nodes.
+        refresh: Drop cached results first.
+        ioctl: ioctl implementation, see probe_device().
+        opener: Device opener, see probe_device().
+
+    Returns:
+        A dictionary of node -> capability dictionary (see probe_device()).
+    """
+    nodes = list_nodes() if nodes is None else list(nodes)
+    if refresh:
+        clear_cache()
+    if not nodes:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(nodes))) as pool:
+        results = pool.map(lambda node: probe_device(node, ioctl, opener), nodes)
+        return dict(zip(nodes, results))
+
+def clear_cache() -> None:
+    """Forget all cached probe results."""
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+def parse_resolution(value: str) -> tuple:
+    """
+    Parse a 'WIDTHxHEIGHT' string.
+
+    Args:
+        value: Resolution such as '1280x720'.
+
+    Returns:
+        A (width, height) tuple of ints.
+
+    Raises:
+        ValueError: If the string is not in WIDTHxHEIGHT form.
+    """
+    m = re.fullmatch(r'\s*(\d+)\s*[xX]\s*(\d+)\s*', str(value))
+    if not m:
+        raise ValueError(f"Resolution '{value}' must look like 1280x720.")
+    return int(m.group(1)), int(m.group(2))
+
+def size_matches(size: dict, width: int, height: int) -> bool:
+    """Return True if a frame-size entry from probe_device() covers width x height."""
+    if 'width' in size:
+        return size['width'] == width and size['height'] == height
+    return (size['min_width'] <= width <= size['max_width'] and (width - size['min_width']) % size['step_width'] == 0
+            and size['min_height'] <= height <= size['max_height'] and (height - size['min_height']) % size['step_height'] == 0)
+
+def supported_modes(caps: dict, framerate: float, resolution: str = None) -> list:
+    """
+    List the formats of a device that can deliver a framerate (and resolution, if given).
+
+    Args:
+        caps: Capability dictionary from probe_device().
+        framerate: Requested frames per second.
+        resolution: Optional 'WIDTHxHEIGHT'.
+
+    Returns:
+        A list of (fourcc, size) tuples that satisfy the request.
+    """
+    wanted = parse_resolution(resolution) if resolution else None
+    modes = []
+    for name, fmt in caps.get('formats', {}).items():
+        for size in fmt['sizes']:
+            if wanted and not size_matches(size, *wanted):
+                continue
+            if size['max_fps'] is not None and float(framerate) > size['max_fps'] + 0.01:
+                continue
+            modes.append((name, size))
+    return modes
+
+def check_mode(caps: dict, framerate: float, resolution: str = None, label: str = 'camera') -> None:
+    """
+    Reject a framerate/resolution the device cannot deliver in any format.
+
+    Devices that could not be probed (or are not V4L2 capture nodes) are not checked.
+
+    Args:
+        caps: Capability dictionary from probe_device().
+        framerate: Requested frames per second.
+        resolution: Optional 'WIDTHxHEIGHT'.
+        label: Name used in the error message (e.g. 'cam0').
+
+    Raises:
+        ValueError: If no format supports the request.
+    """
+    if 'error' in caps or not caps.get('formats'):
+        return
+    if supported_modes(caps, framerate, resolution):
+        return
+    offered = sorted({f"{s['width']}x{s['height']}@{s['max_fps']:g}"
+                      for fmt in caps['formats'].values() for s in fmt['sizes'] if 'width' in s and s['max_fps']})
+    wanted = f"{resolution} at {framerate} fps" if resolution else f"{framerate} fps"
+    raise ValueError(f"{caps['node']} ({caps.get('card', 'unknown')}) cannot capture {wanted} for {label}. "
+                     f"Supported: {', '.join(offered[:12]) or 'none reported'}.")
+
+if __name__ == "__main__":
+    table = inventory()
+    if '--list' in sys.argv:
+        for node, caps in table.items():
+            if caps.get('capture'):
+                print(node)
+    elif '--json' in sys.argv:
+        print(json.dumps(table, indent=2))
+    else:
+        for node, caps in table.items():
+            if 'error' in caps:
+                print(f"{node}: error: {caps['error']}")
+                continue
+            print(f"{node}: {caps['card']} ({caps['driver']}, {caps['bus_info']}){'' if caps['capture'] else ' [no capture]'}")
+            for name, fmt in caps['formats'].items():
+                modes = ', '.join(f"{s['width']}x{s['height']}@{s['max_fps']:g}" for s in fmt['sizes'] if 'width' in s and s['max_fps'])
+                print(f"  {name} ({fmt['description']}): {modes}")
@@ -81,6 +81,18 @@
 
             # Copy Python modules
             install -Dm644 utils.py $out/share/demod-camera-setup/utils.py
+            install -Dm644 jsonc.py $out/share/demod-camera-setup/jsonc.py
+            install -Dm644 devices.py $out/share/demod-camera-setup/devices.py
+            install -Dm644 pipelines.py $out/share/demod-camera-setup/pipelines.py
+            install -Dm644 scheduler.py $out/share/demod-camera-setup/scheduler.py
+            install -Dm644 planner.py $out/share/demod-camera-setup/planner.py
+            install -Dm644 metrics.py $out/share/demod-camera-setup/metrics.py
+            install -Dm644 supervisor.py $out/share/demod-camera-setup/supervisor.py
+            install -Dm644 sharding.py $out/share/demod-camera-setup/sharding.py
+            install -Dm644 abr.py $out/share/demod-camera-setup/abr.py
+            install -Dm644 recording.py $out/share/demod-camera-setup/recording.py
+            install -Dm644 snapshots.py $out/share/demod-camera-setup/snapshots.py
+            install -Dm644 tracing.py $out/share/demod-camera-setup/tracing.py
             install -Dm644 security_checker.py $out/share/demod-camera-setup/security_checker.py
             install -Dm644 config.py $out/share/demod-camera-setup/config.py
 
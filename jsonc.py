@@ -0,0 +1,296 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Single-pass, string-aware JSONC parser. Comments are blanked out in place
+(so line/column positions stay exact) while reading a file object in chunks,
+and the top-level 'cams' array can be consumed one entry at a time.
+"""
+
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+# One lexeme at a time: a run of code (plain text and complete string literals), a
+# line comment, a block comment, or a lone '/'. Anything that can't match yet (an
+# unterminated string or comment at the end of the buffer) waits for more input.
+_LEXEME = re.compile(r'[^"/]+(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"/]*)*|(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"/]*)+'
+                     r'|//[^\n]*\n|/\*.*?\*/|/(?=[^/*])', re.DOTALL)
+_NOT_NEWLINE = re.compile(r'[^\n]+')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+class JSONCError(ValueError):
+    """Raised for malformed JSONC, with 1-based line and column of the problem."""
+    def __init__(self, msg: str, line: int, col: int):
+        super().__init__(f"{msg}: line {line} column {col}")
+        self.msg = msg
+        self.line = line
+        self.col = col
+
+def _position(text: str, pos: int, line: int = 1, col_offset: int = 0) -> tuple:
+    """
+    Convert an offset into text to a (line, column) pair.
+
+    Args:
+        text: Text the offset points into.
+        pos: Offset within text.
+        line: Line number of text[0].
+        col_offset: Characters preceding text[0] on its line.
+
+    Returns:
+        A 1-based (line, column) tuple.
+    """
+    newlines = text.count('\n', 0, pos)
+    if newlines:
+        return line + newlines, pos - text.rfind('\n', 0, pos)
+    return line, col_offset + pos + 1
+
+def strip_comments(fp, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield the text of fp with comments replaced by whitespace of the same shape.
+
+    String literals are passed through untouched, so '//' inside a value such as
+    'rtsp://host/cam' survives. Newlines are kept, so offsets into the output map
+    to the same line and column as the input.
+
+    Args:
+        fp: Text file object (anything with read(size)).
+        chunk_size: Characters to read per call.
+
+    Yields:
+        Comment-free text chunks.
+
+    Raises:
+        JSONCError: If a string or block comment is never terminated.
+    """
+    buf = ''
+    line, col_offset = 1, 0
+    eof = False
+    while not eof:
+        # Read at least as much as is already pending so one long token costs amortized linear time
+        data = fp.read(max(chunk_size, len(buf)))
+        if not data:
+            eof = True
+        buf += data
+        out = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            m = _LEXEME.match(buf, pos)
+            if m is None:
+                break
+            token = m.group()
+            if token[0] == '/' and len(token) > 1:
+                if token[1] == '/':
+                    token = ' ' * (len(token) - 1) + '\n'
+                elif '\n' in token:
+                    token = _NOT_NEWLINE.sub(lambda c: ' ' * len(c.group()), token)
+                else:
+                    token = ' ' * len(token)
+            out.append(token)
+            pos = m.end()
+        if pos < end and eof:
+            if buf[pos] == '"' or buf.startswith('/*', pos):
+                kind = 'string' if buf[pos] == '"' else 'block comment'
+                err_line, err_col = _position(buf, pos, line, col_offset)
+                raise JSONCError(f"Unterminated {kind}", err_line, err_col)
+            # A comment on the last line without a newline, or a stray '/' left for json to reject
+            out.append(' ' * (end - pos) if buf.startswith('//', pos) else buf[pos:])
+            pos = end
+        consumed = buf[:pos]
+        newlines = consumed.count('\n')
+        if newlines:
+            line += newlines
+            col_offset = len(consumed) - consumed.rfind('\n') - 1
+        else:
+            col_offset += len(consumed)
+        buf = buf[pos:]
+        if out:
+            yield ''.join(out)
+
+def loads(text: str) -> object:
+    """
+    Parse a JSONC string.
+
+    Args:
+        text: JSONC document.
+
+    Returns:
+        The decoded value.
+
+    Raises:
+        JSONCError: If the document is invalid.
+    """
+    return _decode_all(strip_comments(_StringReader(text)))
+
+def load(fp, chunk_size: int = CHUNK_SIZE) -> object:
+    """
+    Parse a JSONC document from a text file object.
+
+    Args:
+        fp: Text file object.
+        chunk_size: Characters to read per call.
+
+    Returns:
+        The decoded value.
+
+    Raises:
+        JSONCError: If the document is invalid.
+    """
+    return _decode_all(strip_comments(fp, chunk_size))
+
+def _decode_all(chunks) -> object:
+    """Join comment-free chunks and decode them, mapping errors to JSONCError."""
+    text = ''.join(chunks)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise JSONCError(e.msg, e.lineno, e.colno) from None
+
+class _StringReader:
+    """Minimal read(size) wrapper so strings and files share one code path."""
+    def __init__(self, text: str):
+        self._text = text
+        self._pos = 0
+
+    def read(self, size: int) -> str:
+        data = self._text[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+class _Cursor:
+    """Buffered position over comment-free chunks, tracking line/column of dropped text."""
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self._line = 1
+        self._col_offset = 0
+
+    def fill(self) -> bool:
+        """Append at least as much input as is pending; return False at end of input."""
+        if self.eof:
+            return False
+        pending = len(self.buf) - self.pos
+        if self.pos > CHUNK_SIZE:  # Drop consumed text so memory stays bounded
+            dropped = self.buf[:self.pos]
+            newlines = dropped.count('\n')
+            if newlines:
+                self._line += newlines
+                self._col_offset = len(dropped) - dropped.rfind('\n') - 1
+            else:
+                self._col_offset += len(dropped)
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        added = 0
+        parts = [self.buf]
+        while added <= pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                break
+            parts.append(chunk)
+            added += len(chunk)
+        self.buf = ''.join(parts)
+        return added > 0
+
+    def error(self, msg: str, pos: int = None) -> JSONCError:
+        """Build a JSONCError for an offset in the current buffer."""
+        line, col = _position(self.buf, self.pos if pos is None else pos, self._line, self._col_offset)
+        return JSONCError(msg, line, col)
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        """Consume the next non-whitespace character, which must be one of chars."""
+        c = self.peek()
+        if not c or c not in chars:
+            raise self.error(f"Expecting {' or '.join(repr(x) for x in chars)}")
+        self.pos += 1
+        return c
+
+    def value(self) -> object:
+        """Decode one complete JSON value at the cursor."""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer, or cut off before its fraction or
+                # exponent ('-2' of '-2.5e3'), may continue in the next chunk
+                if self.eof or (end < len(self.buf) and self.buf[end] not in '.eE'):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise self.error(e.msg, e.pos) from None
+            self.fill()
+
+def iter_cams(fp, settings: dict = None, chunk_size: int = CHUNK_SIZE):
+    """
+    Yield entries of the top-level 'cams' array as they are parsed.
+
+    Only the current entry is held in memory, so callers can validate and
+    generate output before the rest of the file has been read.
+
+    Args:
+        fp: Text file object containing a JSONC object.
+        settings: Optional dict that receives every other top-level key
+                  (complete once the generator is exhausted).
+        chunk_size: Characters to read per call.
+
+    Yields:
+        Each camera dictionary in order.
+
+    Raises:
+        JSONCError: If the document is invalid, with line and column.
+    """
+    cur = _Cursor(strip_comments(fp, chunk_size))
+    cur.expect('{')
+    if cur.peek() == '}':
+        cur.pos += 1
+        return
+    while True:
+        if cur.peek() != '"':
+            raise cur.error("Expecting property name enclosed in double quotes")
+        key = cur.value()
+        cur.expect(':')
+        if key == 'cams':
+            if cur.peek() != '[':
+                raise cur.error("'cams' must be an array")
+            cur.pos += 1
+            if cur.peek() == ']':
+                cur.pos += 1
+            else:
+                while True:
+                    yield cur.value()
+                    if cur.expect(',]') == ']':
+                        break
+        else:
+            value = cur.value()
+            if settings is not None:
+                settings[key] = value
+        if cur.expect(',}') == '}':
+            break
+    if cur.peek():
+        raise cur.error("Extra data")
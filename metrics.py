@@ -0,0 +1,285 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Stream metrics collector. Reads the -progress reports each encoder sends to a
+local UDP port, samples the encoder processes' CPU and memory from /proc, and
+renders everything in the Prometheus text format for the /metrics endpoint.
+"""
+
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+
+from pipelines import progress_url
+from sharding import instances
+from utils import split_yml
+
+PROC_INTERVAL = 5.0  # Seconds between /proc samples of the encoder processes
+STALE_SECONDS = 10.0  # A stream with no progress report for this long is reported down
+_PROGRESS_PORT = re.compile(r'-progress udp://127\.0\.0\.1:(\d+)')
+_CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# (name, type, help, progress key or None) in output order
+_STREAM_METRICS = (
+    ('demod_stream_up', 'gauge', 'Whether the encoder reported progress recently.', None),
+    ('demod_stream_fps', 'gauge', 'Encoder output frames per second.', 'fps'),
+    ('demod_stream_bitrate_bits_per_second', 'gauge', 'Encoder output bitrate.', 'bitrate'),
+    ('demod_stream_speed', 'gauge', 'Encoding speed relative to realtime.', 'speed'),
+    ('demod_stream_frames_total', 'counter', 'Frames encoded since the encoder started.', 'frame'),
+    ('demod_stream_dup_frames_total', 'counter', 'Frames duplicated to keep the output rate.', 'dup_frames'),
+    ('demod_stream_drop_frames_total', 'counter', 'Input frames dropped by the encoder.', 'drop_frames'),
+    ('demod_encoder_cpu_seconds_total', 'counter', 'CPU time used by the encoder process.', None),
+    ('demod_encoder_resident_memory_bytes', 'gauge', 'Resident memory of the encoder process.', None),
+)
+
+def parse_progress(block: str) -> dict:
+    """
+    Parse one ffmpeg -progress report (key=value lines) into numbers.
+
+    Args:
+        block: Report text; values ffmpeg reports as N/A are skipped.
+
+    Returns:
+        A dictionary with any of 'frame', 'fps', 'bitrate' (bits/s), 'speed',
+        'dup_frames', 'drop_frames' and 'progress' ('continue' or 'end').
+    """
+    values = {}
+    for line in block.splitlines():
+        key, sep, value = line.partition('=')
+        value = value.strip()
+        if not sep or value == 'N/A':
+            continue
+        try:
+            if key in ('frame', 'dup_frames', 'drop_frames'):
+                values[key] = int(value)
+            elif key == 'fps':
+                values[key] = float(value)
+            elif key == 'bitrate' and value.endswith('kbits/s'):
+                values[key] = float(value[:-7]) * 1000
+            elif key == 'speed' and value.endswith('x'):
+                values[key] = float(value[:-1])
+            elif key == 'progress':
+                values[key] = value
+        except ValueError:
+            continue
+    return values
+
+def _number(value) -> str:
+    """Format a sample value exactly (6.0 -> '6', 29.97 -> '29.97')."""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def _read_proc(pid: int) -> tuple:
+    """Return (cpu_seconds, rss_bytes) for a process, or None if it is gone."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rpartition(')')[2].split()
+        with open(f'/proc/{pid}/statm') as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime and stime are fields 14 and 15; fields[0] here is field 3 (state)
+    return (int(fields[11]) + int(fields[12])) / _CLK_TCK, rss_pages * _PAGE_SIZE
+
+def _cmdline(pid: int) -> bytes:
+    """Return a process's raw command line, or b'' if it is gone."""
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            return f.read()
+    except OSError:
+        return b''
+
+def _find_pids(urls: list) -> dict:
+    """Map each progress URL to the PID of the ffmpeg using it, in one pass over /proc."""
+    wanted = {url.encode(): url for url in urls}
+    found = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        cmdline = _cmdline(int(entry))
+        # The supervisor worker carries the same URL in its arguments; only ffmpeg counts
+        if not cmdline.split(b'\0', 1)[0].endswith(b'ffmpeg'):
+            continue
+        for needle, url in wanted.items():
+            if needle in cmdline:
+                found[url] = int(entry)
+    return found
+
+class MetricsCollector:
+    """
+    Collects encoder metrics on one background thread.
+
+    One selector thread owns a UDP socket per watched encoder and parses reports as they
+    arrive; it also samples /proc every PROC_INTERVAL seconds. Request handlers only call
+    render(), which copies the latest values under a lock, so a scrape never waits on I/O.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wanted = {}  # path name -> port
+        self._streams = {}  # path name -> latest values
+        self._thread = None
+
+    def start(self) -> None:
+        """Start the collector thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+            self._thread.start()
+
+    def watch(self, ports: dict) -> None:
+        """
+        Set the encoders to collect from; the thread rebinds sockets on its next tick.
+
+        Args:
+            ports: Dictionary of path name -> progress UDP port.
+        """
+        with self._lock:
+            self._wanted = dict(ports)
+            self._streams = {name: self._streams.get(name, {}) for name in ports}
+
+    def watch_yml(self, yml_paths: list = None) -> None:
+        """
+        Watch every path in the generated MediaMTX configs that reports -progress.
+
+        Args:
+            yml_paths: Configs to read; defaults to every instance's (see sharding.instances()).
+        """
+        ports = {}
+        for yml_path in yml_paths or instances().values():
+            try:
+                with open(yml_path) as f:
+                    _header, blocks = split_yml(f.read())
+            except OSError:
+                continue
+            for name, block in blocks.items():
+                m = _PROGRESS_PORT.search(block)
+                if m:
+                    ports[name.split('/')[0]] = int(m.group(1))  # One encoder serves all of a camera's renditions
+        self.watch(ports)
+
+    def snapshot(self) -> dict:
+        """Return a copy of the latest values per path name."""
+        with self._lock:
+            return {name: dict(values) for name, values in self._streams.items()}
+
+    def render(self, extra: dict = None) -> str:
+        """
+        Render the latest values in the Prometheus text exposition format.
+
+        Args:
+            extra: Additional unlabelled gauges (name -> value), e.g. demod_mediamtx_up.
+
+        Returns:
+            The /metrics response body.
+        """
+        streams = self.snapshot()
+        now = time.monotonic()
+        lines = []
+        for name, value in (extra or {}).items():
+            lines += [f'# TYPE {name} gauge', f'{name} {_number(value)}']
+        for metric, kind, help_text, key in _STREAM_METRICS:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+            for cam, values in sorted(streams.items()):
+                if metric == 'demod_stream_up':
+                    up = values.get('progress') == 'continue' and now - values.get('updated', -STALE_SECONDS) < STALE_SECONDS
+                    value = 1 if up else 0
+                elif metric == 'demod_encoder_cpu_seconds_total':
+                    value = values.get('cpu_seconds')
+                elif metric == 'demod_encoder_resident_memory_bytes':
+                    value = values.get('rss_bytes')
+                else:
+                    value = values.get(key)
+                if value is not None:
+                    lines.append(f'{metric}{{cam="{cam}"}} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _run(self) -> None:
+        selector = selectors.DefaultSelector()
+        bound = {}  # port -> (socket, path name)
+        pids = {}  # path name -> pid
+        buffers = {}  # port -> partial report text
+        next_sample = 0.0
+        while True:
+            with self._lock:
+                wanted = {port: name for name, port in self._wanted.items()}
+            for port in [p for p in bound if wanted.get(p) != bound[p][1]]:
+                selector.unregister(bound[port][0])
+                bound.pop(port)[0].close()
+                buffers.pop(port, None)
+            for port, name in wanted.items():
+                if port not in bound:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    try:
+                        sock.bind(('127.0.0.1', port))
+                    except OSError:
+                        sock.close()
+                        continue
+                    sock.setblocking(False)
+                    selector.register(sock, selectors.EVENT_READ, port)
+                    bound[port] = (sock, name)
+            if not bound:
+                time.sleep(1.0)
+                events = []
+            else:
+                events = selector.select(timeout=1.0)
+            for key, _mask in events:
+                port = key.data
+                try:
+                    data = key.fileobj.recv(65536).decode(errors='replace')
+                except OSError:
+                    continue
+                text = buffers.get(port, '') + data
+                # A report ends with its progress= line; keep anything after it for the next one
+                end = text.rfind('progress=')
+                end = text.find('\n', end) if end != -1 else -1
+                if end == -1:
+                    buffers[port] = text[-65536:]
+                    continue
+                buffers[port] = text[end + 1:]
+                report = text[:end + 1]
+                start = report.rfind('\nframe=')  # Only the newest report if several arrived
+                values = parse_progress(report[start + 1:])
+                values['updated'] = time.monotonic()
+                with self._lock:
+                    if bound[port][1] in self._streams:
+                        self._streams[bound[port][1]].update(values)
+            if time.monotonic() >= next_sample:
+                next_sample = time.monotonic() + PROC_INTERVAL
+                self._sample_processes({name: port for port, (_sock, name) in bound.items()}, pids)
+
+    def _sample_processes(self, ports: dict, pids: dict) -> None:
+        urls = {name: progress_url(port) for name, port in ports.items()}
+        # Cached PIDs are re-checked against their command line in case one was recycled
+        for name in [n for n in pids if n not in urls or urls[n].encode() not in _cmdline(pids[n])]:
+            del pids[name]
+        missing = [url for name, url in urls.items() if name not in pids]
+        if missing:
+            found = _find_pids(missing)
+            pids.update({name: found[url] for name, url in urls.items() if url in found})
+        for name, pid in pids.items():
+            stats = _read_proc(pid)
+            if stats is None:
+                continue
+            with self._lock:
+                if name in self._streams:
+                    self._streams[name]['cpu_seconds'], self._streams[name]['rss_bytes'] = stats
+
+COLLECTOR = MetricsCollector()
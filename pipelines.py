@@ -0,0 +1,227 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Encode pipeline selection for camera paths. Picks the cheapest ffmpeg pipeline a
+camera's advertised formats allow and builds the runOnInit command for it.
+"""
+
+import re
+
+from devices import supported_modes
+
+# Pipelines a camera's 'pipeline' field may request:
+#   auto  - choose from the device's formats (copy > mjpeg > raw > x264)
+#   copy  - camera outputs H.264; stream it without decoding or re-encoding
+#   mjpeg - capture MJPEG (cheap to decode) and encode with libx264
+#   raw   - capture an uncompressed format x264 can take with little or no conversion
+#   x264  - the original pipeline: driver's default format, full convert + encode
+PIPELINES = ('auto', 'copy', 'mjpeg', 'raw', 'x264')
+
+# V4L2 fourcc -> ffmpeg -input_format name
+INPUT_FORMATS = {'H264': 'h264', 'MJPG': 'mjpeg', 'YU12': 'yuv420p', 'NV12': 'nv12', 'YUYV': 'yuyv422', 'UYVY': 'uyvy422'}
+# Raw formats by preference, with the -pix_fmt handed to libx264 (native formats need no conversion)
+RAW_FORMATS = (('YU12', 'yuv420p'), ('NV12', 'nv12'), ('YUYV', 'yuv420p'), ('UYVY', 'yuv420p'))
+# cam{i}'s encoder reports -progress to UDP port PROGRESS_BASE_PORT + i (read by metrics.py)
+PROGRESS_BASE_PORT = 18100
+
+# Latency profiles a camera's 'latency_profile' field may select. Without one the encoder
+# keeps x264's defaults (250-frame GOP, frame threading) and MediaMTX its default queue.
+#   realtime - zerolatency tune, 0.5 s GOP, no input buffering; drops rather than queues
+#   balanced - no B-frames, 2 s GOP, short input queue
+#   quality  - veryfast preset with B-frames and lookahead, 4 s GOP, deep queues
+LATENCY_PROFILES = {
+    'realtime': {'preset': 'ultrafast', 'tune': 'zerolatency', 'gop_seconds': 0.5, 'bframes': 0,
+                 'input': ['-fflags', 'nobuffer', '-flags', 'low_delay', '-thread_queue_size', '4'],
+                 'write_queue_size': 64},
+    'balanced': {'preset': 'ultrafast', 'tune': None, 'gop_seconds': 2, 'bframes': 0,
+                 'input': ['-thread_queue_size', '16'], 'write_queue_size': 256},
+    'quality': {'preset': 'veryfast', 'tune': None, 'gop_seconds': 4, 'bframes': 2,
+                'input': ['-thread_queue_size', '64'], 'write_queue_size': 1024},
+}
+RENDITION_NAME = re.compile(r'^[A-Za-z0-9_-]+$')  # Becomes the last part of the path, e.g. cam0/high
+
+def progress_url(port: int) -> str:
+    """Return the -progress URL for an encoder reporting to the given local UDP port."""
+    return f'udp://127.0.0.1:{port}'
+
+def parse_bitrate(value) -> int:
+    """
+    Parse an ffmpeg-style bitrate ('800k', '2M', '1500000') into bits per second.
+
+    Args:
+        value: Bitrate string or number.
+
+    Returns:
+        Bits per second.
+
+    Raises:
+        ValueError: If the value is not a bitrate.
+    """
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kKmMgG]?)\s*', str(value))
+    if not m:
+        raise ValueError(f"Bitrate '{value}' must look like 800k or 2M.")
+    scale = {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9}[m.group(2).lower()]
+    return int(float(m.group(1)) * scale)
+
+def format_bitrate(bps: int) -> str:
+    """Format bits per second the way cams entries write them (e.g. 640000 -> '640k')."""
+    if bps >= 1_000_000 and bps % 100_000 == 0:
+        return f"{bps / 1e6:g}M"
+    return f"{max(1, round(bps / 1000))}k"
+
+def select_pipeline(cam: dict, caps: dict, label: str = 'camera') -> dict:
+    """
+    Choose the encode pipeline for a camera from its 'pipeline' field and capabilities.
+
+    Args:
+        cam: Camera dictionary (framerate, optional resolution and pipeline).
+        caps: Capability dictionary from devices.probe_device(), or None if the
+              device is not a probed V4L2 node.
+        label: Name used in error messages (e.g. 'cam0').
+
+    Returns:
+        A dictionary with 'pipeline', 'input_format' (ffmpeg name or None) and
+        'pix_fmt' (for encoding pipelines).
+
+    Raises:
+        ValueError: If the requested pipeline is unknown or the device lacks the format it needs.
+    """
+    requested = cam.get('pipeline', 'auto')
+    if requested not in PIPELINES:
+        raise ValueError(f"Pipeline '{requested}' for {label} must be one of: {', '.join(PIPELINES)}.")
+    known = bool(caps) and 'error' not in caps and bool(caps.get('formats'))
+    if requested == 'x264' or (requested == 'auto' and not known):
+        return {'pipeline': 'x264', 'input_format': None, 'pix_fmt': 'yuv420p'}
+    available = {name for name, _size in supported_modes(caps, cam.get('framerate', 30), cam.get('resolution'))} if known else set()
+
+    def need(fourcc: str) -> None:
+        if known and fourcc not in available:
+            raise ValueError(f"Pipeline '{requested}' for {label} needs {fourcc} capture, which "
+                             f"{caps['node']} does not offer at the requested mode (has: {', '.join(sorted(available)) or 'none'}).")
+
+    if requested == 'copy' or (requested == 'auto' and 'H264' in available):
+        need('H264')
+        return {'pipeline': 'copy', 'input_format': INPUT_FORMATS['H264'], 'pix_fmt': None}
+    if requested == 'mjpeg' or (requested == 'auto' and 'MJPG' in available):
+        need('MJPG')
+        return {'pipeline': 'mjpeg', 'input_format': INPUT_FORMATS['MJPG'], 'pix_fmt': 'yuv420p'}
+    for fourcc, pix_fmt in RAW_FORMATS:
+        if fourcc in available or (not known and fourcc == 'YUYV'):
+            return {'pipeline': 'raw', 'input_format': INPUT_FORMATS[fourcc], 'pix_fmt': pix_fmt}
+    if requested == 'raw':
+        need('YUYV')
+    return {'pipeline': 'x264', 'input_format': None, 'pix_fmt': 'yuv420p'}
+
+def rendition_graph(renditions: list, capture_fps) -> tuple:
+    """
+    Build a -filter_complex graph that splits input 0 into one output per rendition.
+
+    Args:
+        renditions: Validated renditions (name, optional resolution 'WxH' and framerate).
+        capture_fps: Capture framerate; an fps filter is added only for renditions below it.
+
+    Returns:
+        A (graph, labels) tuple; labels[k] is the -map label for renditions[k].
+    """
+    chains = [f"[0:v]split={len(renditions)}" + ''.join(f'[s{k}]' for k in range(len(renditions)))]
+    labels = []
+    for k, rendition in enumerate(renditions):
+        filters = []
+        if rendition.get('resolution'):
+            filters.append('scale=' + rendition['resolution'].replace('x', ':'))
+        if rendition.get('framerate') and int(rendition['framerate']) != int(capture_fps):
+            filters.append(f"fps={rendition['framerate']}")
+        if filters:
+            chains.append(f"[s{k}]{','.join(filters)}[v{k}]")
+            labels.append(f'[v{k}]')
+        else:
+            labels.append(f'[s{k}]')
+    return ';'.join(chains), labels
+
+def latency_args(profile: str, fps) -> list:
+    """
+    Return the libx264 options a latency profile adds for an output at fps.
+
+    Args:
+        profile: Key of LATENCY_PROFILES, or None for x264's defaults.
+        fps: Output framerate, used to size the GOP.
+
+    Returns:
+        A list of ffmpeg arguments (empty without a profile).
+    """
+    if not profile:
+        return []
+    settings = LATENCY_PROFILES[profile]
+    parts = ['-tune', settings['tune']] if settings['tune'] else []
+    return parts + ['-g', str(max(1, round(float(fps) * settings['gop_seconds']))), '-bf', str(settings['bframes'])]
+
+def encode_args(pix_fmt: str, bitrate, threads: int = None, profile: str = None, fps=30) -> list:
+    """Return the libx264 output options shared by single and multi-rendition encoders."""
+    preset = LATENCY_PROFILES[profile]['preset'] if profile else 'ultrafast'
+    parts = ['-c:v', 'libx264', '-pix_fmt', pix_fmt, '-preset', preset] + latency_args(profile, fps) + ['-b:v', str(bitrate)]
+    if threads:
+        parts += ['-threads', str(threads)]
+    return parts
+
+def build_ffmpeg_command(path: str, cam: dict, choice: dict, slot: dict = None) -> str:
+    """
+    Build the runOnInit ffmpeg command that captures a camera and publishes it to MediaMTX.
+
+    The capture format and size are requested explicitly so ffmpeg does not fall back to
+    the driver's default mode and convert it. Bitrate does not apply to 'copy'. A camera
+    with renditions is captured and decoded once, split with -filter_complex, and each
+    rendition is encoded to its own path ('{path}/{name}'); this always re-encodes.
+
+    Args:
+        path: MediaMTX path name to publish to (e.g. 'cam0').
+        cam: Validated camera dictionary (device, framerate, bitrate, optional resolution,
+             renditions, latency_profile and progress_port).
+        choice: Result of select_pipeline().
+        slot: CPU allocation from scheduler.allocate(); sets the encoder's -threads.
+
+    Returns:
+        The command line as a single string.
+    """
+    parts = ['ffmpeg']
+    if cam.get('progress_port'):
+        parts += ['-progress', progress_url(cam['progress_port'])]
+    profile = cam.get('latency_profile')
+    if profile:
+        parts += LATENCY_PROFILES[profile]['input']
+    parts += ['-f', 'v4l2']
+    if choice['input_format']:
+        parts += ['-input_format', choice['input_format']]
+    parts += ['-framerate', str(cam['framerate'])]
+    if cam.get('resolution'):
+        parts += ['-video_size', cam['resolution']]
+    parts += ['-i', cam['device']]
+    renditions = cam.get('renditions')
+    if renditions:
+        graph, labels = rendition_graph(renditions, cam['framerate'])
+        parts += ['-filter_complex', f"'{graph}'"]
+        threads = max(1, slot['threads'] // len(renditions)) if slot else None
+        for rendition, label in zip(renditions, labels):
+            parts += ['-map', f"'{label}'"]
+            parts += encode_args(choice['pix_fmt'] or 'yuv420p', rendition['bitrate'], threads, profile, rendition['framerate'])
+            parts += ['-f', 'rtsp', f"rtsp://localhost:$RTSP_PORT/{path}/{rendition['name']}"]
+        return ' '.join(parts)
+    if choice['pipeline'] == 'copy':
+        parts += ['-c:v', 'copy']
+    else:
+        parts += encode_args(choice['pix_fmt'], cam['bitrate'], slot['threads'] if slot else None, profile, cam['framerate'])
+    parts += ['-f', 'rtsp', f'rtsp://localhost:$RTSP_PORT/{path}']
+    return ' '.join(parts)
@@ -0,0 +1,260 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Capacity planner and admission control. Estimates the CPU, memory and uplink
+bandwidth a camera set needs, compares it with the host's measured capacity,
+and proposes downscaled settings when it does not fit.
+"""
+
+import json
+import os
+import platform
+import threading
+import time
+
+from pipelines import format_bitrate, parse_bitrate
+from scheduler import PIPELINE_COST, PRESET_COST, available_cpus
+from tracing import run_streaming
+from utils import encode_cost, parse_resolution, stream_bitrate, validate_cam, DEFAULT_RESOLUTION
+
+CALIBRATION_PATH = '.demod_calibration.json'
+CALIBRATION_SECONDS = 3
+TARGET_UTILIZATION = 0.8  # Plan to at most 80% of CPU, memory and uplink
+FALLBACK_CORE_CAPACITY = 40.0  # Cost units per core when ffmpeg can't be benchmarked
+MIN_FRAMERATE = 5
+ENCODER_BASE_MEMORY = 40 * 1024 * 1024  # ffmpeg process overhead
+ENCODER_FRAME_BUFFERS = 8  # Frames held by capture + ultrafast encoder
+MEDIAMTX_MEMORY = 60 * 1024 * 1024
+_CALIBRATION = None  # This process's calibration, once measured or loaded
+_CALIBRATION_LOCK = threading.Lock()  # One benchmark at a time; later callers get its result
+
+def _host_fingerprint() -> dict:
+    """Identify the host so a calibration from different hardware is not reused."""
+    try:
+        version = run_streaming(['ffmpeg', '-version'], timeout=10)['output'].split('\n', 1)[0]
+    except OSError:
+        version = None
+    return {'machine': platform.machine(), 'cpus': len(available_cpus()), 'ffmpeg': version}
+
+def calibrate(force: bool = False, path: str = CALIBRATION_PATH, seconds: int = CALIBRATION_SECONDS) -> dict:
+    """
+    Measure how much encoding one CPU core sustains, caching the result on disk and in memory.
+
+    Runs a short single-threaded libx264 ultrafast encode of a synthetic lavfi source
+    and converts the CPU time it used into scheduler cost units per core. A failed
+    benchmark is cached too, so it is not retried until the hardware or ffmpeg changes.
+    Servers should call calibrate_in_background() at startup and plan with
+    current_capacity(), so no request waits for the benchmark.
+
+    Args:
+        force: Re-run the benchmark even if a cached result matches this host.
+        path: Cache file.
+        seconds: Length of the synthetic clip.
+
+    Returns:
+        A dictionary with 'core_capacity' (cost units per core), 'cpus', 'measured' (False
+        when ffmpeg was unavailable or failed and a conservative default was used) and 'fingerprint'.
+    """
+    global _CALIBRATION
+    with _CALIBRATION_LOCK:
+        if _CALIBRATION and not force:
+            return _CALIBRATION
+        fingerprint = _host_fingerprint()
+        if not force and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    cached = json.load(f)
+                if cached.get('fingerprint') == fingerprint:
+                    _CALIBRATION = cached
+                    return cached
+            except (OSError, ValueError):
+                pass
+        result = {'core_capacity': FALLBACK_CORE_CAPACITY, 'cpus': fingerprint['cpus'], 'measured': False,
+                  'fingerprint': fingerprint, 'timestamp': int(time.time())}
+        if fingerprint['ffmpeg']:
+            width, height, rate = 640, 480, 30
+            run = run_streaming(['ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'error',
+                                 '-f', 'lavfi', '-i', f'testsrc=size={width}x{height}:rate={rate}', '-t', str(seconds),
+                                 '-c:v', 'libx264', '-preset', 'ultrafast', '-threads', '1', '-f', 'null', '-'],
+                                timeout=seconds * 20)
+            if run['exit'] == 0 and not run['timed_out'] and run['cpu'] > 0:
+                megapixels_per_cpu_second = width * height * rate * seconds / 1e6 / run['cpu']
+                result['core_capacity'] = round(megapixels_per_cpu_second * PRESET_COST['ultrafast'] * PIPELINE_COST['raw'], 2)
+                result['measured'] = True
+        try:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2)
+        except OSError:
+            pass
+        _CALIBRATION = result
+        return result
+
+def calibrate_in_background() -> None:
+    """Run calibrate() on a daemon thread."""
+    threading.Thread(target=calibrate, name='calibrate', daemon=True).start()
+
+def current_capacity() -> dict:
+    """
+    Return this process's calibration without running anything.
+
+    Returns:
+        calibrate()'s result once it has finished, else the conservative default with
+        'measured' False and 'pending' True.
+    """
+    return _CALIBRATION or {'core_capacity': FALLBACK_CORE_CAPACITY, 'cpus': len(available_cpus()), 'measured': False,
+                            'pending': True, 'fingerprint': None}
+
+def available_memory() -> int:
+    """Return MemAvailable from /proc/meminfo in bytes (0 if unknown)."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def estimate(spec: dict) -> dict:
+    """
+    Estimate the resources one validated camera needs.
+
+    Args:
+        spec: Result of utils.validate_cam().
+
+    Returns:
+        A dictionary with 'cpu' (cost units), 'memory' (bytes) and 'bandwidth' (bits/s).
+    """
+    width, height = parse_resolution(spec['resolution']) if spec.get('resolution') else DEFAULT_RESOLUTION
+    if spec.get('renditions'):  # One set of capture buffers, then buffers per encode
+        sizes = [parse_resolution(r['resolution']) if r['resolution'] else (width, height) for r in spec['renditions']]
+        pixels = width * height + sum(w * h for w, h in sizes)
+    else:
+        pixels = 0 if spec['choice']['pipeline'] == 'copy' else width * height
+    return {
+        'cpu': encode_cost(spec),
+        'memory': ENCODER_BASE_MEMORY + int(pixels * 1.5 * ENCODER_FRAME_BUFFERS),
+        'bandwidth': stream_bitrate(spec),
+    }
+
+def plan(cams: list, settings: dict = None, capacity: dict = None, specs: list = None) -> dict:
+    """
+    Check whether a camera set fits the host and propose downscaled settings if not.
+
+    Args:
+        cams: Camera dictionaries as written in JSONC.
+        settings: Top-level JSONC settings; 'uplink' (e.g. '20M') enables the bandwidth check.
+        capacity: Result of calibrate(); measured (or loaded from cache) when omitted.
+        specs: validate_cam() results for cams, when the caller already has them.
+
+    Returns:
+        A dictionary with 'ok', 'need' and 'limit' (cpu/memory/bandwidth totals; a limit of
+        None is not checked), 'per_cam' estimates, 'proposed_cams' (the cams with
+        framerate/bitrate reduced to fit, or None when the set already fits) and
+        'proposal_fits'. A proposal is estimated again: 'proposed_need' holds its totals
+        and 'proposal_short' the limits it still exceeds ('memory' never improves with
+        framerate, and 'cpu' can stay short at MIN_FRAMERATE).
+
+    Raises:
+        ValueError: If a camera fails validation.
+    """
+    settings = settings or {}
+    capacity = capacity or calibrate()
+    if specs is None:
+        specs = [validate_cam(i, cam) for i, cam in enumerate(cams)]
+    per_cam = {spec['name']: estimate(spec) for spec in specs}
+    need = {key: sum(e[key] for e in per_cam.values()) for key in ('cpu', 'memory', 'bandwidth')}
+    need['memory'] += MEDIAMTX_MEMORY
+    cpus = len(available_cpus())
+    memory = available_memory()
+    uplink = settings.get('uplink')
+    limit = {
+        'cpu': capacity['core_capacity'] * cpus * TARGET_UTILIZATION,
+        'memory': int(memory * TARGET_UTILIZATION) if memory else None,
+        'bandwidth': int(parse_bitrate(uplink) * TARGET_UTILIZATION) if uplink else None,
+    }
+    factors = {key: min(1.0, limit[key] / need[key]) for key in need if limit[key] and need[key]}
+    ok = all(f >= 1.0 for f in factors.values())
+    report = {'ok': ok, 'need': need, 'limit': limit, 'per_cam': per_cam, 'measured': capacity['measured'],
+              'calibrating': capacity.get('pending', False), 'proposed_cams': None, 'proposal_fits': ok}
+    if not ok:
+        # Only CPU follows the framerate; memory depends on the cameras and their resolutions
+        cpu_factor = factors.get('cpu', 1.0)
+        proposed, proposed_specs = [], []
+        for cam, spec in zip(cams, specs):
+            framerate = int(spec['framerate'])
+            cost = per_cam[spec['name']]['cpu']
+            new_rate = min(framerate, max(MIN_FRAMERATE, int(framerate * cpu_factor))) if cost > 0.1 else framerate
+            # Keep bits per frame when the framerate drops, and cut further if the uplink is short
+            bitrate = parse_bitrate(spec['bitrate'])
+            new_bitrate = format_bitrate(int(bitrate * min(new_rate / framerate, factors.get('bandwidth', 1.0))))
+            changes = {'framerate': new_rate, 'bitrate': new_bitrate}
+            spec_changes = dict(changes)
+            if spec['renditions']:
+                changes['renditions'], spec_changes['renditions'] = [], []
+                for original, rendition in zip(cam['renditions'], spec['renditions']):
+                    rate = min(rendition['framerate'], new_rate)
+                    scale = min(rate / rendition['framerate'], factors.get('bandwidth', 1.0))
+                    reduced = {'framerate': rate, 'bitrate': format_bitrate(int(parse_bitrate(rendition['bitrate']) * scale))}
+                    changes['renditions'].append(dict(original, **reduced))
+                    spec_changes['renditions'].append(dict(rendition, **reduced))
+            proposed.append(dict(cam, **changes))
+            proposed_specs.append(dict(spec, **spec_changes))
+        proposed_need = {key: sum(estimate(spec)[key] for spec in proposed_specs) for key in ('cpu', 'memory', 'bandwidth')}
+        proposed_need['memory'] += MEDIAMTX_MEMORY
+        report['proposed_cams'] = proposed
+        report['proposed_need'] = proposed_need
+        # MIN_FRAMERATE can keep a large set over the CPU limit, and nothing here lowers memory;
+        # then cameras or resolutions have to go
+        report['proposal_short'] = [key for key in ('cpu', 'memory', 'bandwidth')
+                                    if limit[key] and proposed_need[key] > limit[key]]
+        report['proposal_fits'] = not report['proposal_short']
+    return report
+
+def describe_plan(report: dict) -> str:
+    """
+    Summarize a plan() report for the TUI and web UI.
+
+    Args:
+        report: Result of plan().
+
+    Returns:
+        A multi-line description; for rejected sets it ends with the proposed cams as JSON.
+    """
+    need, limit = report['need'], report['limit']
+    note = ('' if report['measured'] else ' (estimated; calibration still running)' if report.get('calibrating')
+            else ' (estimated; install ffmpeg to calibrate)')
+    lines = [f"CPU: {need['cpu']:.1f} of {limit['cpu']:.1f} units{note}"]
+    if limit['memory']:
+        lines.append(f"Memory: {need['memory'] // 2**20} of {limit['memory'] // 2**20} MiB")
+    if limit['bandwidth']:
+        lines.append(f"Uplink: {format_bitrate(need['bandwidth'])} of {format_bitrate(limit['bandwidth'])}")
+    if report['ok']:
+        lines.append("Capacity check passed.")
+    else:
+        lines.append("Capacity check failed: this camera set would overload the host.")
+        short = report.get('proposal_short', [])
+        if 'memory' in short:
+            lines.append("There is not enough memory for these cameras at any framerate; remove cameras or lower "
+                         "resolutions. Settings for the other limits:")
+        elif short:
+            lines.append(f"Even at {MIN_FRAMERATE} fps the set does not fit; remove cameras or lower resolutions. "
+                         "Closest settings:")
+        else:
+            lines.append("Proposed settings:")
+        lines.append(json.dumps({'cams': report['proposed_cams']}, indent=2))
+    return '\n'.join(lines)
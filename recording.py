@@ -0,0 +1,378 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Segmented recording with an indexed retention engine.
+
+MediaMTX records each camera in fixed-duration segments and, when a segment is
+complete, runs this module's 'index' command, which adds it to a SQLite index and
+enforces the per-camera and global byte/age quotas. Triggers keep running byte
+totals per path, so quota checks, time-range lookups and deleting the oldest
+segments are index lookups, never directory scans.
+
+Usage: python3 recording.py index <path> <file> [duration]   # runOnRecordSegmentComplete hook
+       python3 recording.py enforce                          # Apply quotas now (e.g. from cron)
+       python3 recording.py query [path] [--start T] [--end T]
+       python3 recording.py reindex                          # Rebuild the index from disk
+"""
+
+import os
+import re
+import shlex
+import sys
+import time
+
+RECORD_DIR = 'recordings'
+INDEX_PATH = os.path.join(RECORD_DIR, 'index.db')
+SEGMENT_NAME = '%Y-%m-%d_%H-%M-%S-%f'  # MediaMTX recordPath time placeholders
+RECORD_FORMAT = 'fmp4'
+RECORD_EXTENSION = '.mp4'
+DEFAULT_SEGMENT = 60  # Seconds per segment
+MAX_SEGMENT = 3600  # Longest allowed segment; bounds the time-range lookup
+DELETE_BATCH = 500  # Segments removed per transaction
+GLOBAL = '*'  # Quota row covering all paths
+SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+DURATION_UNITS = {'ns': 1e-9, 'us': 1e-6, 'µs': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ns|us|µs|ms|s|m|h|d)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    file TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    start REAL NOT NULL,
+    duration REAL NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_path_start ON segments (path, start);
+CREATE INDEX IF NOT EXISTS segments_start ON segments (start);
+CREATE TABLE IF NOT EXISTS totals (path TEXT PRIMARY KEY, bytes INTEGER NOT NULL, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS quotas (path TEXT PRIMARY KEY, max_bytes INTEGER, max_age REAL);
+CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO totals (path, bytes, count) VALUES (NEW.path, NEW.bytes, 1)
+        ON CONFLICT (path) DO UPDATE SET bytes = bytes + NEW.bytes, count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+    UPDATE totals SET bytes = bytes - OLD.bytes, count = count - 1 WHERE path = OLD.path;
+END;
+"""
+
+def parse_size(value) -> int:
+    """
+    Convert a size like '20G', '500M' or 1048576 to bytes (binary units).
+
+    Raises:
+        ValueError: If the size is malformed.
+    """
+    m = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?', str(value).strip().lower())
+    if not m:
+        raise ValueError(f"Size '{value}' must be a number with an optional K, M, G or T suffix.")
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+
+def parse_duration(value) -> float:
+    """
+    Convert a duration like '60s', '7d', '1h30m' (or a number of seconds) to seconds.
+
+    Also accepts Go duration strings such as MediaMTX's '1m0.0125s'.
+
+    Raises:
+        ValueError: If the duration is malformed.
+    """
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    if not text or _DURATION_PART.sub('', text):
+        raise ValueError(f"Duration '{value}' must look like 60s, 30m, 12h or 7d.")
+    return sum(float(n) * DURATION_UNITS[unit] for n, unit in _DURATION_PART.findall(text))
+
+def parse_quota(settings: dict, where: str) -> dict:
+    """
+    Validate the max_bytes/max_age pair of a 'record' or top-level 'recording' object.
+
+    Returns:
+        {'max_bytes': bytes or None, 'max_age': seconds or None}.
+    """
+    try:
+        max_bytes = parse_size(settings['max_bytes']) if settings.get('max_bytes') else None
+        max_age = parse_duration(settings['max_age']) if settings.get('max_age') else None
+    except ValueError as e:
+        raise ValueError(f"{e} ({where})")
+    return {'max_bytes': max_bytes, 'max_age': max_age}
+
+def validate_record(i: int, record) -> dict:
+    """
+    Validate a camera's 'record' setting.
+
+    Args:
+        i: Camera index.
+        record: True for defaults, or {"segment": "60s", "max_bytes": "20G", "max_age": "7d"}.
+
+    Returns:
+        None when not recording, else {'segment' (seconds), 'max_bytes', 'max_age'}.
+
+    Raises:
+        ValueError: If the setting is malformed.
+    """
+    if not record:
+        return None
+    if record is True:
+        record = {}
+    if not isinstance(record, dict):
+        raise ValueError(f"record for cam{i} must be true or an object with segment, max_bytes and max_age.")
+    try:
+        segment = parse_duration(record.get('segment', DEFAULT_SEGMENT))
+    except ValueError as e:
+        raise ValueError(f"{e} (cam{i} record.segment)")
+    if not 1 <= segment <= MAX_SEGMENT:
+        raise ValueError(f"record.segment for cam{i} must be between 1s and {MAX_SEGMENT}s.")
+    return dict(parse_quota(record, f'cam{i} record'), segment=segment)
+
+def record_settings(record: dict) -> str:
+    """
+    Render the MediaMTX path settings that record a path in segments and index each one.
+
+    MediaMTX's own recordDeleteAfter is disabled; retention is enforced by the index.
+    The hook runs this file with this interpreter by absolute path, whatever MediaMTX's cwd.
+    """
+    return (f"    record: yes\n"
+            f"    recordPath: {RECORD_DIR}/%path/{SEGMENT_NAME}\n"
+            f"    recordFormat: {RECORD_FORMAT}\n"
+            f"    recordSegmentDuration: {record['segment']:g}s\n"
+            f"    recordDeleteAfter: 0s\n"
+            f"    runOnRecordSegmentComplete: {shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(__file__))} "
+            f"index $MTX_PATH $MTX_SEGMENT_PATH $MTX_SEGMENT_DURATION\n")
+
+def open_index(index_path: str = INDEX_PATH) -> 'sqlite3.Connection':
+    """
+    Open (creating if needed) the segment index.
+
+    WAL mode lets the config server query while segment hooks write; the busy
+    timeout covers several cameras completing segments at the same moment.
+    """
+    import sqlite3  # Deferred: most callers only render record settings
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    conn = sqlite3.connect(index_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def set_quotas(conn: 'sqlite3.Connection', quotas: dict, global_quota: dict = None) -> None:
+    """
+    Replace the stored quotas (read by every segment hook).
+
+    Args:
+        conn: Index connection.
+        quotas: Dictionary of recorded path name -> {'max_bytes', 'max_age'}.
+        global_quota: Limits over all paths together, or None.
+    """
+    rows = dict(quotas)
+    if global_quota:
+        rows[GLOBAL] = global_quota
+    with conn:
+        conn.execute('DELETE FROM quotas')
+        conn.executemany('INSERT INTO quotas (path, max_bytes, max_age) VALUES (?, ?, ?)',
+                         [(path, q.get('max_bytes'), q.get('max_age')) for path, q in rows.items()])
+
+def segment_start(file: str, duration: float = None) -> float:
+    """Return a segment's start time from its file name, falling back to mtime minus duration."""
+    name = os.path.splitext(os.path.basename(file))[0]
+    try:
+        stamp, _, fraction = name.rpartition('-')
+        return time.mktime(time.strptime(stamp, SEGMENT_NAME[:-3])) + float('0.' + fraction)
+    except ValueError:
+        return os.stat(file).st_mtime - (duration or 0)
+
+def add_segment(conn: 'sqlite3.Connection', path: str, file: str, duration: float = None) -> None:
+    """
+    Index a completed segment (replacing any earlier entry for the same file).
+
+    Args:
+        conn: Index connection.
+        path: MediaMTX path name, e.g. 'cam0'.
+        file: Segment file.
+        duration: Segment length in seconds, if MediaMTX reported it.
+    """
+    size = os.stat(file).st_size
+    start = segment_start(file, duration)
+    if duration is None:
+        duration = max(0.0, os.stat(file).st_mtime - start)
+    file = os.path.abspath(file)
+    with conn:
+        conn.execute('DELETE FROM segments WHERE file = ?', (file,))  # Keeps the totals triggers exact
+        conn.execute('INSERT INTO segments (file, path, start, duration, bytes) VALUES (?, ?, ?, ?, ?)',
+                     (file, path, start, duration, size))
+
+def _delete(conn: 'sqlite3.Connection', rows: list) -> list:
+    """Remove segment files, then their index rows. Returns the files removed."""
+    removed = []
+    for row in rows:
+        try:
+            os.unlink(row['file'])
+        except FileNotFoundError:
+            pass  # Already gone; drop the stale row
+        except OSError as e:
+            print(f"Cannot remove {row['file']}: {e}", file=sys.stderr)
+            continue
+        removed.append(row['file'])
+    with conn:
+        conn.executemany('DELETE FROM segments WHERE file = ?', [(f,) for f in removed])
+    return removed
+
+def _used(conn: 'sqlite3.Connection', path: str) -> int:
+    if path == GLOBAL:
+        return conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM totals').fetchone()[0]
+    row = conn.execute('SELECT bytes FROM totals WHERE path = ?', (path,)).fetchone()
+    return row[0] if row else 0
+
+def _oldest(conn: 'sqlite3.Connection', path: str, before: float = None, limit: int = DELETE_BATCH) -> list:
+    where, args = ('', []) if path == GLOBAL else ('path = ?', [path])
+    if before is not None:
+        where += (' AND ' if where else '') + 'start < ?'
+        args.append(before)
+    return conn.execute(f"SELECT file, bytes FROM segments {'WHERE ' + where if where else ''} "
+                        f"ORDER BY start LIMIT ?", args + [limit]).fetchall()
+
+def enforce(conn: 'sqlite3.Connection', now: float = None) -> list:
+    """
+    Delete segments past their path's (or the global) max_age, then the oldest segments
+    of any path (or all paths together) over its max_bytes.
+
+    Returns:
+        The files removed.
+    """
+    now = time.time() if now is None else now
+    removed = []
+    quotas = conn.execute('SELECT path, max_bytes, max_age FROM quotas ORDER BY path = ?', (GLOBAL,)).fetchall()
+    for quota in quotas:  # Per-path quotas first, so the global one only trims what's left
+        path = quota['path']
+        if quota['max_age']:
+            while True:
+                rows = _oldest(conn, path, before=now - quota['max_age'])
+                if not rows:
+                    break
+                gone = _delete(conn, rows)
+                removed += gone
+                if not gone:
+                    break
+        if quota['max_bytes']:
+            while True:
+                excess = _used(conn, path) - quota['max_bytes']
+                if excess <= 0:
+                    break
+                batch, freed = [], 0
+                for row in _oldest(conn, path):
+                    batch.append(row)
+                    freed += row['bytes']
+                    if freed >= excess:
+                        break
+                gone = _delete(conn, batch)
+                removed += gone
+                if not gone:
+                    break
+    return removed
+
+def query(conn: 'sqlite3.Connection', path: str = None, start: float = None, end: float = None,
+          limit: int = 1000) -> list:
+    """
+    Return segments overlapping [start, end), oldest first.
+
+    Args:
+        conn: Index connection.
+        path: MediaMTX path name, or None for all paths.
+        start: Epoch seconds, or None for the beginning.
+        end: Epoch seconds, or None for now.
+        limit: Maximum number of segments returned.
+
+    Returns:
+        A list of {'path', 'file', 'start', 'duration', 'bytes'} dictionaries.
+    """
+    start = 0.0 if start is None else start
+    end = time.time() if end is None else end
+    # A segment starting more than MAX_SEGMENT before 'start' can't overlap it, which keeps this a range scan
+    where = 'start >= ? AND start < ? AND start + duration > ?'
+    args = [start - MAX_SEGMENT, end, start]
+    if path:
+        where = 'path = ? AND ' + where
+        args.insert(0, path)
+    rows = conn.execute(f'SELECT path, file, start, duration, bytes FROM segments WHERE {where} ORDER BY start LIMIT ?',
+                        args + [limit]).fetchall()
+    return [dict(row) for row in rows]
+
+def usage(conn: 'sqlite3.Connection') -> dict:
+    """Return {path: {'bytes', 'count', 'oldest', 'newest'}} from the running totals."""
+    result = {}
+    for row in conn.execute('SELECT path, bytes, count FROM totals WHERE count > 0 ORDER BY path'):
+        span = conn.execute('SELECT MIN(start), MAX(start) FROM segments WHERE path = ?', (row['path'],)).fetchone()
+        result[row['path']] = {'bytes': row['bytes'], 'count': row['count'], 'oldest': span[0], 'newest': span[1]}
+    return result
+
+def reindex(conn: 'sqlite3.Connection', record_dir: str = RECORD_DIR) -> int:
+    """
+    Rebuild the index from the segment files on disk (recovery only; this one does scan).
+
+    Returns:
+        The number of segments indexed.
+    """
+    with conn:
+        conn.execute('DELETE FROM segments')
+        conn.execute('DELETE FROM totals')
+    count = 0
+    for root, _, files in os.walk(record_dir):
+        for name in files:
+            if name.endswith(RECORD_EXTENSION):
+                add_segment(conn, os.path.relpath(root, record_dir), os.path.join(root, name))
+                count += 1
+    return count
+
+def parse_time(value: str) -> float:
+    """Parse epoch seconds or an ISO 8601 time (local time unless it carries an offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        from datetime import datetime
+        return datetime.fromisoformat(value).timestamp()
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Recording segment index and retention.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('index', help="Index a completed segment and enforce quotas (MediaMTX hook)")
+    p.add_argument('path')
+    p.add_argument('file')
+    p.add_argument('duration', nargs='?', default='')
+    sub.add_parser('enforce', help="Enforce quotas now")
+    p = sub.add_parser('query', help="List segments in a time range as JSON")
+    p.add_argument('path', nargs='?')
+    p.add_argument('--start', help="Epoch seconds or ISO 8601")
+    p.add_argument('--end', help="Epoch seconds or ISO 8601")
+    sub.add_parser('reindex', help="Rebuild the index from files on disk")
+    args = parser.parse_args()
+
+    conn = open_index()
+    if args.command == 'index':
+        add_segment(conn, args.path, args.file, parse_duration(args.duration) if args.duration else None)
+        enforce(conn)
+    elif args.command == 'enforce':
+        print(f"Removed {len(enforce(conn))} segment(s).")
+    elif args.command == 'query':
+        print(json.dumps(query(conn, args.path, parse_time(args.start) if args.start else None,
+                               parse_time(args.end) if args.end else None), indent=2))
+    else:
+        print(f"Indexed {reindex(conn)} segment(s).")
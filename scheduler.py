@@ -0,0 +1,195 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+CPU scheduler for ffmpeg encoder workers. Estimates each camera's encode cost,
+assigns CPU sets and thread counts, and produces the taskset/nice prefix that
+write_yml places in front of each runOnInit command.
+"""
+
+import json
+import os
+
+DEFAULT_RESOLUTION = (640, 480)  # Assumed when a camera doesn't set one
+ENCODER_NICE = 5  # Encoders yield to MediaMTX and the config server under contention
+RESERVED_CPUS = 1  # Left free for MediaMTX/config server on hosts with 3+ CPUs
+ALLOCATION_PATH = '.demod_allocation.json'  # The last allocation, so unchanged encoders keep their CPUs
+
+# Relative CPU per pixel for each x264 preset (ultrafast = 1)
+PRESET_COST = {
+    'ultrafast': 1.0, 'superfast': 1.6, 'veryfast': 2.2, 'faster': 3.0,
+    'fast': 3.8, 'medium': 4.5, 'slow': 7.0, 'slower': 12.0, 'veryslow': 25.0,
+}
+# Extra work per pipeline on top of the encode: copy does no encode at all
+PIPELINE_COST = {'copy': 0.02, 'mjpeg': 1.3, 'raw': 1.1, 'x264': 1.3}
+
+def estimate_cost(width: int, height: int, fps: float, pipeline: str, preset: str = 'ultrafast') -> float:
+    """
+    Estimate an encoder's CPU cost in megapixels per second, weighted by preset and pipeline.
+
+    Args:
+        width: Frame width in pixels.
+        height: Frame height in pixels.
+        fps: Frames per second.
+        pipeline: Pipeline name from pipelines.select_pipeline().
+        preset: x264 preset.
+
+    Returns:
+        A relative cost (1.0 ~ one megapixel per second through ultrafast).
+    """
+    megapixels = width * height * float(fps) / 1e6
+    if pipeline == 'copy':
+        return megapixels * PIPELINE_COST['copy']
+    return megapixels * PRESET_COST.get(preset, 1.0) * PIPELINE_COST.get(pipeline, 1.3)
+
+def estimate_split_cost(width: int, height: int, fps: float, pipeline: str, outputs: list, preset: str = 'ultrafast') -> float:
+    """
+    Estimate the cost of one capture split into several encodes (renditions).
+
+    The capture is decoded/converted once; each output then pays only for its own encode.
+
+    Args:
+        width: Capture width in pixels.
+        height: Capture height in pixels.
+        fps: Capture frames per second.
+        pipeline: Capture pipeline ('copy' means decoding H.264 here).
+        outputs: (width, height, fps) per rendition.
+        preset: x264 preset.
+
+    Returns:
+        A relative cost on the same scale as estimate_cost().
+    """
+    capture = width * height * float(fps) / 1e6
+    decode = PIPELINE_COST['x264' if pipeline == 'copy' else pipeline] - 1.0
+    encodes = sum(w * h * float(f) / 1e6 for w, h, f in outputs)
+    return capture * decode + encodes * PRESET_COST.get(preset, 1.0)
+
+def available_cpus() -> list:
+    """Return the CPUs this process may run on, in ascending order."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not Linux
+        return list(range(os.cpu_count() or 1))
+
+def allocate(costs: dict, cpus: list = None, previous: dict = None) -> dict:
+    """
+    Assign CPU sets and thread counts to encoders in proportion to their cost.
+
+    A CPU set is part of the encoder's command line, so moving an encoder restarts its
+    stream. Encoders whose cost is unchanged since previous therefore keep their slot,
+    and only new or changed encoders are placed, on the CPUs the kept slots leave free.
+    With at least as many free CPUs as encoders to place, each gets a disjoint set sized
+    by its share of their total cost. Otherwise each is pinned to one CPU, heaviest
+    first onto the least-loaded CPU. Without previous everything is placed from scratch.
+
+    Args:
+        costs: Dictionary of path name -> estimated cost (see estimate_cost()).
+        cpus: CPUs to use; defaults to available_cpus() minus RESERVED_CPUS when 3+ exist.
+        previous: The last allocation (see read_allocation()), or None.
+
+    Returns:
+        A dictionary of path name -> {'cpus': [int], 'threads': int, 'nice': int, 'cost': float}.
+    """
+    if cpus is None:
+        cpus = available_cpus()
+        if len(cpus) > 2:
+            cpus = cpus[RESERVED_CPUS:]
+    if not costs or not cpus:
+        return {}
+    allocation = {}
+    for n in sorted(costs):
+        slot = (previous or {}).get(n)
+        if (slot and slot.get('cost') == round(costs[n], 2) and slot.get('nice') == ENCODER_NICE
+                and slot.get('cpus') and set(slot['cpus']) <= set(cpus)):
+            allocation[n] = dict(slot)
+    taken = {cpu for slot in allocation.values() for cpu in slot['cpus']}
+    free = [cpu for cpu in cpus if cpu not in taken]
+    names = sorted((n for n in costs if n not in allocation), key=lambda n: (-costs[n], n))
+    if names and len(names) <= len(free):
+        total = sum(costs[n] for n in names) or 1.0
+        spare = len(free) - len(names)
+        shares = {n: 1 + spare * costs[n] / total for n in names}
+        counts = {n: int(shares[n]) for n in names}
+        # Hand leftover CPUs to the largest fractional shares
+        for n in sorted(names, key=lambda n: (counts[n] - shares[n], n))[:len(free) - sum(counts.values())]:
+            counts[n] += 1
+        start = 0
+        for n in sorted(names):
+            allocation[n] = {'cpus': free[start:start + counts[n]], 'threads': counts[n],
+                             'nice': ENCODER_NICE, 'cost': round(costs[n], 2)}
+            start += counts[n]
+    elif names:
+        load = {cpu: 0.0 for cpu in cpus}
+        for slot in allocation.values():
+            for cpu in slot['cpus']:
+                load[cpu] += slot['cost'] / len(slot['cpus'])
+        for n in names:
+            cpu = min(cpus, key=lambda c: (load[c], c))
+            load[cpu] += costs[n]
+            allocation[n] = {'cpus': [cpu], 'threads': 1, 'nice': ENCODER_NICE, 'cost': round(costs[n], 2)}
+    return dict(sorted(allocation.items()))
+
+def read_allocation(path: str = ALLOCATION_PATH) -> dict:
+    """Return the allocation saved by write_allocation(), or None if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_allocation(allocation: dict, path: str = ALLOCATION_PATH) -> None:
+    """Save an allocation for the next allocate() call (temp file + rename)."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(allocation, f, indent=2)
+    os.replace(tmp, path)
+
+def format_cpus(cpus: list) -> str:
+    """Format a CPU list as a taskset list, collapsing runs (e.g. [1, 2, 3, 5] -> '1-3,5')."""
+    ranges = []
+    for cpu in cpus:
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{a}-{b}' if a != b else f'{a}' for a, b in ranges)
+
+def command_prefix(slot: dict) -> str:
+    """
+    Build the 'taskset -c ... nice -n ...' prefix for one encoder.
+
+    Args:
+        slot: One entry of allocate()'s result, or None for no constraints.
+
+    Returns:
+        The prefix, ending in a space, or '' when slot is None.
+    """
+    if not slot:
+        return ''
+    return f"taskset -c {format_cpus(slot['cpus'])} nice -n {slot['nice']} "
+
+def describe_allocation(allocation: dict) -> list:
+    """
+    Render an allocation as one line per encoder for the TUI and web UI.
+
+    Args:
+        allocation: Result of allocate().
+
+    Returns:
+        A list of strings like 'cam0: CPUs 1-2, 2 thread(s), nice 5, cost 9.2'.
+    """
+    return [f"{name}: CPUs {format_cpus(slot['cpus'])}, {slot['threads']} thread(s), nice {slot['nice']}, cost {slot['cost']}"
+            for name, slot in sorted(allocation.items())]
@@ -18,27 +18,48 @@
 TUI-based security checker and configuration adjuster for MediaMTX.
 Guides users through security checks and camera setup, supporting multi-camera
 JSONC configs or manual single-camera input.
+
+Usage: python3 security_checker.py                                    # Interactive TUI
+       python3 security_checker.py apply --config config.jsonc --yes --json  # Headless provisioning
 """
 
-from utils import run_command, get_devices, security_checks, calculate_rating, load_jsonc, write_yml
-import subprocess
+# Everything else is imported where it is used, so --help and argument errors
+# return at interpreter speed and each apply step pays only for what it needs
 import sys
+import time
+
+# Label and advice shown for each built-in check; registered extras fall back to their name
+CHECK_LABELS = {
+    'root': ("Running as non-root", "No (Warning: Run as non-root for security)"),
+    'video_group': ("User in 'video' group", "No (Add user to group for webcam access)"),
+    'ufw_port': ("UFW allows port 8554", "No (Run setup.sh to open)"),
+    'auth_enabled': ("RTSP auth enabled", "No (Recommended to enable)"),
+}
 
 def display_checks(checks: dict) -> None:
     """
     Display security check results in a formatted manner.
 
     Args:
-        checks: Dictionary of security check results.
+        checks: Dictionary of security check results (None means the probe timed out).
     """
+    from utils import check_timings
+    timings = check_timings()
     print("\nSecurity Status:")
-    print(f"- Running as non-root: {'Yes' if checks['root'] else 'No (Warning: Run as non-root for security)'}")
-    print(f"- User in 'video' group: {'Yes' if checks['video_group'] else 'No (Add user to group for webcam access)'}")
-    print(f"- UFW allows port 8554: {'Yes' if checks['ufw_port'] else 'No (Run setup.sh to open)'}")
-    print(f"- RTSP auth enabled: {'Yes' if checks['auth_enabled'] else 'No (Recommended to enable)'}\n")
+    for name, value in checks.items():
+        label, advice = CHECK_LABELS.get(name, (name.replace('_', ' ').capitalize(), "No"))
+        status = "Yes" if value else ("Unknown (check timed out)" if value is None else advice)
+        timing = timings.get(name)
+        suffix = f" [{timing['ms']:.1f} ms]" if timing else ""
+        print(f"- {label}: {status}{suffix}")
+    print()
 
 def tui_menu() -> None:
     """Main TUI menu for guiding users through security and configuration."""
+    from planner import plan, describe_plan
+    from scheduler import describe_allocation
+    from supervisor import LOG_PATH, describe_status, ensure_running, status as supervisor_status
+    from utils import run_command, get_devices, security_checks, invalidate_checks, calculate_rating, load_jsonc, write_yml, describe_apply
     print("Welcome to DeMoD Security Checker & Config Adjuster")
     print("Developed by DeMoD LLC\n")
     checks = security_checks()
@@ -51,6 +72,7 @@ def tui_menu() -> None:
         add = input("Add current user to 'video' group? (y/n): ").lower()
         if add == 'y':
             result = run_command("sudo usermod -aG video $USER")
+            invalidate_checks('video_group')
             if "Error" in result:
                 print(f"Failed to add user to group: {result}")
             else:
@@ -61,6 +83,7 @@ def tui_menu() -> None:
         open_port = input("Open UFW port 8554 for RTSP? (y/n): ").lower()
         if open_port == 'y':
             result = run_command("sudo ufw allow 8554/tcp && sudo ufw reload")
+            invalidate_checks('ufw_port')
             if "Error" in result:
                 print(f"Failed to configure UFW: {result}")
             else:
@@ -69,11 +92,13 @@ def tui_menu() -> None:
     # Step 3: Load JSONC for large-scale or manual
     use_jsonc = input("Use JSONC config file for multi-cam setup? (y/n): ").lower()
     cams = []
+    settings = {}
     if use_jsonc == 'y':
         filename = input("Enter JSONC file path (default config.jsonc): ") or 'config.jsonc'
         try:
             config = load_jsonc(filename)
             cams = config['cams']
+            settings = {k: v for k, v in config.items() if k != 'cams'}
             if not cams:
                 print("No 'cams' array in JSONC. Falling back to manual configuration.")
         except ValueError as e:
@@ -102,10 +127,31 @@ def tui_menu() -> None:
                 auth['pass'] = input("Password cannot be empty: ")
         cams = [{'device': device, 'framerate': framerate, 'bitrate': bitrate, 'auth': auth}]
 
+    # Check the cameras fit this host before writing anything
+    try:
+        print("Checking host capacity (first run benchmarks the encoder)...")
+        report = plan(cams, settings)
+    except ValueError as e:
+        print(f"Error writing configuration: {e}")
+        sys.exit(1)
+    print(describe_plan(report))
+    if not report['ok']:
+        if input("Apply the proposed downscaled settings? (y/n): ").lower() == 'y':
+            cams = report['proposed_cams']
+        elif input("Write the original configuration anyway? (y/n): ").lower() != 'y':
+            print("Configuration not written.")
+            sys.exit(1)
+
     # Write yml
     try:
-        write_yml(cams)
-        print("Configuration updated in mediamtx.yml.")
+        summary = write_yml(cams, shards=settings.get('shards', 1), recording=settings.get('recording'))
+        print(f"Configuration updated in mediamtx.yml. {describe_apply(summary)}")
+        if len(set(summary['routes'].values())) > 1:
+            print("Shard RTSP ports: " + ", ".join(f"{name} :{port}" for name, port in summary['routes'].items()))
+        if summary['allocation']:
+            print("Encoder CPU allocation:")
+            for line in describe_allocation(summary['allocation']):
+                print(f"- {line}")
     except ValueError as e:
         print(f"Error writing configuration: {e}")
         sys.exit(1)
@@ -113,12 +159,13 @@ def tui_menu() -> None:
     # Step 4: Start Server
     start = input("Start MediaMTX server? (y/n): ").lower()
     if start == 'y':
-        try:
-            subprocess.Popen(['./mediamtx'])
-            print("Server started. Press Ctrl+C in another terminal to stop.")
-        except FileNotFoundError:
-            print("Error: MediaMTX binary not found. Run setup.sh to install.")
+        pid = ensure_running()
+        if pid is None:
+            print(f"Error: supervisor did not start; see {LOG_PATH}. Run setup.sh to install MediaMTX.")
             sys.exit(1)
+        print(f"Server supervised by PID {pid}. Stop with: python3 supervisor.py stop")
+        for line in describe_status(supervisor_status()):
+            print(f"- {line}")
 
     # Final checks
     checks = security_checks()
@@ -134,14 +181,184 @@ def tui_menu() -> None:
     ]
     user_answers = [1 if input(q).lower() == 'y' else 0 for q in questions]
     rating = calculate_rating(checks, user_answers)
-    rating_message = f"Security Rating: {rating}/100"
+    print(f"Security Rating: {rating}/100 ({rating_label(rating)})")
+
+def rating_label(rating: int) -> str:
+    """Return the rating band shown after a rating."""
     if rating < 50:
-        rating_message += " (Low - review and improve settings)"
-    elif rating < 80:
-        rating_message += " (Moderate - consider additional measures)"
+        return "Low - review and improve settings"
+    if rating < 80:
+        return "Moderate - consider additional measures"
+    return "High - well secured"
+
+def apply_headless(args) -> dict:
+    """
+    Provision without prompts: group, firewall, capacity, config and start steps.
+
+    Each step is timed and recorded as 'ok' (nothing to do), 'changed', 'skipped'
+    (needs --yes, or --dry-run) or 'failed'. Security checks run once up front and
+    once for the rating; in between only the checks a step invalidated are re-probed.
+    System changes use 'sudo -n', which fails instead of prompting.
+
+    Args:
+        args: Parsed 'apply' arguments.
+
+    Returns:
+        A report dictionary: 'ok', 'steps' (list of {'name', 'status', 'detail',
+        'ms'}), 'routes', 'checks', 'rating' and 'total_ms'.
+    """
+    started = time.perf_counter()
+    report = {'ok': True, 'config': args.config, 'dry_run': args.dry_run, 'steps': []}
+    state = {}
+
+    def step(name: str, func) -> bool:
+        t = time.perf_counter()
+        try:
+            status, detail = func()
+        except Exception as e:  # Reported, not raised: the report is the interface
+            status, detail = 'failed', str(e)
+        report['steps'].append({'name': name, 'status': status, 'detail': detail,
+                                'ms': round((time.perf_counter() - t) * 1000, 1)})
+        if status == 'failed':
+            report['ok'] = False
+        return status != 'failed'
+
+    def load():
+        from utils import iter_jsonc_cams, validate_config
+        state['cams'], state['settings'], state['specs'] = [], {}, []
+
+        def parsed():
+            for cam in iter_jsonc_cams(args.config, settings=state['settings']):
+                state['cams'].append(cam)
+                yield cam
+        # Each camera is validated (and its device probed) as soon as it is parsed
+        errors = validate_config(parsed(), state['settings'], state['specs'])
+        if not state['cams']:
+            raise ValueError(f"No 'cams' array in {args.config}.")
+        if errors:
+            raise ValueError(' '.join(e['error'] for e in errors))
+        return 'ok', f"{len(state['cams'])} camera(s)"
+
+    def checks():
+        from utils import security_checks
+        state['checks'] = security_checks()
+        return 'ok', ', '.join(f"{name}={value}" for name, value in state['checks'].items())
+
+    def change(done: bool, command: str, check: str, success: str):
+        if done:
+            return 'ok', "already configured"
+        if args.dry_run or not args.yes:
+            return 'skipped', "dry run" if args.dry_run else "needs --yes"
+        from utils import invalidate_checks, run_command
+        result = run_command(command, timeout=30)
+        invalidate_checks(check)
+        if "Error" in result:
+            raise RuntimeError(result)
+        return 'changed', success
+
+    def firewall():
+        from sharding import shard_ports
+        shards = state['settings'].get('shards', 1)
+        ports = [shard_ports(k)['rtsp'] for k in range(int(shards) if str(shards).isdigit() else 1)]
+        command = ' && '.join([f"sudo -n ufw allow {port}/tcp" for port in ports] + ["sudo -n ufw reload"])
+        return change(state['checks'].get('ufw_port') and len(ports) == 1, command, 'ufw_port',
+                      f"opened RTSP port(s) {', '.join(map(str, ports))}")
+
+    def capacity():
+        from planner import plan, describe_plan
+        result = plan(state['cams'], state['settings'], specs=state['specs'])
+        if result['ok']:
+            return 'ok', describe_plan(result)
+        if args.downscale and result['proposal_fits']:
+            # Check the proposal itself before applying it
+            downscaled = plan(result['proposed_cams'], state['settings'])
+            if downscaled['ok']:
+                state['cams'], state['specs'] = result['proposed_cams'], None
+                return 'changed', "applied proposed settings: " + describe_plan(downscaled)
+        if args.ignore_capacity:
+            return 'ok', "over capacity, ignored: " + describe_plan(result)
+        if args.downscale:
+            raise ValueError(describe_plan(result) + " (the proposed settings don't fit either; "
+                             "use --ignore-capacity to write the config anyway)")
+        raise ValueError(describe_plan(result) + " (use --downscale or --ignore-capacity)")
+
+    def config():
+        if args.dry_run:
+            if state['specs'] is None:  # Downscaled since load validated it
+                from utils import validate_config
+                errors = validate_config(state['cams'], state['settings'])
+                if errors:
+                    raise ValueError(' '.join(e['error'] for e in errors))
+            return 'skipped', "dry run: config is valid, nothing written"
+        from utils import describe_apply, write_yml
+        summary = write_yml(state['cams'], shards=state['settings'].get('shards', 1),
+                            recording=state['settings'].get('recording'), specs=state['specs'])
+        report['routes'] = summary['routes']
+        return ('changed' if summary['written'] else 'ok'), describe_apply(summary)
+
+    def start():
+        if args.dry_run or not args.yes or args.no_start:
+            return 'skipped', "dry run" if args.dry_run else ("--no-start" if args.no_start else "needs --yes")
+        from supervisor import LOG_PATH, ensure_running
+        pid = ensure_running()
+        if pid is None:
+            raise RuntimeError(f"supervisor did not start; see {LOG_PATH}")
+        return 'ok', f"supervisor PID {pid}"
+
+    def rating():
+        from utils import calculate_rating, security_checks
+        state['checks'] = security_checks()  # Cached except for checks invalidated above
+        answers = [int(args.secure_network), int(args.changed_passwords), int(args.restricted_access)]
+        report['rating'] = calculate_rating(state['checks'], answers)
+        report['checks'] = state['checks']
+        return 'ok', f"{report['rating']}/100 ({rating_label(report['rating'])})"
+
+    if step('load', load) and step('checks', checks):
+        step('video_group', lambda: change(state['checks'].get('video_group'), "sudo -n usermod -aG video $USER",
+                                           'video_group', "added to 'video'; log out and back in"))
+        step('firewall', firewall)
+        if step('capacity', capacity) and step('config', config):
+            step('start', start)
+        step('rating', rating)
+    report['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+def print_report(report: dict) -> None:
+    """Print an apply report as one line per step."""
+    for s in report['steps']:
+        print(f"[{s['status']:>7}] {s['name']:<12} {s['ms']:>8.1f} ms  {s['detail']}")
+    for name, port in report.get('routes', {}).items():
+        print(f"Stream: rtsp://<host>:{port}/{name}")
+    print(f"{'OK' if report['ok'] else 'FAILED'} in {report['total_ms']:.0f} ms")
+
+def main(argv: list = None) -> int:
+    """Run the TUI, or the headless 'apply' command; returns the exit code."""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        tui_menu()
+        return 0
+    import argparse
+    parser = argparse.ArgumentParser(description="DeMoD security checker and config adjuster. Without arguments, runs the interactive TUI.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('apply', help="Provision from a JSONC config without prompts")
+    p.add_argument('--config', default='config.jsonc', help="JSONC config (default config.jsonc)")
+    p.add_argument('--yes', action='store_true', help="Answer yes to every TUI question: join 'video', open the firewall, start MediaMTX")
+    p.add_argument('--json', action='store_true', help="Print the report as JSON")
+    p.add_argument('--dry-run', action='store_true', help="Check and validate only; change nothing")
+    p.add_argument('--no-start', action='store_true', help="Don't start the supervisor even with --yes")
+    p.add_argument('--downscale', action='store_true', help="Apply the capacity check's proposed settings if over capacity")
+    p.add_argument('--ignore-capacity', action='store_true', help="Write the config even if over capacity")
+    p.add_argument('--secure-network', action='store_true', help="Rating answer: the device is behind a VPN/firewall")
+    p.add_argument('--changed-passwords', action='store_true', help="Rating answer: default system passwords were changed")
+    p.add_argument('--restricted-access', action='store_true', help="Rating answer: remote access is restricted")
+    args = parser.parse_args(argv)
+    report = apply_headless(args)
+    if args.json:
+        import json
+        print(json.dumps(report, indent=2))
     else:
-        rating_message += " (High - well secured)"
-    print(rating_message)
+        print_report(report)
+    return 0 if report['ok'] else 1
 
 if __name__ == "__main__":
-    tui_menu()
+    sys.exit(main())
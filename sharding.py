@@ -0,0 +1,126 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Sharded multi-instance mode. Splits cameras across N MediaMTX instances, each
+with its own directory, config and ports, balanced by bitrate x viewers. The
+manifest written here tells the supervisor which instances to run.
+"""
+
+import json
+import os
+
+SHARD_DIR = 'shards'
+MANIFEST_PATH = os.path.join(SHARD_DIR, 'shards.json')
+RTSP_BASE_PORT = 8554
+RTP_BASE_PORT = 8000  # RTP/RTCP use an even/odd UDP pair per shard
+PORT_STEP = 10  # Shard k uses base + k * PORT_STEP for each port
+
+def shard_ports(index: int) -> dict:
+    """Return the RTSP, RTP and RTCP ports of shard index."""
+    offset = index * PORT_STEP
+    return {'rtsp': RTSP_BASE_PORT + offset, 'rtp': RTP_BASE_PORT + offset, 'rtcp': RTP_BASE_PORT + offset + 1}
+
+def shard_config(index: int) -> str:
+    """Return the path of shard index's generated MediaMTX config."""
+    return os.path.join(SHARD_DIR, str(index), 'mediamtx.yml')
+
+def shard_header(index: int) -> str:
+    """
+    Return the global section of a shard's config.
+
+    Shards serve RTSP only; the other protocols' listeners are disabled so that
+    several instances can run side by side without port clashes.
+    """
+    ports = shard_ports(index)
+    return f"""
+logLevel: info
+
+# Shard {index}: RTSP only, on its own ports
+rtspAddress: :{ports['rtsp']}
+rtpAddress: :{ports['rtp']}
+rtcpAddress: :{ports['rtcp']}
+rtmp: no
+hls: no
+webrtc: no
+srt: no
+
+paths:
+"""
+
+def assign(weights: dict, count: int) -> dict:
+    """
+    Balance paths across shards, heaviest first onto the least-loaded shard.
+
+    Args:
+        weights: Dictionary of path name -> load (bitrate in bits/s x expected viewers).
+        count: Number of shards.
+
+    Returns:
+        A dictionary of path name -> shard index.
+    """
+    load = [0.0] * count
+    assignment = {}
+    for name in sorted(weights, key=lambda n: (-weights[n], n)):
+        index = min(range(count), key=lambda k: (load[k], k))
+        load[index] += weights[name]
+        assignment[name] = index
+    return assignment
+
+def write_manifest(count: int, assignment: dict) -> None:
+    """
+    Record the shard layout for the supervisor and stream URL routing.
+
+    A count of 1 removes the manifest, returning to the single mediamtx.yml instance.
+
+    Args:
+        count: Number of shards.
+        assignment: Result of assign().
+    """
+    if count <= 1:
+        if os.path.exists(MANIFEST_PATH):
+            os.unlink(MANIFEST_PATH)
+        return
+    manifest = {'count': count, 'shards': [
+        {'index': k, 'config': shard_config(k), 'rtsp_port': shard_ports(k)['rtsp'],
+         'paths': sorted(name for name, index in assignment.items() if index == k)}
+        for k in range(count)
+    ]}
+    tmp = MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)
+
+def read_manifest() -> dict:
+    """Return the current shard manifest, or None when running a single instance."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def instances(default_config: str = 'mediamtx.yml') -> dict:
+    """
+    Return the MediaMTX instances to run.
+
+    Returns:
+        A dictionary of process name -> config path: {'mediamtx': default_config}
+        without a manifest, else {'mediamtx-0': 'shards/0/mediamtx.yml', ...}.
+    """
+    manifest = read_manifest()
+    if not manifest:
+        return {'mediamtx': default_config}
+    return {f"mediamtx-{shard['index']}": shard['config'] for shard in manifest['shards']}
@@ -0,0 +1,274 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cached camera snapshots. One persistent low-rate ffmpeg sidecar per camera pulls
+its stream from MediaMTX, decodes keyframes only and pipes a small JPEG every few
+seconds into an in-memory LRU cache with a byte budget. Sidecars start when a
+camera's snapshot is first requested and stop after a while without requests.
+"""
+
+import collections
+import hashlib
+import re
+import subprocess
+import threading
+import time
+
+from sharding import RTSP_BASE_PORT, read_manifest
+from tracing import TRACER
+from utils import split_yml
+
+SNAPSHOT_INTERVAL = 5  # Seconds between frames per camera
+SNAPSHOT_WIDTH = 320  # Thumbnail width; height keeps the aspect ratio
+SNAPSHOT_BUDGET = 8 << 20  # Bytes of JPEG kept in memory across all cameras
+SNAPSHOT_IDLE = 300  # Seconds without requests before a camera's sidecar stops
+SNAPSHOT_NICE = 10  # Sidecars yield to encoders and MediaMTX
+MAX_BACKOFF = 60  # Seconds between restarts of a sidecar whose stream is down
+MAX_FRAME = 4 << 20  # A JPEG larger than this means the pipe is out of sync
+_READ_USER = re.compile(r'^    readUser: (.*)$', re.MULTILINE)
+_READ_PASS = re.compile(r'^    readPass: (.*)$', re.MULTILINE)
+
+class SnapshotCache:
+    """In-memory JPEGs per camera, evicting the least recently used past a byte budget."""
+
+    def __init__(self, budget: int = SNAPSHOT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._entries = collections.OrderedDict()  # name -> (jpeg, etag, taken_at)
+        self._lock = threading.Lock()
+
+    def put(self, name: str, jpeg: bytes) -> None:
+        """Store a camera's latest JPEG, evicting older entries to stay within the budget."""
+        etag = '"' + hashlib.sha1(jpeg).hexdigest()[:16] + '"'
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old:
+                self.size -= len(old[0])
+            self._entries[name] = (jpeg, etag, time.time())
+            self.size += len(jpeg)
+            while self.size > self.budget and len(self._entries) > 1:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats['evictions'] += 1
+
+    def get(self, name: str) -> tuple:
+        """Return (jpeg, etag, taken_at) for a camera, or None; marks it recently used."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(name)
+            self.stats['hits'] += 1
+            return entry
+
+    def discard(self, name: str) -> None:
+        """Drop a camera's entry (e.g. when it is removed from the config)."""
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry:
+                self.size -= len(entry[0])
+
+def sidecar_command(url: str, interval: int = SNAPSHOT_INTERVAL, width: int = SNAPSHOT_WIDTH) -> list:
+    """
+    Return the ffmpeg command for a camera's snapshot sidecar.
+
+    Only keyframes are decoded, so the sidecar costs one small decode per GOP
+    instead of a full decode of the stream.
+    """
+    return ['nice', '-n', str(SNAPSHOT_NICE), 'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin',
+            '-rtsp_transport', 'tcp', '-skip_frame', 'nokey', '-i', url, '-an',
+            '-vf', f'fps=1/{interval},scale={width}:-2', '-c:v', 'mjpeg', '-q:v', '5', '-f', 'image2pipe', '-']
+
+def split_jpegs(buffer: bytes) -> tuple:
+    """
+    Split complete JPEGs off the front of an image2pipe buffer.
+
+    Returns:
+        A (list of JPEGs, remaining bytes) tuple.
+    """
+    frames = []
+    while True:
+        end = buffer.find(b'\xff\xd9')  # EOI; entropy-coded data never contains it unescaped
+        if end < 0:
+            return frames, buffer
+        frame, buffer = buffer[:end + 2], buffer[end + 2:]
+        start = frame.find(b'\xff\xd8')
+        if start >= 0:
+            frames.append(frame[start:])
+
+class Sidecar:
+    """A camera's snapshot ffmpeg, restarted with backoff while snapshots are wanted."""
+
+    def __init__(self, name: str, url: str, cache: SnapshotCache):
+        self.name = name
+        self.url = url
+        self.cache = cache
+        self.last_request = 0.0
+        self.wanted = threading.Event()
+        self.stopped = threading.Event()
+        self.proc = None
+        self._thread = threading.Thread(target=self._run, name=f'snapshot-{name}', daemon=True)
+        self._thread.start()
+
+    def request(self) -> None:
+        """Note a request for this camera, starting the sidecar if it is idle."""
+        self.last_request = time.monotonic()
+        self.wanted.set()
+
+    def idle(self) -> bool:
+        return time.monotonic() - self.last_request > SNAPSHOT_IDLE
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.wanted.set()
+        proc = self.proc
+        if proc and proc.poll() is None:
+            proc.terminate()
+
+    def _run(self) -> None:
+        failures = 0
+        while not self.stopped.is_set():
+            self.wanted.wait()
+            if self.stopped.is_set():
+                return
+            if self.idle():
+                self.wanted.clear()
+                continue
+            started, wall = time.monotonic(), time.time()
+            try:
+                self.proc = subprocess.Popen(sidecar_command(self.url), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            except OSError as e:
+                print(f"Snapshot sidecar for {self.name} failed to start: {e}")
+                TRACER.record('process', f'snapshot {self.name}', wall, 0.0, error=str(e))
+                self.stopped.wait(MAX_BACKOFF)
+                continue
+            size, frames = self._read(self.proc)
+            self.proc.wait()
+            # Named by camera: the URL carries read credentials
+            TRACER.record('process', f'snapshot {self.name}', wall, time.monotonic() - started,
+                          exit=self.proc.returncode, bytes=size, frames=frames)
+            # The stream may not be up yet: back off, resetting once a run lasted a while
+            failures = 0 if time.monotonic() - started > MAX_BACKOFF else failures + 1
+            self.stopped.wait(min(MAX_BACKOFF, 2 ** failures) if failures else 0)
+
+    def _read(self, proc) -> tuple:
+        """Cache frames until the sidecar exits or is no longer wanted; return (bytes read, frames)."""
+        buffer, size, count = b'', 0, 0
+        while True:
+            chunk = proc.stdout.read1(65536)
+            if not chunk:
+                return size, count
+            size += len(chunk)
+            frames, buffer = split_jpegs(buffer + chunk)
+            if frames:
+                count += len(frames)
+                self.cache.put(self.name, frames[-1])
+            if len(buffer) > MAX_FRAME:
+                buffer = b''
+            if self.stopped.is_set() or self.idle():
+                proc.terminate()
+                return size, count
+
+def snapshot_urls() -> dict:
+    """
+    Return the stream URL to snapshot for each camera, from the generated configs.
+
+    A camera with renditions is read from its first path, which runs the encoder.
+    Credentials are the path's read credentials; MediaMTX is always local.
+
+    Returns:
+        A dictionary of camera name ('cam0') -> rtsp:// URL.
+    """
+    manifest = read_manifest()
+    configs = ([(shard['config'], shard['rtsp_port']) for shard in manifest['shards']] if manifest
+               else [('mediamtx.yml', RTSP_BASE_PORT)])
+    urls = {}
+    for yml_path, port in configs:
+        try:
+            with open(yml_path) as f:
+                _header, blocks = split_yml(f.read())
+        except OSError:
+            continue
+        for path, block in blocks.items():
+            name = path.split('/')[0]
+            if name in urls:
+                continue
+            user, password = _READ_USER.search(block), _READ_PASS.search(block)
+            credentials = f"{user.group(1)}:{password.group(1)}@" if user and password else ''
+            urls[name] = f"rtsp://{credentials}127.0.0.1:{port}/{path}"
+    return urls
+
+class SnapshotService:
+    """Keeps one sidecar per configured camera and serves their cached JPEGs."""
+
+    def __init__(self, cache: SnapshotCache = None):
+        self.cache = cache or SnapshotCache()
+        self.sidecars = {}
+        self._lock = threading.Lock()
+
+    def watch_yml(self) -> None:
+        """Match the sidecars to the cameras in the generated MediaMTX configs."""
+        self.sync(snapshot_urls())
+
+    def sync(self, urls: dict) -> None:
+        """
+        Start sidecars for new cameras, replace ones whose URL changed and stop removed ones.
+
+        Args:
+            urls: Dictionary of camera name -> stream URL.
+        """
+        with self._lock:
+            for name in list(self.sidecars):
+                if urls.get(name) != self.sidecars[name].url:
+                    sidecar = self.sidecars.pop(name)
+                    sidecar.stop()
+                    if name not in urls:
+                        self.cache.discard(name)
+                    elif not sidecar.idle():  # Keep serving a camera someone is watching
+                        self.sidecars[name] = Sidecar(name, urls[name], self.cache)
+                        self.sidecars[name].request()
+            for name, url in urls.items():
+                if name not in self.sidecars:
+                    self.sidecars[name] = Sidecar(name, url, self.cache)
+
+    def get(self, name: str) -> tuple:
+        """
+        Return a camera's cached (jpeg, etag, taken_at), or None before its first frame.
+
+        Raises:
+            KeyError: If the camera isn't configured.
+        """
+        with self._lock:
+            sidecar = self.sidecars[name]
+        sidecar.request()
+        return self.cache.get(name)
+
+    def names(self) -> list:
+        """Return the configured camera names in index order."""
+        with self._lock:
+            return sorted(self.sidecars, key=lambda n: int(n[3:]) if n[3:].isdigit() else 0)
+
+    def stop(self) -> None:
+        """Stop every sidecar (and its ffmpeg)."""
+        with self._lock:
+            for sidecar in self.sidecars.values():
+                sidecar.stop()
+            self.sidecars = {}
+
+SNAPSHOTS = SnapshotService()
@@ -33,15 +33,14 @@ fi
 echo "Welcome to the DeMoD MediaMTX Start Script for webcam streaming."
 echo "Developed by DeMoD LLC"
 
-# Detect video devices
-result = run_command("v4l2-ctl --list-devices")
-if "Error" in result:
-  echo "Error: v4l2-ctl failed. Ensure v4l-utils is installed and webcam is connected."
-  exit 1
-DEVICES=($(echo "$result" | awk '/usb/{getline; print $1}' | grep '/dev/video'))
+# Detect video capture devices natively (skips metadata-only nodes); fall back to v4l2-ctl
+DEVICES=($(python3 devices.py --list 2>/dev/null || true))
+if [ ${#DEVICES[@]} -eq 0 ] && command -v v4l2-ctl > /dev/null; then
+  DEVICES=($(v4l2-ctl --list-devices 2>/dev/null | awk '/usb/{getline; print $1}' | grep '/dev/video' || true))
+fi
 
 if [ ${#DEVICES[@]} -eq 0 ]; then
-  echo "No USB webcams detected. Defaulting to /dev/video0 if available."
+  echo "No webcams detected. Defaulting to /dev/video0 if available."
   DEVICE="/dev/video0"
   read -p "Use default /dev/video0? (y/n): " answer
   answer=${answer,,}
@@ -50,7 +49,7 @@ if [ ${#DEVICES[@]} -eq 0 ]; then
     exit 0
   fi
 else
-  echo "Detected USB webcams:"
+  echo "Detected webcams:"
   for i in "${!DEVICES[@]}"; do
     echo "$((i+1))) ${DEVICES[$i]}"
   done
@@ -0,0 +1,402 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Process supervisor for MediaMTX and the per-camera encoders. A single daemon,
+guarded by a lock file, owns MediaMTX (one instance per shard when sharding);
+each encoder runs under a worker that MediaMTX launches via runOnInit. Both
+restart their child with exponential backoff, detect crash loops, and publish
+restart counts and uptime as JSON.
+
+Usage:
+    python3 supervisor.py start|stop|status [--json]
+    python3 supervisor.py run                      # Daemon in the foreground
+    python3 supervisor.py worker NAME -- CMD...    # Used in mediamtx.yml
+"""
+
+import collections
+import fcntl
+import json
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import time
+
+from sharding import MANIFEST_PATH, instances
+
+STATE_DIR = '.supervisor'
+LOCK_PATH = os.path.join(STATE_DIR, 'supervisor.lock')  # Holds the daemon's PID while it runs
+STATUS_PATH = os.path.join(STATE_DIR, 'status.json')
+WORKER_DIR = os.path.join(STATE_DIR, 'workers')
+LOG_PATH = os.path.join(STATE_DIR, 'supervisor.log')
+MEDIAMTX_COMMAND = ['./mediamtx']  # Followed by the instance's config path
+BASE_BACKOFF = 1.0  # Seconds before the first restart; doubles per consecutive failure
+MAX_BACKOFF = 60.0
+STABLE_SECONDS = 30.0  # A child that ran this long resets the backoff
+CRASH_LOOP_RESTARTS = 5  # This many restarts within CRASH_LOOP_WINDOW is a crash loop
+CRASH_LOOP_WINDOW = 60.0
+CRASH_LOOP_HOLD = 300.0  # Seconds to wait before trying a crash-looping child again
+STOP_TIMEOUT = 10.0  # Grace period between SIGTERM and SIGKILL
+TICK = 0.5
+STATUS_HEARTBEAT = 60.0  # Seconds between status rewrites while nothing changes (readers derive uptime from 'started')
+
+class Supervised:
+    """One child process restarted with exponential backoff and crash-loop detection."""
+
+    def __init__(self, name: str, argv: list):
+        self.name = name
+        self.argv = argv
+        self.proc = None
+        self.state = 'starting'
+        self.restarts = 0
+        self.failures = 0  # Consecutive short-lived runs
+        self.recent = collections.deque()  # Restart times within CRASH_LOOP_WINDOW
+        self.started_at = None
+        self.next_start = 0.0
+        self.last_exit = None
+
+    def step(self, now: float) -> None:
+        """Start the child when due, or account for its exit."""
+        if self.proc is not None:
+            code = self.proc.poll()
+            if code is None:
+                return
+            ran = now - self.started_at
+            self.proc, self.last_exit = None, code
+            self.failures = 0 if ran >= STABLE_SECONDS else self.failures + 1
+            self.restarts += 1
+            self.recent.append(now)
+            while self.recent and now - self.recent[0] > CRASH_LOOP_WINDOW:
+                self.recent.popleft()
+            if len(self.recent) >= CRASH_LOOP_RESTARTS:
+                self.state = 'crash-loop'
+                self.next_start = now + CRASH_LOOP_HOLD
+                self.recent.clear()
+            else:
+                self.state = 'backoff'
+                self.next_start = now + (min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (self.failures - 1)) if self.failures else 0)
+            log(f"{self.name} exited with {code} after {ran:.1f}s; {self.state}, next start in {self.next_start - now:.0f}s")
+        if now >= self.next_start:
+            try:
+                self.proc = subprocess.Popen(self.argv)
+                self.started_at = now
+                self.state = 'running'
+            except OSError as e:
+                self.state = 'failed'
+                self.last_exit = str(e)
+                self.next_start = now + MAX_BACKOFF
+                log(f"{self.name} could not start: {e}")
+
+    def stop(self) -> None:
+        """Terminate the child, escalating to SIGKILL after STOP_TIMEOUT."""
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        self.proc = None
+        self.state = 'stopped'
+
+    def describe(self, now: float, wall: float) -> dict:
+        """Return this child's status as a JSON-serializable dictionary."""
+        return {
+            'pid': self.proc.pid if self.proc else None,
+            'state': self.state,
+            'restarts': self.restarts,
+            'started': wall - (now - self.started_at) if self.proc else None,
+            'last_exit': self.last_exit,
+            'next_start': wall + (self.next_start - now) if not self.proc and self.state != 'stopped' else None,
+        }
+
+def log(message: str) -> None:
+    """Print a timestamped line (the daemon's stdout is LOG_PATH)."""
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+def _write_json(path: str, data: dict) -> None:
+    """Write JSON through a temp file and rename so readers never see a partial file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def daemon_pid() -> int:
+    """Return the PID of the running daemon, or None (checked via its lock, not just the file)."""
+    try:
+        fd = os.open(LOCK_PATH, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return None  # Nobody holds the lock
+    except BlockingIOError:
+        content = os.read(fd, 32).decode().strip()
+        return int(content) if content.isdigit() else None
+    finally:
+        os.close(fd)
+
+def _run_until_signalled(desired, status_path: str, parent: int = None) -> None:
+    """
+    Supervise children until SIGTERM/SIGINT (or until parent, if given, goes away).
+
+    Args:
+        desired: Callable returning {name: argv} for the children that should run; it is
+                 called every tick, and children whose argv changed are replaced.
+        status_path: Where to publish status JSON. It is rewritten when a child's state,
+                     PID or restart count changes, and otherwise every STATUS_HEARTBEAT
+                     seconds, so idle hosts (often on SD cards) see few writes.
+        parent: PID whose exit also stops supervision.
+    """
+    stopping = []
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, lambda signum, frame: stopping.append(signum))
+    started = time.time()
+    children = {}
+    written, written_at = None, float('-inf')
+    try:
+        while not stopping and (parent is None or os.getppid() == parent):
+            wanted = desired()
+            for name in [n for n, c in children.items() if wanted.get(n) != c.argv]:
+                log(f"Stopping {name}.")
+                children.pop(name).stop()
+            for name, argv in wanted.items():
+                children.setdefault(name, Supervised(name, argv))
+            now = time.monotonic()
+            for child in children.values():
+                child.step(now)
+            key = [(c.name, c.proc and c.proc.pid, c.state, c.restarts, c.last_exit) for c in children.values()]
+            if key != written or now - written_at >= STATUS_HEARTBEAT:
+                _write_json(status_path, {
+                    'pid': os.getpid(), 'started': started, 'updated': time.time(),
+                    'processes': {c.name: c.describe(now, time.time()) for c in children.values()},
+                })
+                written, written_at = key, now
+            time.sleep(TICK)
+    finally:
+        for child in children.values():
+            child.stop()
+
+def _mediamtx_instances() -> callable:
+    """Return a desired() callable that follows the shard manifest, re-reading it only when it changes."""
+    cache = {'stamp': object(), 'wanted': {}}
+
+    def desired() -> dict:
+        try:
+            stamp = os.stat(MANIFEST_PATH).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp != cache['stamp']:
+            cache['stamp'] = stamp
+            cache['wanted'] = {name: MEDIAMTX_COMMAND + [config] for name, config in instances().items()}
+        return cache['wanted']
+    return desired
+
+def run_daemon() -> int:
+    """
+    Run the supervisor daemon in the foreground; only one instance may hold the lock.
+
+    Returns:
+        The process exit code (1 if another instance is already running).
+    """
+    os.makedirs(WORKER_DIR, exist_ok=True)
+    fd = os.open(LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Supervisor already running (PID {daemon_pid()}).")
+        return 1
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    log(f"Supervisor started (PID {os.getpid()}).")
+    try:
+        _run_until_signalled(_mediamtx_instances(), STATUS_PATH)
+    finally:
+        _write_json(STATUS_PATH, {'pid': None, 'updated': time.time(), 'processes': {}})
+        log("Supervisor stopped.")
+        os.close(fd)  # Releases the lock
+    return 0
+
+def run_worker(name: str, argv: list) -> int:
+    """
+    Run one encoder under supervision; MediaMTX starts this via runOnInit.
+
+    The worker exits, stopping the encoder, when MediaMTX signals it or exits itself,
+    so removed paths and MediaMTX restarts never leave orphaned encoders.
+
+    Args:
+        name: Path name (e.g. 'cam0'), used for the status file.
+        argv: Encoder command line.
+
+    Returns:
+        The process exit code.
+    """
+    os.makedirs(WORKER_DIR, exist_ok=True)
+    path = os.path.join(WORKER_DIR, f'{name}.json')
+    try:
+        _run_until_signalled(lambda: {name: argv}, path, parent=os.getppid())
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return 0
+
+def worker_command(name: str) -> str:
+    """Return the runOnInit prefix that runs a path's encoder under a supervised worker (from any cwd)."""
+    return f"{shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(__file__))} worker {name} -- "
+
+def ensure_running(wait: float = 5.0) -> int:
+    """
+    Start the daemon in the background unless it is already running.
+
+    Args:
+        wait: Seconds to wait for the new daemon to take its lock.
+
+    Returns:
+        The daemon's PID, or None if it did not come up (see LOG_PATH).
+    """
+    pid = daemon_pid()
+    if pid:
+        return pid
+    os.makedirs(WORKER_DIR, exist_ok=True)
+    with open(LOG_PATH, 'a') as log_file:
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'run'], stdout=log_file, stderr=subprocess.STDOUT,
+                         stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        pid = daemon_pid()
+        if pid:
+            return pid
+        time.sleep(0.05)
+    return None
+
+def stop(timeout: float = STOP_TIMEOUT + 5) -> bool:
+    """
+    Stop the daemon gracefully (MediaMTX, and with it the encoder workers).
+
+    Returns:
+        True if no daemon is running afterwards.
+    """
+    pid = daemon_pid()
+    if not pid:
+        return True
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not daemon_pid():
+            return True
+        time.sleep(0.1)
+    return False
+
+def status() -> dict:
+    """
+    Collect daemon and encoder status.
+
+    Returns:
+        A dictionary with 'running' (daemon alive), 'pid', and 'processes': name ->
+        {'pid', 'state', 'restarts', 'uptime' (seconds or None), 'last_exit'}; encoder
+        workers are included under their path names.
+    """
+    pid = daemon_pid()
+    data = _read_json(STATUS_PATH) if pid else None
+    processes = dict(data['processes']) if data else {}
+    if os.path.isdir(WORKER_DIR):
+        for entry in sorted(os.listdir(WORKER_DIR)):
+            worker = _read_json(os.path.join(WORKER_DIR, entry)) if entry.endswith('.json') else None
+            if worker and _alive(worker['pid']):
+                processes.update(worker['processes'])
+    now = time.time()
+    for info in processes.values():
+        info['uptime'] = now - info['started'] if info.get('started') and info['state'] == 'running' else None
+    return {'running': bool(pid), 'pid': pid, 'processes': processes}
+
+def process_running(name: str = 'mediamtx') -> bool:
+    """
+    Return True if the named supervised process is up.
+
+    For 'mediamtx' this covers every shard instance (mediamtx-0, mediamtx-1, ...):
+    all of them must be running.
+    """
+    processes = status()['processes']
+    matching = [p for n, p in processes.items() if n == name or (name == 'mediamtx' and n.startswith('mediamtx-'))]
+    return bool(matching) and all(p['state'] == 'running' for p in matching)
+
+def describe_status(info: dict) -> list:
+    """
+    Render status() as one line per process for the TUI and web UI.
+
+    Args:
+        info: Result of status().
+
+    Returns:
+        A list of strings like 'mediamtx: running (PID 123), up 5m, 2 restart(s)'.
+    """
+    if not info['running']:
+        return ["Supervisor not running."]
+    lines = []
+    for name, proc in sorted(info['processes'].items(), key=lambda item: (not item[0].startswith('mediamtx'), item[0])):
+        line = f"{name}: {proc['state']}"
+        if proc.get('pid'):
+            line += f" (PID {proc['pid']})"
+        if proc.get('uptime') is not None:
+            line += f", up {int(proc['uptime'] // 60)}m{int(proc['uptime'] % 60):02d}s"
+        line += f", {proc['restarts']} restart(s)"
+        if proc.get('last_exit') is not None:
+            line += f", last exit {proc['last_exit']}"
+        lines.append(line)
+    return lines
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args[0] if args else 'status'
+    if command == 'run':
+        sys.exit(run_daemon())
+    elif command == 'worker' and len(args) >= 4 and args[2] == '--':
+        sys.exit(run_worker(args[1], args[3:]))
+    elif command == 'start':
+        pid = ensure_running()
+        print(f"Supervisor running (PID {pid})." if pid else f"Supervisor failed to start; see {LOG_PATH}.")
+        sys.exit(0 if pid else 1)
+    elif command == 'stop':
+        sys.exit(0 if stop() else 1)
+    elif command == 'status':
+        info = status()
+        print(json.dumps(info, indent=2) if '--json' in args else '\n'.join(describe_status(info)))
+    else:
+        print(__doc__.strip().split('Usage:')[1])
+        sys.exit(2)
@@ -0,0 +1,255 @@
+# Copyright (C) 2025 DeMoD LLC
+# This file is part of DeMoD Camera Setup.
+#
+# DeMoD Camera Setup is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DeMoD Camera Setup is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DeMoD Camera Setup.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Tracing for work that leaves the process. Each external command and subprocess
+records a span with its latency, exit status and output size. Spans are kept in a
+bounded ring buffer, which config.py serves at /debug/trace. The config server
+also records a span for each request. With --debug it can profile single
+requests with cProfile or, if installed, pyinstrument.
+"""
+
+import collections
+import itertools
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_SPANS = 1000  # Spans kept in the ring buffer; the oldest are dropped first
+MAX_OUTPUT = 1 << 20  # Bytes of command output kept; the rest is read and counted, not stored
+READ_CHUNK = 65536
+PROFILERS = ('cprofile', 'pyinstrument')
+PROFILE_LINES = 40  # Functions listed in a cProfile report
+
+class Tracer:
+    """A thread-safe ring buffer of recent spans."""
+
+    def __init__(self, size: int = TRACE_SPANS):
+        self._spans = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def new_id(self) -> int:
+        """Reserve a span ID, e.g. to report it before the span is recorded."""
+        return next(self._ids)
+
+    def record(self, kind: str, name: str, start: float, duration: float, span_id: int = None, **fields) -> dict:
+        """
+        Add a finished span to the buffer.
+
+        Args:
+            kind: 'command', 'process' or 'request'.
+            name: What ran (the command line, 'snapshot cam0', 'GET /metrics').
+            start: Wall-clock start time (epoch seconds).
+            duration: Seconds it took.
+            span_id: ID from new_id(), or None to assign one.
+            fields: Details such as exit, bytes, truncated, timed_out, status or error.
+
+        Returns:
+            The recorded span.
+        """
+        span = {'id': span_id or self.new_id(), 'kind': kind, 'name': name, 'start': round(start, 3),
+                'duration_ms': round(duration * 1000, 3), **fields}
+        with self._lock:
+            self._spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, kind: str, name: str, **fields):
+        """
+        Time a block and record it as a span. The block receives the span's fields
+        dict to fill in, and its 'id' is reserved up front. Exceptions are recorded
+        as 'error' and re-raised.
+        """
+        fields = dict(fields, id=self.new_id())
+        start, began = time.time(), time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields.setdefault('error', f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span_id = fields.pop('id')
+            self.record(kind, name, start, time.perf_counter() - began, span_id, **fields)
+
+    def spans(self, kind: str = None, limit: int = None) -> list:
+        """Return recorded spans in the order they finished, optionally of one kind and only the last limit."""
+        with self._lock:
+            spans = [s for s in self._spans if kind is None or s['kind'] == kind]
+        return spans[-limit:] if limit else spans
+
+    def get(self, span_id: int) -> dict:
+        """Return the span with span_id, or None if it has left the buffer."""
+        with self._lock:
+            return next((s for s in self._spans if s['id'] == span_id), None)
+
+    def summary(self) -> dict:
+        """
+        Summarize the buffer per kind and name.
+
+        Returns:
+            A dictionary of '<kind> <name>' -> {count, failures, p50_ms, max_ms}. A span
+            failed when it raised, timed out, exited non-zero or answered with 5xx.
+        """
+        groups = collections.defaultdict(list)
+        for span in self.spans():
+            groups[f"{span['kind']} {span['name']}"].append(span)
+        result = {}
+        for key, spans in sorted(groups.items()):
+            durations = sorted(s['duration_ms'] for s in spans)
+            result[key] = {'count': len(spans), 'failures': sum(map(failed, spans)),
+                           'p50_ms': durations[(len(durations) - 1) // 2], 'max_ms': durations[-1]}
+        return result
+
+def failed(span: dict) -> bool:
+    """Return True if a span records an error, a timeout, a non-zero exit or a 5xx status."""
+    return bool(span.get('error') or span.get('timed_out') or span.get('exit') not in (None, 0)
+                or (span.get('status') or 0) >= 500)
+
+TRACER = Tracer()
+
+def run_streaming(cmd, timeout: float = None, max_output: int = MAX_OUTPUT, name: str = None) -> dict:
+    """
+    Run a command, streaming its output instead of buffering all of it, and trace it.
+
+    stdout and stderr are merged. At most max_output bytes are kept; the rest is read
+    (so the command never blocks on a full pipe) and counted. With a timeout the
+    command runs in its own process group, and on timeout the whole group is killed,
+    so children of a shell command (pipelines, 'sudo -n ufw ...') don't outlive it.
+    Without one it keeps the terminal, e.g. for sudo to prompt for a password.
+
+    Args:
+        cmd: A shell command string, or an argv list run without a shell.
+        timeout: Seconds before the command is killed (None waits forever).
+        max_output: Bytes of output to keep.
+        name: Span name; defaults to the command line. Pass one when the command
+              line contains credentials.
+
+    Returns:
+        A dictionary with 'exit' (return code), 'output' (decoded, possibly truncated),
+        'bytes' (total output size), 'truncated', 'timed_out' and 'cpu' (seconds of CPU
+        the command's own process used).
+
+    Raises:
+        OSError: If the command cannot be started.
+    """
+    shell = isinstance(cmd, str)
+    with TRACER.span('command', name or (cmd if shell else ' '.join(cmd))) as span:
+        proc = subprocess.Popen(cmd, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                start_new_session=timeout is not None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        chunks, kept, total, timed_out = [], 0, 0, False
+        with proc.stdout, selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ)
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    timed_out = True
+                    break
+                if not selector.select(remaining):
+                    continue
+                chunk = os.read(proc.stdout.fileno(), READ_CHUNK)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if kept < max_output:
+                    chunks.append(chunk[:max_output - kept])
+                    kept += len(chunks[-1])
+        # Output closed; the command may still be exiting (or a child kept the pipe open)
+        usage = None if timed_out else _reap(proc, deadline)
+        if usage is None:
+            timed_out = True
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:  # Everything in it has exited already
+                pass
+            usage = _reap(proc, None)
+        cpu = usage.ru_utime + usage.ru_stime
+        span.update(exit=proc.returncode, bytes=total, truncated=total > kept, timed_out=timed_out, cpu_ms=round(cpu * 1000, 3))
+        return {'exit': proc.returncode, 'output': b''.join(chunks).decode(errors='replace'), 'bytes': total,
+                'truncated': total > kept, 'timed_out': timed_out, 'cpu': cpu}
+
+def _reap(proc, deadline: float):
+    """
+    Wait for proc with wait4(), which reports the CPU time of that process alone
+    (RUSAGE_CHILDREN would include any other child reaped meanwhile).
+
+    Returns:
+        Its resource usage, or None if deadline (time.monotonic()) passed first.
+    """
+    while True:
+        pid, status, usage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.01)
+
+class Profile:
+    """Profiles the calling thread between start() and stop(); one profile runs at a time."""
+
+    _active = threading.Lock()  # cProfile and pyinstrument can't both hook the interpreter at once
+
+    def __init__(self, engine: str = 'cprofile'):
+        """
+        Raises:
+            ValueError: If engine is unknown or pyinstrument is requested but not installed.
+        """
+        if engine not in PROFILERS:
+            raise ValueError(f"Profiler '{engine}' must be one of: {', '.join(PROFILERS)}.")
+        if engine == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ValueError("pyinstrument is not installed; use profile=cprofile.") from None
+            self._profiler = Profiler()
+        else:
+            import cProfile
+            self._profiler = cProfile.Profile()
+        self.engine = engine
+
+    def start(self) -> 'Profile':
+        """
+        Raises:
+            ValueError: If another profile is running.
+        """
+        if not Profile._active.acquire(blocking=False):
+            raise ValueError("Another request is being profiled; retry shortly.")
+        if self.engine == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def stop(self) -> str:
+        """Stop profiling and return the text report."""
+        try:
+            if self.engine == 'pyinstrument':
+                self._profiler.stop()
+                return self._profiler.output_text(unicode=True, color=False)
+            self._profiler.disable()
+        finally:
+            Profile._active.release()
+        import io
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        return out.getvalue()
@@ -20,25 +20,51 @@ and MediaMTX configuration file generation.
 """
 
 import os
-import subprocess
+import tempfile
 import grp
+import hashlib
+import io
+import pwd
 import re
-import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
-def run_command(cmd: str) -> str:
+import jsonc
+from abr import validate_abr
+from devices import check_mode, inventory, parse_resolution, probe_device
+from pipelines import LATENCY_PROFILES, PROGRESS_BASE_PORT, RENDITION_NAME, build_ffmpeg_command, parse_bitrate, select_pipeline
+from recording import INDEX_PATH, open_index, parse_quota, record_settings, set_quotas, validate_record
+from scheduler import (DEFAULT_RESOLUTION, allocate, command_prefix, estimate_cost, estimate_split_cost, read_allocation,
+                       write_allocation)
+from sharding import MANIFEST_PATH, RTSP_BASE_PORT, assign, instances, shard_config, shard_header, shard_ports, write_manifest
+from supervisor import worker_command
+from tracing import MAX_OUTPUT, run_streaming
+
+def run_command(cmd: str, timeout: float = None, max_output: int = MAX_OUTPUT) -> str:
     """
     Execute a shell command and return its output.
 
+    Output is streamed and at most max_output bytes are kept. Each call is recorded
+    as a span in tracing.TRACER.
+
     Args:
         cmd: The command to execute.
+        timeout: Seconds to wait before killing the command (None waits forever).
+        max_output: Bytes of output to keep.
 
     Returns:
         The command output as a string, or an error message if execution fails.
     """
     try:
-        return subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT).decode().strip()
-    except Exception as e:
+        result = run_streaming(cmd, timeout, max_output)
+    except OSError as e:
         return f"Error executing '{cmd}': {str(e)}"
+    if result['timed_out']:
+        return f"Error executing '{cmd}': timed out after {timeout} seconds"
+    if result['exit']:
+        return f"Error executing '{cmd}': exit status {result['exit']}"
+    return result['output'].strip()
 
 def parse_yml_auth(yml_path: str = 'mediamtx.yml') -> bool:
     """
@@ -58,34 +84,174 @@ def parse_yml_auth(yml_path: str = 'mediamtx.yml') -> bool:
 
 def get_devices() -> list:
     """
-    Detect available video devices using v4l2-ctl.
+    Detect available video capture devices, natively via V4L2 ioctls with a v4l2-ctl fallback.
 
     Returns:
         A list of video device paths (e.g., ['/dev/video0']), or ['/dev/video0'] if none found.
     """
+    devices = [node for node, caps in inventory().items() if caps.get('capture')]
+    if devices:
+        return devices
     try:
-        output = run_command("v4l2-ctl --list-devices")
+        output = run_command("v4l2-ctl --list-devices", timeout=5)
         devices = [line.strip() for line in output.splitlines() if line.strip().startswith('/dev/video')]
         return devices if devices else ['/dev/video0']
     except:
         return ['/dev/video0']
 
-def security_checks() -> dict:
+def check_root() -> bool:
+    """Return True if the process is running as a non-root user."""
+    return os.getuid() != 0
+
+def check_video_group() -> bool:
+    """Return True if the login user is a member of the 'video' group."""
+    try:
+        video_group = grp.getgrnam('video').gr_mem
+    except KeyError:
+        return False
+    try:
+        user = os.getlogin()
+    except OSError:  # No controlling terminal, e.g. under systemd
+        user = pwd.getpwuid(os.getuid()).pw_name
+    return user in video_group
+
+def check_ufw_port() -> bool:
+    """Return True if UFW reports a rule for RTSP port 8554."""
+    # -n: fail instead of prompting for a password, which would hang a headless probe
+    return '8554' in run_command("sudo -n ufw status", timeout=5)
+
+def check_auth_enabled() -> bool:
+    """Return True if the generated MediaMTX config (every shard's, when sharding) enables read auth."""
+    return all(parse_yml_auth(yml_path) for yml_path in instances().values())
+
+SECURITY_CHECKS = {}  # name -> {'func', 'ttl', 'watch', 'timeout'}, in display order
+CHECK_CACHE_STATS = {'hits': 0, 'misses': 0}
+_CHECK_CACHE = {}  # name -> (value, expires_at or None, watch stamp)
+_CHECK_TIMINGS = {}  # name -> {'ms': duration of the last run, 'status': 'ok' | 'error' | 'timeout'}
+_CHECK_INFLIGHT = {}  # name -> Future of a probe still running
+_CHECK_LOCK = threading.Lock()
+_PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='probe')
+
+def register_check(name: str, func, ttl: float = 60, watch: tuple = (), timeout: float = 5.0) -> None:
+    """
+    Register a security check so security_checks() runs it alongside the built-in ones.
+
+    Args:
+        name: Result key, also used for display (e.g. 'ufw_port').
+        func: Callable taking no arguments and returning True if the check passes.
+        ttl: Seconds a result stays cached; None keeps it for the life of the process.
+        watch: Files whose change invalidates the cached result early.
+        timeout: Seconds to wait for the probe before reporting it as unknown.
+    """
+    with _CHECK_LOCK:
+        SECURITY_CHECKS[name] = {'func': func, 'ttl': ttl, 'watch': tuple(watch), 'timeout': timeout}
+        _CHECK_CACHE.pop(name, None)
+
+register_check('root', check_root, ttl=None)
+register_check('video_group', check_video_group, ttl=300, watch=('/etc/group',))
+register_check('ufw_port', check_ufw_port, ttl=60,
+               watch=('/etc/ufw/user.rules', '/etc/ufw/user6.rules', '/etc/ufw/ufw.conf'), timeout=6.0)
+register_check('auth_enabled', check_auth_enabled, ttl=60, watch=('mediamtx.yml', MANIFEST_PATH))
+
+def _watch_stamp(paths: tuple) -> tuple:
+    """
+    Snapshot the identity of watched files so a later change can be detected.
+
+    Args:
+        paths: File paths to stat.
+
+    Returns:
+        A tuple of (mtime_ns, size, inode) per path, with None for missing files.
+    """
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+def invalidate_checks(*names: str) -> None:
+    """
+    Drop cached security check results so the next call re-runs them.
+
+    Args:
+        names: Check names to invalidate; all checks if none are given.
+    """
+    with _CHECK_LOCK:
+        for name in names or list(_CHECK_CACHE):
+            _CHECK_CACHE.pop(name, None)
+
+def check_timings() -> dict:
+    """
+    Return how long each check took the last time it actually ran.
+
+    Returns:
+        A dictionary of name -> {'ms': float, 'status': 'ok' | 'error' | 'timeout'}.
+    """
+    with _CHECK_LOCK:
+        return {name: dict(timing) for name, timing in _CHECK_TIMINGS.items()}
+
+def _run_probe(name: str, spec: dict, stamp: tuple) -> bool:
+    """Run one check on a probe thread, recording its duration and caching the result."""
+    start = time.monotonic()
+    try:
+        value = bool(spec['func']())
+        status = 'ok'
+    except Exception:
+        value, status = None, 'error'
+    finished = time.monotonic()
+    with _CHECK_LOCK:
+        _CHECK_TIMINGS[name] = {'ms': (finished - start) * 1000, 'status': status}
+        _CHECK_INFLIGHT.pop(name, None)
+        if value is not None:
+            expires = None if spec['ttl'] is None else start + spec['ttl']
+            _CHECK_CACHE[name] = (value, expires, stamp)
+    return value
+
+def security_checks(force: bool = False) -> dict:
     """
     Perform security checks for the system configuration.
 
+    Checks run concurrently, each with its own deadline. Results are cached per check
+    until their TTL expires or a watched file changes; a probe still running for
+    another caller is shared rather than started twice.
+
+    Args:
+        force: Ignore cached results and re-run every check.
+
     Returns:
-        A dictionary with check results (root, video_group, ufw_port, auth_enabled).
+        A dictionary with check results (root, video_group, ufw_port, auth_enabled, plus
+        any registered checks). A value is None when its probe timed out or failed.
     """
     checks = {}
-    checks['root'] = os.getuid() != 0
-    try:
-        video_group = grp.getgrnam('video').gr_mem
-        checks['video_group'] = os.getlogin() in video_group
-    except KeyError:
-        checks['video_group'] = False
-    checks['ufw_port'] = '8554' in run_command("sudo ufw status")
-    checks['auth_enabled'] = parse_yml_auth()
+    pending = {}
+    with _CHECK_LOCK:
+        specs = list(SECURITY_CHECKS.items())
+    for name, spec in specs:
+        stamp = _watch_stamp(spec['watch'])
+        now = time.monotonic()
+        with _CHECK_LOCK:
+            entry = _CHECK_CACHE.get(name)
+            if not force and entry and entry[2] == stamp and (entry[1] is None or now < entry[1]):
+                CHECK_CACHE_STATS['hits'] += 1
+                checks[name] = entry[0]
+                continue
+            CHECK_CACHE_STATS['misses'] += 1
+            future = _CHECK_INFLIGHT.get(name)
+            if future is None:
+                future = _PROBE_EXECUTOR.submit(_run_probe, name, spec, stamp)
+                _CHECK_INFLIGHT[name] = future
+        checks[name] = None  # Keeps registration order; filled in below
+        pending[name] = (future, now + spec['timeout'], spec['timeout'])
+    for name, (future, deadline, timeout) in pending.items():
+        try:
+            checks[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            with _CHECK_LOCK:
+                if not future.done():  # A late result records its real duration instead
+                    _CHECK_TIMINGS[name] = {'ms': timeout * 1000, 'status': 'timeout'}
     return checks
 
 def calculate_rating(checks: dict, user_answers: list) -> int:
@@ -99,7 +265,7 @@ def calculate_rating(checks: dict, user_answers: list) -> int:
     Returns:
         A score from 0 to 100.
     """
-    score = sum(25 for v in checks.values() if v)
+    score = sum(100 // (len(checks) or 1) for v in checks.values() if v)
     answer_points = sum(user_answers) * (100 // (len(user_answers) or 1))
     if score < 50:  # Recursive-like penalty for low base score
         answer_points = sum(user_answers) * (50 // (len(user_answers) or 1))
@@ -117,17 +283,44 @@ def load_jsonc(source: str, is_file: bool = True) -> dict:
         Parsed JSON dictionary.
 
     Raises:
-        json.JSONDecodeError: If JSONC is invalid.
+        ValueError: If JSONC is invalid or the file is missing.
     """
     try:
         if is_file:
             with open(source) as f:
-                text = f.read()
+                return jsonc.load(f)
+        return jsonc.loads(source)
+    except jsonc.JSONCError as e:
+        raise ValueError(f"Invalid JSONC format: {str(e)}. Ensure proper syntax (e.g., valid JSON with // or /* */ comments).")
+    except FileNotFoundError:
+        raise ValueError(f"JSONC file '{source}' not found. Provide a valid path.")
+
+def iter_jsonc_cams(source: str, is_file: bool = True, settings: dict = None):
+    """
+    Stream the 'cams' entries of a JSONC file or string one at a time.
+
+    The result can be passed straight to validate_config() or write_yml() so
+    validation (and its device probes) start before a large fleet config has been
+    fully read; 'apply --config' loads this way.
+
+    Args:
+        source: File path or JSONC string.
+        is_file: True if source is a file path, False if it's a string.
+        settings: Optional dict that receives the other top-level keys.
+
+    Yields:
+        Camera dictionaries in file order.
+
+    Raises:
+        ValueError: If JSONC is invalid or the file is missing.
+    """
+    try:
+        if is_file:
+            with open(source) as f:
+                yield from jsonc.iter_cams(f, settings)
         else:
-            text = source
-        no_comments = re.sub(r'/\*.*?\*/|//[^\n]*', '', text, flags=re.DOTALL)
-        return json.loads(no_comments)
-    except json.JSONDecodeError as e:
+            yield from jsonc.iter_cams(io.StringIO(source), settings)
+    except jsonc.JSONCError as e:
         raise ValueError(f"Invalid JSONC format: {str(e)}. Ensure proper syntax (e.g., valid JSON with // or /* */ comments).")
     except FileNotFoundError:
         raise ValueError(f"JSONC file '{source}' not found. Provide a valid path.")
@@ -147,6 +340,8 @@ def get_auth_config(auth: dict) -> str:
     """
     user = auth.get('user', '')
     pass_ = auth.get('pass', '')
+    if not isinstance(user, str) or not isinstance(pass_, str):
+        raise ValueError("Auth user and pass must be strings.")
     if pass_.startswith('env:'):
         var = pass_[4:]
         pass_ = os.environ.get(var)
@@ -156,37 +351,422 @@ def get_auth_config(auth: dict) -> str:
         return f"    readUser: {user}\n    readPass: {pass_}\n"
     return ''
 
-def write_yml(cams: list) -> None:
+CAM_FIELD_TYPES = {  # JSON types of camera fields whose values are used as-is: field -> (types, description)
+    'device': (str, 'a string'),
+    'resolution': (str, 'a string'),
+    'pipeline': (str, 'a string'),
+    'latency_profile': (str, 'a string'),
+    'auth': (dict, 'an object'),
+    'abr': (dict, 'an object'),
+    'renditions': (list, 'a list'),
+    'record': ((bool, dict), 'true, false or an object'),
+}
+
+def validate_cam(i: int, cam: dict) -> dict:
     """
-    Generate and write MediaMTX YML configuration for multiple cameras.
+    Validate one camera and resolve everything needed to render its MediaMTX path.
+
+    V4L2 devices are checked against their probed capabilities, so a framerate or
+    resolution the camera cannot deliver is rejected before MediaMTX ever runs, and
+    the cheapest encode pipeline the camera's formats allow is selected.
 
     Args:
-        cams: List of dictionaries with device, framerate, bitrate, and auth.
+        i: Camera index (the path is named cam{i}).
+        cam: Dictionary with device, framerate, bitrate, auth, and optional resolution
+             ('1280x720'), pipeline (see pipelines.PIPELINES), viewers (expected
+             concurrent viewers, used to balance shards), renditions (list of
+             {name, resolution, framerate, bitrate} encoded from one capture),
+             latency_profile (see pipelines.LATENCY_PROFILES), record (true or
+             {segment, max_bytes, max_age}, see recording.validate_record()) and
+             abr (see abr.validate_abr()).
+
+    Returns:
+        The camera dictionary with defaults filled in, plus 'name', 'choice' (the
+        selected pipeline), 'progress_port' (where the encoder reports -progress),
+        'record_path' (the path recorded: the camera's, or its first rendition's)
+        and 'auth_config' (rendered auth lines).
 
     Raises:
         ValueError: If device path is invalid or parameters are malformed.
     """
-    paths = ''
-    for i, cam in enumerate(cams):
-        device = cam.get('device', f'/dev/video{i}')
-        if not os.path.exists(device):
-            raise ValueError(f"Device '{device}' does not exist. Check with 'ls /dev/video*'.")
-        framerate = cam.get('framerate', '30')
-        if not str(framerate).isdigit():
-            raise ValueError(f"Framerate '{framerate}' for cam{i} must be a number.")
-        bitrate = cam.get('bitrate', '800k')
-        if not bitrate:
-            raise ValueError(f"Bitrate for cam{i} cannot be empty.")
-        auth_config = get_auth_config(cam.get('auth', {}))
-        paths += f"  cam{i}:\n    runOnInit: ffmpeg -f v4l2 -framerate {framerate} -i {device} -c:v libx264 -pix_fmt yuv420p -preset ultrafast -b:v {bitrate} -f rtsp rtsp://localhost:$RTSP_PORT/cam{i}\n    runOnInitRestart: yes\n{auth_config}"
-    yml_content = f"""
+    for field, (types, description) in CAM_FIELD_TYPES.items():
+        if cam.get(field) is not None and not isinstance(cam[field], types):
+            raise ValueError(f"Field '{field}' for cam{i} must be {description}.")
+    device = cam.get('device', f'/dev/video{i}')
+    if not os.path.exists(device):
+        raise ValueError(f"Device '{device}' does not exist. Check with 'ls /dev/video*'.")
+    framerate = cam.get('framerate', '30')
+    if not str(framerate).isdigit():
+        raise ValueError(f"Framerate '{framerate}' for cam{i} must be a number.")
+    bitrate = cam.get('bitrate', '800k')
+    if not bitrate:
+        raise ValueError(f"Bitrate for cam{i} cannot be empty.")
+    parse_bitrate(bitrate)
+    validate_abr(i, dict(cam, framerate=framerate, bitrate=bitrate))
+    profile = cam.get('latency_profile')
+    if profile is not None and profile not in LATENCY_PROFILES:
+        raise ValueError(f"Latency profile '{profile}' for cam{i} must be one of: {', '.join(LATENCY_PROFILES)}.")
+    viewers = cam.get('viewers', 1)
+    if not str(viewers).isdigit() or int(viewers) < 1:
+        raise ValueError(f"Viewers '{viewers}' for cam{i} must be a positive number.")
+    resolution = cam.get('resolution')
+    if resolution:
+        resolution = '{}x{}'.format(*parse_resolution(resolution))
+    caps = probe_device(device) if device.startswith('/dev/video') else None
+    if caps:
+        check_mode(caps, int(framerate), resolution, f'cam{i}')
+    renditions = [validate_rendition(i, n, r, framerate, bitrate) for n, r in enumerate(cam.get('renditions') or [])]
+    names = [r['name'] for r in renditions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Rendition names for cam{i} must be unique.")
+    spec = dict(cam, name=f'cam{i}', device=device, framerate=framerate, bitrate=bitrate, resolution=resolution,
+                viewers=int(viewers), renditions=renditions, progress_port=PROGRESS_BASE_PORT + i,
+                record=validate_record(i, cam.get('record')),
+                record_path=f"cam{i}/{renditions[0]['name']}" if renditions else f'cam{i}')
+    spec['choice'] = select_pipeline(spec, caps, f'cam{i}')
+    spec['auth_config'] = get_auth_config(cam.get('auth', {}))
+    return spec
+
+def validate_config(cams: list, settings: dict = None, specs: list = None) -> list:
+    """
+    Validate every camera and top-level setting, collecting all errors instead of
+    stopping at the first, so one response can report them together.
+
+    Args:
+        cams: Camera dictionaries as written in JSONC: a list, or an iterable such as
+              iter_jsonc_cams(), so each camera is validated as soon as it is parsed.
+        settings: Top-level JSONC settings (shards, uplink, recording); may be the dict
+                  iter_jsonc_cams() fills in, since it is only read after the cams.
+        specs: Optional list that receives each camera's validate_cam() result, to pass
+               on to plan() and write_yml() instead of validating again.
+
+    Returns:
+        A list of {'cam': index or None for top-level settings, 'error': message};
+        empty if the config is valid.
+    """
+    settings = settings if settings is not None else {}
+    if isinstance(cams, (str, bytes, dict)) or not hasattr(cams, '__iter__'):
+        cams = None
+    cam_errors = []
+    for i, cam in enumerate(cams or []):
+        if not isinstance(cam, dict):
+            cam_errors.append({'cam': i, 'error': f"cam{i} must be an object."})
+            continue
+        try:
+            spec = validate_cam(i, cam)
+        except ValueError as e:
+            cam_errors.append({'cam': i, 'error': str(e)})
+            continue
+        except (TypeError, AttributeError) as e:  # A field of a JSON type none of the checks expected
+            cam_errors.append({'cam': i, 'error': f"cam{i} has a field of the wrong type: {e}."})
+            continue
+        if specs is not None:
+            specs.append(spec)
+    # Settings last: when cams streams from iter_jsonc_cams(), settings is only complete now
+    errors = []
+    shards = settings.get('shards', 1)
+    if not str(shards).isdigit() or int(shards) < 1:
+        errors.append({'cam': None, 'error': f"Shards '{shards}' must be a positive number."})
+    try:
+        if settings.get('uplink'):
+            parse_bitrate(settings['uplink'])
+        if settings.get('recording'):
+            if not isinstance(settings['recording'], dict):
+                raise ValueError("recording must be an object with max_bytes and max_age.")
+            parse_quota(settings['recording'], 'recording')
+    except (ValueError, TypeError) as e:
+        errors.append({'cam': None, 'error': str(e)})
+    if cams is None:
+        errors.append({'cam': None, 'error': "cams must be a list."})
+    errors += cam_errors
+    if errors and specs is not None:
+        specs.clear()
+    return errors
+
+def validate_rendition(i: int, n: int, rendition: dict, framerate, bitrate) -> dict:
+    """
+    Validate one entry of a camera's 'renditions' list.
+
+    Args:
+        i: Camera index.
+        n: Rendition index.
+        rendition: Dictionary with name and optional resolution, framerate and bitrate.
+        framerate: The camera's capture framerate (renditions can't exceed it).
+        bitrate: The camera's bitrate, used when the rendition doesn't set one.
+
+    Returns:
+        The rendition with resolution normalized and defaults filled in.
+
+    Raises:
+        ValueError: If the rendition is malformed.
+    """
+    if not isinstance(rendition, dict):
+        raise ValueError(f"Rendition {n} for cam{i} must be an object.")
+    name = str(rendition.get('name', ''))
+    if not RENDITION_NAME.match(name):
+        raise ValueError(f"Rendition {n} for cam{i} needs a name of letters, digits, '-' or '_' (e.g. 'high').")
+    rate = rendition.get('framerate', framerate)
+    if not str(rate).isdigit() or not 0 < int(rate) <= int(framerate):
+        raise ValueError(f"Framerate '{rate}' for cam{i}/{name} must be a number no higher than the camera's {framerate}.")
+    resolution = rendition.get('resolution')
+    if resolution:
+        resolution = '{}x{}'.format(*parse_resolution(resolution))
+    parse_bitrate(rendition.get('bitrate') or bitrate)
+    return {'name': name, 'resolution': resolution, 'framerate': int(rate), 'bitrate': rendition.get('bitrate') or bitrate}
+
+def encode_cost(spec: dict) -> float:
+    """
+    Estimate the CPU cost of a validated camera's encoder (see scheduler.estimate_cost()).
+
+    Args:
+        spec: Result of validate_cam().
+
+    Returns:
+        The relative cost.
+    """
+    width, height = parse_resolution(spec['resolution']) if spec.get('resolution') else DEFAULT_RESOLUTION
+    preset = LATENCY_PROFILES[spec['latency_profile']]['preset'] if spec.get('latency_profile') else 'ultrafast'
+    if spec.get('renditions'):
+        outputs = [(*(parse_resolution(r['resolution']) if r['resolution'] else (width, height)), r['framerate'])
+                   for r in spec['renditions']]
+        return estimate_split_cost(width, height, int(spec['framerate']), spec['choice']['pipeline'], outputs, preset)
+    return estimate_cost(width, height, int(spec['framerate']), spec['choice']['pipeline'], preset)
+
+def stream_bitrate(spec: dict) -> int:
+    """Return a validated camera's total output bitrate in bits/s (all renditions together)."""
+    if spec.get('renditions'):
+        return sum(parse_bitrate(r['bitrate']) for r in spec['renditions'])
+    return parse_bitrate(spec['bitrate'])
+
+def render_path(spec: dict, slot: dict = None) -> dict:
+    """
+    Render a validated camera's MediaMTX path blocks.
+
+    The encoder runs under a supervisor worker, which restarts it with backoff and
+    reports its restarts and uptime; runOnInitRestart only covers the worker itself.
+    A camera with renditions gets one path per rendition ('cam0/high', ...): the first
+    runs the shared encoder, the others just accept what it publishes. A recording
+    camera records its record_path.
+
+    Args:
+        spec: Result of validate_cam().
+        slot: CPU allocation for the encoder from scheduler.allocate(), if any.
+
+    Returns:
+        A dictionary of path name -> YML block starting with its '  {path}:' line.
+    """
+    command = worker_command(spec['name']) + command_prefix(slot) + build_ffmpeg_command(spec['name'], spec, spec['choice'], slot)
+    run = f"    runOnInit: {command}\n    runOnInitRestart: yes\n"
+    if spec.get('record'):
+        run += record_settings(spec['record'])
+    if not spec.get('renditions'):
+        return {spec['name']: f"  {spec['name']}:\n{run}{spec['auth_config']}"}
+    publisher = "    source: publisher\n"
+    paths = [f"{spec['name']}/{r['name']}" for r in spec['renditions']]
+    return {path: f"  {path}:\n{run if n == 0 else publisher}{spec['auth_config']}" for n, path in enumerate(paths)}
+
+YML_HEADER = """
 logLevel: info
 
 # Default RTSP port
 rtspAddress: :8554
 
 paths:
-{paths}
 """
-    with open('mediamtx.yml', 'w') as f:
-        f.write(yml_content)
+_PATH_LINE = re.compile(r'^  ([^\s:][^:\n]*):\n', re.MULTILINE)
+
+def render_header(specs: list, header: str = YML_HEADER) -> str:
+    """
+    Add the global settings the cameras' latency profiles need to a config header.
+
+    MediaMTX's writeQueueSize (packets queued per reader) is global, so the smallest queue
+    any camera's profile asks for wins: a short queue drops late packets instead of
+    letting slow readers fall behind.
+
+    Args:
+        specs: Validated cameras (see validate_cam()).
+        header: Global section ending in 'paths:'.
+
+    Returns:
+        The header, unchanged when no camera sets a latency profile.
+    """
+    sizes = [LATENCY_PROFILES[spec['latency_profile']]['write_queue_size'] for spec in specs if spec.get('latency_profile')]
+    if not sizes:
+        return header
+    return header.replace('\npaths:\n', f"\n# Smallest queue requested by a latency_profile\nwriteQueueSize: {min(sizes)}\n\npaths:\n")
+
+def split_yml(content: str) -> tuple:
+    """
+    Split a generated MediaMTX YML into its global section and per-path blocks.
+
+    Args:
+        content: YML text as written by write_yml().
+
+    Returns:
+        A (header, {path_name: block}) tuple; header is everything up to 'paths:'.
+    """
+    header, sep, body = content.partition('\npaths:\n')
+    if not sep:
+        return content, {}
+    starts = list(_PATH_LINE.finditer(body))
+    blocks = {}
+    for n, m in enumerate(starts):
+        end = starts[n + 1].start() if n + 1 < len(starts) else len(body)
+        blocks[m.group(1)] = body[m.start():end].rstrip('\n') + '\n'
+    return header + sep, blocks
+
+def atomic_write(path: str, content: str) -> None:
+    """
+    Replace a file's content atomically (temp file in the same directory + rename).
+
+    Readers such as MediaMTX's config watcher see either the old or the new file,
+    never a partial write. The file is created with 0600 permissions since it may
+    hold RTSP passwords.
+
+    Args:
+        path: Destination path.
+        content: New file content.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def apply_blocks(blocks: dict, yml_path: str, header: str = YML_HEADER) -> dict:
+    """
+    Write one MediaMTX config from path blocks, touching the file only if it changed.
+
+    Args:
+        blocks: Dictionary of path name -> block from render_path().
+        yml_path: Path of the config to write.
+        header: Global section, ending in 'paths:'.
+
+    Returns:
+        A summary dict as described in write_yml(), without 'allocation' and 'routes'.
+    """
+    yml_content = header + ''.join(blocks.values()) + '\n'
+    old_content = ''
+    if os.path.exists(yml_path):
+        with open(yml_path) as f:
+            old_content = f.read()
+    old_header, old_blocks = split_yml(old_content)
+    summary = {
+        'written': False,
+        'added': [name for name in blocks if name not in old_blocks],
+        'removed': [name for name in old_blocks if name not in blocks],
+        'changed': [name for name in blocks if name in old_blocks and old_blocks[name] != blocks[name]],
+        'unchanged': [name for name in blocks if old_blocks.get(name) == blocks[name]],
+    }
+    if old_header != header:  # Global settings changed: MediaMTX reloads every path
+        summary['changed'] += summary['unchanged']
+        summary['unchanged'] = []
+    summary['restarted'] = len(summary['changed'])
+    if hashlib.sha256(yml_content.encode()).digest() == hashlib.sha256(old_content.encode()).digest():
+        return summary
+    os.makedirs(os.path.dirname(os.path.abspath(yml_path)), exist_ok=True)
+    atomic_write(yml_path, yml_content)
+    summary['written'] = True
+    return summary
+
+def write_yml(cams: list, yml_path: str = 'mediamtx.yml', shards: int = 1, recording: dict = None,
+              specs: list = None) -> dict:
+    """
+    Generate MediaMTX YML configuration for multiple cameras and apply it incrementally.
+
+    Every camera is validated before anything is written, and each encoder is given a
+    CPU set, thread count and nice level by scheduler.allocate(); encoders whose cost is
+    unchanged keep the CPUs they had, so their paths don't change. The new config is diffed
+    against the current file per path; if nothing changed the file is left alone,
+    otherwise it is replaced atomically. A running MediaMTX hot-reloads the file and
+    restarts only the paths whose blocks changed, so untouched cameras keep streaming.
+
+    With shards > 1 the cameras are split across that many MediaMTX instances, balanced
+    by bitrate x viewers, each with its own config under sharding.SHARD_DIR and its own
+    ports; the shard manifest tells the supervisor which instances to run.
+
+    Recording cameras' quotas, and the global one, are stored in the segment index,
+    where MediaMTX's segment hook enforces them.
+
+    Args:
+        cams: List (or any iterable, e.g. iter_jsonc_cams()) of dictionaries with
+              device, framerate, bitrate, and auth.
+        yml_path: Path of the MediaMTX config to write when not sharding.
+        shards: Number of MediaMTX instances (JSONC top-level 'shards').
+        recording: Global recording quota {max_bytes, max_age} (JSONC top-level 'recording').
+        specs: validate_cam() results for cams, when the caller already has them (see
+               validate_config()); cams is then not validated again.
+
+    Returns:
+        A summary dict: 'written' (bool), path name lists 'added', 'removed', 'changed'
+        and 'unchanged', 'restarted' (number of running streams MediaMTX restarts),
+        'allocation' (path name -> CPU slot, see scheduler.allocate()) and 'routes'
+        (path name -> RTSP port of the instance serving it).
+
+    Raises:
+        ValueError: If device path is invalid or parameters are malformed.
+    """
+    if not str(shards).isdigit() or int(shards) < 1:
+        raise ValueError(f"Shards '{shards}' must be a positive number.")
+    shards = int(shards)
+    if specs is None:
+        specs = [validate_cam(i, cam) for i, cam in enumerate(cams)]
+    global_quota = parse_quota(recording, 'recording') if recording else None
+    allocation = allocate({spec['name']: encode_cost(spec) for spec in specs}, previous=read_allocation())
+    blocks = {}
+    for spec in specs:
+        blocks.update(render_path(spec, allocation.get(spec['name'])))
+
+    if shards == 1:
+        summary = apply_blocks(blocks, yml_path, render_header(specs))
+        routes = {name: RTSP_BASE_PORT for name in blocks}
+    else:
+        placement = assign({spec['name']: stream_bitrate(spec) * spec['viewers'] for spec in specs}, shards)
+        summary = {'written': False, 'added': [], 'removed': [], 'changed': [], 'unchanged': [], 'restarted': 0}
+        for k in range(shards):
+            # Renditions ('cam0/low') stay on their camera's shard, where its encoder publishes
+            part = apply_blocks({path: block for path, block in blocks.items() if placement[path.split('/')[0]] == k},
+                                shard_config(k), render_header([spec for spec in specs if placement[spec['name']] == k],
+                                                               shard_header(k)))
+            summary['written'] |= part['written']
+            summary['restarted'] += part['restarted']
+            for key in ('added', 'removed', 'changed', 'unchanged'):
+                summary[key] += part[key]
+        # A path that moved between shards shows up as removed from one and added to another
+        summary['removed'] = [name for name in summary['removed'] if name not in blocks]
+        routes = {path: shard_ports(placement[path.split('/')[0]])['rtsp'] for path in blocks}
+    write_manifest(shards, placement if shards > 1 else {})
+    write_allocation(allocation)
+    if any(spec['record'] for spec in specs) or os.path.exists(INDEX_PATH):
+        conn = open_index()
+        try:
+            set_quotas(conn, {spec['record_path']: spec['record'] for spec in specs if spec['record']}, global_quota)
+        finally:
+            conn.close()
+    summary['allocation'] = allocation
+    summary['routes'] = routes
+    if summary['written']:
+        invalidate_checks('auth_enabled')
+    return summary
+
+def describe_apply(summary: dict) -> str:
+    """
+    Summarize a write_yml() result in one line for the TUI and web UI.
+
+    Args:
+        summary: Dictionary returned by write_yml().
+
+    Returns:
+        A human-readable description.
+    """
+    if not summary['written']:
+        return "Configuration unchanged; no streams restarted."
+    return (f"{summary['restarted']} stream(s) restarted, {len(summary['added'])} added, "
+            f"{len(summary['removed'])} removed, {len(summary['unchanged'])} untouched.")